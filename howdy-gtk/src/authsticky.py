@@ -1,6 +1,7 @@
 # Shows a floating window when authenticating
 from __future__ import annotations
 
+import os
 import signal
 import sys
 from typing import Any
@@ -17,7 +18,7 @@ gi.require_version("Gdk", "3.0")
 
 # Import them
 from gi.repository import Gdk as gdk
-from gi.repository import GObject as gobject
+from gi.repository import GLib as glib
 from gi.repository import Gtk as gtk
 
 # Set window size constants
@@ -84,8 +85,9 @@ class StickyWindow(gtk.Window):
 		self.show_all()
 		self.resize(windowWidth, windowHeight)
 
-		# Add a timeout to catch input passed from compare.py
-		gobject.timeout_add(100, self.catch_stdin)
+		# Read input passed from compare.py whenever there is some
+		self.stdin_buffer = b""
+		glib.io_add_watch(sys.stdin.fileno(), glib.PRIORITY_DEFAULT, glib.IOCondition.IN | glib.IOCondition.HUP, self.catch_stdin)
 
 		# Start GTK main loop
 		gtk.main()
@@ -127,26 +129,42 @@ class StickyWindow(gtk.Window):
 			ctx.select_font_face("Arial", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
 			ctx.show_text(self.subtext)
 
-	def catch_stdin(self) -> None:
-		"""Catch input from stdin and redraw"""
-		# Wait for a line on stdin
-		comm = sys.stdin.readline()[:-1]
-
-		# If the line is not empty
-		if comm:
-			# Parse a message
-			if comm[0] == "M":
-				self.message = comm[2:].strip()
-			# Parse subtext
-			if comm[0] == "S":
-				# self.subtext += " "
-				self.subtext = comm[2:].strip()
-
-		# Redraw the ui
-		self.queue_draw()
-
-		# Fire this function again in 10ms, as we're waiting on IO in readline anyway
-		gobject.timeout_add(10, self.catch_stdin)
+	def catch_stdin(self, fd: int, condition: Any) -> bool:
+		"""Read all input waiting on stdin and redraw if the text changed"""
+		data = os.read(fd, 65536)
+
+		# Stop watching once compare.py closed the pipe
+		if not data:
+			return False
+
+		# Split off complete lines, keep a partial last line for the next read
+		self.stdin_buffer += data
+		*lines, self.stdin_buffer = self.stdin_buffer.split(b"\n")
+
+		message = self.message
+		subtext = self.subtext
+
+		# Only the latest message and subtext matter when several arrived at once
+		for line in lines:
+			comm = line.decode("utf-8", "replace")
+
+			# If the line is not empty
+			if comm:
+				# Parse a message
+				if comm[0] == "M":
+					message = comm[2:].strip()
+				# Parse subtext
+				if comm[0] == "S":
+					subtext = comm[2:].strip()
+
+		# Redraw the ui if anything changed
+		if message != self.message or subtext != self.subtext:
+			self.message = message
+			self.subtext = subtext
+			self.queue_draw()
+
+		# Keep watching stdin
+		return True
 
 	def exit(self, widget: Any, context: Any) -> bool:
 		"""Cleanly exit"""
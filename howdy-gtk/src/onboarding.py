@@ -1,13 +1,13 @@
 from __future__ import annotations
 
 import os
-import re
 import subprocess
 import sys
-import time
+import threading
 from typing import Any
 
 from gi.repository import Gdk as gdk
+from gi.repository import GLib as glib
 from gi.repository import GObject as gobject
 from gi.repository import Gtk as gtk
 from gi.repository import Pango as pango
@@ -113,79 +113,57 @@ class OnboardingWindow(gtk.Window):
 		self.enable_next()
 
 	def execute_slide2(self) -> None:
-		def is_gray(frame):
-			for row in frame:
-				for pixel in row:
-					if not pixel[0] == pixel[1] == pixel[2]:
-						return False
-			return True
+		# Use the probing code shared with the howdy cli, appended so our own modules take precedence
+		if paths_factory.howdy_src_dir_path() not in sys.path:
+			sys.path.append(paths_factory.howdy_src_dir_path())
 
 		try:
-			import cv2
+			from recorders.device_probe import probe_devices
+			from recorders.ir_analysis import IR_THRESHOLD
+			self.ir_threshold = IR_THRESHOLD
 		except ImportError:
 			self.show_error(_("Error while importing OpenCV2"), _("Try reinstalling cv2"))
 
-		device_rows = []
-		use_absolute = False
 		try:
-			device_ids = os.listdir("/dev/v4l/by-path")
+			device_paths = ["/dev/v4l/by-path/" + dev for dev in os.listdir("/dev/v4l/by-path")]
 		except OSError:
 			import glob as _glob
-			video_devs = sorted(_glob.glob("/dev/video*"))
-			if not video_devs:
+			device_paths = sorted(_glob.glob("/dev/video*"))
+			if not device_paths:
 				self.show_error(
 					_("No webcams found on system"),
 					_("No V4L2 devices in /dev/v4l/by-path or /dev/video*.\n"
 					  "Please configure your camera manually if a compatible camera is connected.")
 				)
-			device_ids = video_devs
-			use_absolute = True
 
-		# Loop though all devices
-		for dev in device_ids:
-			time.sleep(.5)
+		self.loadinglabel = self.builder.get_object("loadinglabel")
+
+		def progress(result: dict, done: int, total: int) -> None:
+			"""Show how many cameras have been tested, called from the probing thread"""
+			glib.idle_add(self.loadinglabel.set_text, _("Testing your webcams, please wait... ({done}/{total})").format(done=done, total=total))
+
+		def probe() -> None:
+			"""Test all cameras at once without blocking the ui"""
+			results = probe_devices(device_paths, progress=progress)
+			glib.idle_add(self.show_devices, results)
 
-			if use_absolute:
-				device_path = dev
-				device_name = os.path.basename(dev)
+		threading.Thread(target=probe, daemon=True).start()
+
+	def show_devices(self, results: list[dict]) -> None:
+		"""List the tested cameras, best candidates first"""
+		device_rows = []
+
+		for result in results:
+			if not result["success"]:
+				device_rows.append([result["name"], result["path"], -1, _("No, camera can't be opened")])
+			elif not result["is_gray"]:
+				device_rows.append([result["name"], result["path"], result["ir_score"], _("No, not an infrared camera")])
 			else:
-				# The full path to the device is the default name
-				device_path = "/dev/v4l/by-path/" + dev
-				device_name = dev
-
-			# Get the udevadm details to try to get a better name
-			try:
-				udevadm = subprocess.check_output(["udevadm", "info", "-r", "--query=all", "-n", device_path]).decode("utf-8")
-
-				# Loop though udevadm to search for a better name
-				for line in udevadm.split("\n"):
-					# Match it and encase it in quotes
-					re_name = re.search(r'product.*=(.*)$', line, re.IGNORECASE)
-					if re_name:
-						device_name = re_name.group(1)
-			except (subprocess.CalledProcessError, FileNotFoundError):
-				pass
-
-			capture = cv2.VideoCapture(device_path, cv2.CAP_V4L2)
-			is_open, frame = capture.read()
-			if not is_open:
-				device_rows.append([device_name, device_path, -9, _("No, camera can't be opened")])
-				continue
-
-			try:
-				if not is_gray(frame):
-					raise Exception()
-			except Exception:
-				device_rows.append([device_name, device_path, -5, _("No, not an infrared camera")])
-				capture.release()
-				continue
-
-			device_rows.append([device_name, device_path, 5, _("Yes, compatible infrared camera")])
-			capture.release()
+				device_rows.append([result["name"], result["path"], result["ir_score"], _("Yes, compatible infrared camera")])
 
+		# The cameras that look most like infrared cameras go first
 		device_rows = sorted(device_rows, key=lambda k: -k[2])
 
-		self.loadinglabel = self.builder.get_object("loadinglabel")
 		self.devicelistbox = self.builder.get_object("devicelistbox")
 
 		self.treeview = gtk.TreeView()
@@ -205,7 +183,7 @@ class OnboardingWindow(gtk.Window):
 		self.listmodel = gtk.ListStore(str, str, str, bool)
 
 		for device in device_rows:
-			is_gray = device[2] == 5
+			is_gray = device[2] >= self.ir_threshold
 			self.listmodel.append([device[0], device[3], device[1], is_gray])
 
 		self.treeview.set_model(self.listmodel)
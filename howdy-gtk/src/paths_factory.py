@@ -2,6 +2,12 @@ from pathlib import PurePath
 
 import paths
 
+models = [
+    "shape_predictor_5_face_landmarks.dat",
+    "mmod_human_face_detector.dat",
+    "dlib_face_recognition_resnet_model_v1.dat",
+]
+
 
 def config_file_path() -> str:
     """Return the path to the config file"""
@@ -13,6 +19,11 @@ def user_models_dir_path() -> PurePath:
     return paths.user_models_dir
 
 
+def user_model_path(user: str) -> str:
+    """Return the path to the model file of a user"""
+    return str(paths.user_models_dir / f"{user}.dat")
+
+
 def logo_path() -> str:
     """Return the path to the logo file"""
     return str(paths.data_dir / "logo.png")
@@ -31,3 +42,23 @@ def main_window_wireframe_path() -> str:
 def dlib_data_dir_path() -> PurePath:
     """Return the path to the dlib data directory"""
     return paths.dlib_data_dir
+
+
+def shape_predictor_5_face_landmarks_path() -> str:
+    """Return the path to the landmark predictor model"""
+    return str(paths.dlib_data_dir / models[0])
+
+
+def mmod_human_face_detector_path() -> str:
+    """Return the path to the CNN face detector model"""
+    return str(paths.dlib_data_dir / models[1])
+
+
+def dlib_face_recognition_resnet_model_v1_path() -> str:
+    """Return the path to the face recognition model"""
+    return str(paths.dlib_data_dir / models[2])
+
+
+def howdy_src_dir_path() -> str:
+    """Return the path to the Howdy python sources"""
+    return str(paths.howdy_src_dir)
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import configparser
+import json
+import threading
+import time
 from typing import Any
 
 from gi.repository import Gdk as gdk
 from gi.repository import GdkPixbuf as pixbuf
-from gi.repository import GObject as gobject
+from gi.repository import GLib as glib
 from gi.repository import Gtk as gtk
 
 import paths_factory
@@ -14,13 +17,22 @@ from i18n import _
 MAX_HEIGHT = 300
 MAX_WIDTH = 300
 
+# Color of the detection overlay, in RGB
+OVERLAY_COLOR = (0, 230, 0)
+# Seconds to wait for the capture thread to release the camera, it's at most one frame read away
+PREVIEW_STOP_TIMEOUT = 2
+
 
 def on_page_switch(self: Any, notebook: Any, page: Any, page_num: int) -> None:
 	if page_num == 1:
 
+		# The config is only parsed again if it changed since the last time
 		try:
-			self.config = configparser.ConfigParser()
-			self.config.read(paths_factory.config_file_path())
+			if self.config_cache:
+				self.config = self.config_cache.get()
+			else:
+				self.config = configparser.ConfigParser()
+				self.config.read(paths_factory.config_file_path())
 		except (configparser.Error, OSError):
 			print(_("Can't open camera"))
 
@@ -33,10 +45,21 @@ def on_page_switch(self: Any, notebook: Any, page: Any, page_num: int) -> None:
 		except ImportError:
 			print(_("Can't import OpenCV2"))
 
+		# A previous preview has to let go of the camera before it can be opened again
+		stop_preview(self)
+
 		try:
-			self.capture = cv2.VideoCapture(path, cv2.CAP_V4L2)
+			capture = cv2.VideoCapture(path, cv2.CAP_V4L2)
 		except cv2.error:
+			capture = None
+
+		if capture is None or not capture.isOpened():
 			print(_("Can't open camera"))
+			if capture is not None:
+				capture.release()
+			return
+
+		self.capture = capture
 
 		opencvbox = self.builder.get_object("opencvbox")
 		opencvbox.modify_bg(gtk.StateType.NORMAL, gdk.Color(red=0, green=0, blue=0))
@@ -57,28 +80,213 @@ def on_page_switch(self: Any, notebook: Any, page: Any, page_num: int) -> None:
 		self.builder.get_object("videoresused").set_text(str(int(width * config_scaling)) + "x" + str(int(height * config_scaling)))
 		self.builder.get_object("videorecorder").set_text(self.config.get("video", "recording_plugin", fallback=_("Unknown")))
 
-		gobject.timeout_add(10, self.capture_frame)
+		# Read frames in a thread that waits on the camera, the main loop only has to show them
+		self.preview_stop = threading.Event()
+		self.preview_pending = False
+		self.preview_thread = threading.Thread(target=self.capture_frame, args=(self.capture, self.preview_stop), daemon=True)
+		self.preview_thread.start()
+
+	else:
+		stop_preview(self)
+
+
+def on_window_state(self: Any, widget: Any, event: Any) -> bool:
+	"""Pause the preview while the window is minimized or hidden"""
+	if event.new_window_state & (gdk.WindowState.ICONIFIED | gdk.WindowState.WITHDRAWN):
+		self.preview_visible.clear()
+	else:
+		self.preview_visible.set()
+
+	# Let GTK handle the event as well
+	return False
+
+
+def stop_preview(self: Any) -> None:
+	"""Stop the capture thread and wait for it to release the camera"""
+	if self.preview_thread is not None:
+		self.preview_stop.set()
+		self.preview_thread.join(PREVIEW_STOP_TIMEOUT)
+		self.preview_thread = None
+
+	self.capture = None
+
+
+def capture_frame(self: Any, capture: Any, stop: threading.Event) -> None:
+	"""Read frames as the camera delivers them and hand them to the main loop, runs in its own thread"""
+	cv2 = self.cv2
+	fps = 0.0
+	last_frame = time.time()
+
+	while not stop.is_set():
+		# Don't read from the camera while the window can't be seen
+		if not self.preview_visible.wait(0.5):
+			continue
+
+		# Blocks until the camera has a new frame
+		ret, frame = capture.read()
+
+		if not ret:
+			stop.wait(0.1)
+			continue
+
+		# Smooth the frame rate out over the last few frames
+		now = time.time()
+		fps = fps * 0.9 + 0.1 / max(now - last_frame, 0.001)
+		last_frame = now
+
+		# Give the overlay worker a new frame once it's done with the last one
+		if self.overlay_enabled and self.overlay_frame is None:
+			self.overlay_frame = frame
+			self.overlay_wake.set()
+
+		# Drop the frame if the previous one hasn't been shown yet
+		if self.preview_pending:
+			continue
+
+		frame = cv2.resize(frame, None, fx=self.scaling_factor, fy=self.scaling_factor, interpolation=cv2.INTER_AREA)
+
+		# GdkPixbuf wants RGB, while OpenCV gives us BGR or grayscale
+		if len(frame.shape) == 2:
+			frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
+		else:
+			frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+		if self.overlay_enabled:
+			draw_overlay(self, frame, fps)
+
+		self.preview_pending = True
+		glib.idle_add(self.show_frame, frame)
+
+	capture.release()
 
-	elif self.capture is not None:
-		self.capture.release()
-		self.capture = None
 
+def show_frame(self: Any, frame: Any) -> bool:
+	"""Show a frame from the capture thread, runs on the main loop"""
+	height, width = frame.shape[:2]
 
-def capture_frame(self: Any) -> None:
-	if self.capture is None:
+	# Wrap the pixels directly, without encoding them to an image format first
+	image = pixbuf.Pixbuf.new_from_bytes(glib.Bytes.new(frame.tobytes()), pixbuf.Colorspace.RGB, False, 8, width, height, width * 3)
+	self.opencvimage.set_from_pixbuf(image)
+
+	self.preview_pending = False
+
+	# Don't run again until the next frame is scheduled
+	return False
+
+
+def on_overlay_toggle(self: Any, button: Any) -> None:
+	"""Show or hide live detection results on the preview"""
+	self.overlay_enabled = button.get_active()
+	self.overlay_result = None
+
+	# Start the worker the first time the overlay is turned on, it keeps the backend loaded after that
+	if self.overlay_enabled and self.overlay_worker is None:
+		self.overlay_wake = threading.Event()
+		self.overlay_worker = threading.Thread(target=self.overlay_loop, daemon=True)
+		self.overlay_worker.start()
+
+
+def overlay_loop(self: Any) -> None:
+	"""Run detection on frames sampled from the preview, runs in its own thread"""
+	cv2 = self.cv2
+
+	# Import the recognition modules from the Howdy sources
+	try:
+		from file_watcher import CachedFile
+		from recog import EncodingMatcher, create_backend
+		backend = create_backend(use_cnn=self.config.getboolean("core", "use_cnn", fallback=False))
+	except (ImportError, FileNotFoundError):
+		self.overlay_error = _("NO RECOGNITION MODULE")
 		return
 
-	ret, frame = self.capture.read()
+	def load_matcher(path: str) -> EncodingMatcher:
+		"""Build a matcher over the models in a model file"""
+		with open(path) as f:
+			return EncodingMatcher(json.load(f))
+
+	clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+	# Matchers over the models of every user shown so far, rebuilt only when their models change
+	matchers = {}
+
+	while True:
+		self.overlay_wake.wait()
+		self.overlay_wake.clear()
+
+		frame = self.overlay_frame
+		if frame is None:
+			continue
+
+		# Checking for changes is cheap, so the config and models are always current
+		max_height = self.config_cache.get().getfloat("video", "max_height", fallback=320.0)
+
+		user = self.active_user
+		if user not in matchers:
+			matchers[user] = CachedFile(self.watcher, paths_factory.user_model_path(user), load_matcher, self.on_file_reload)
+
+		try:
+			matcher = matchers[user].get()
+		except (OSError, ValueError):
+			matcher = None
+
+		# Prepare the frame the way compare.py does
+		scaling = (max_height / frame.shape[0]) or 1
+		gsframe = frame if len(frame.shape) == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+		if scaling != 1:
+			frame = cv2.resize(frame, None, fx=scaling, fy=scaling, interpolation=cv2.INTER_AREA)
+			gsframe = cv2.resize(gsframe, None, fx=scaling, fy=scaling, interpolation=cv2.INTER_AREA)
+		gsframe = clahe.apply(gsframe)
+
+		hist = cv2.calcHist([gsframe], [0], None, [8], [0, 256])
+		hist_total = max(float(hist.sum()), 1)
+
+		detect_start = time.time()
+		faces = backend.detect_faces(gsframe, 1)
+		encode_start = time.time()
+
+		certainty = None
+		for face in faces:
+			landmarks = backend.get_landmarks(frame, face)
+			encoding = backend.compute_encoding(frame, landmarks, 1)
+
+			if matcher is not None and len(matcher):
+				_index, distance = matcher.match(encoding)
+				certainty = distance * 10 if certainty is None else min(certainty, distance * 10)
+
+		self.overlay_result = {
+			# Face rectangles in the coordinates of the full frame
+			"faces": [(face.left() / scaling, face.top() / scaling, face.right() / scaling, face.bottom() / scaling) for face in faces],
+			"darkness": float(hist[0][0] / hist_total * 100),
+			"detect": encode_start - detect_start,
+			"encode": time.time() - encode_start,
+			"certainty": certainty,
+		}
+
+		# Ready for the next frame
+		self.overlay_frame = None
+
 
-	frame = self.cv2.resize(frame, None, fx=self.scaling_factor, fy=self.scaling_factor, interpolation=self.cv2.INTER_AREA)
+def draw_overlay(self: Any, frame: Any, fps: float) -> None:
+	"""Draw the latest detection results on a preview frame"""
+	cv2 = self.cv2
+	result = self.overlay_result
+	lines = [_("FPS: %d") % (fps, )]
 
-	retval, buffer = self.cv2.imencode(".png", frame)
+	if self.overlay_error:
+		lines.append(self.overlay_error)
+	elif result is None:
+		lines.append(_("LOADING..."))
+	else:
+		for left, top, right, bottom in result["faces"]:
+			top_left = (int(left * self.scaling_factor), int(top * self.scaling_factor))
+			bottom_right = (int(right * self.scaling_factor), int(bottom * self.scaling_factor))
+			cv2.rectangle(frame, top_left, bottom_right, OVERLAY_COLOR, 1)
 
-	loader = pixbuf.PixbufLoader()
-	loader.write(buffer)
-	loader.close()
-	buffer = loader.get_pixbuf()
+		lines.append(_("DARKNESS: %d%%") % (result["darkness"], ))
+		lines.append(_("DETECT: %dms") % (round(result["detect"] * 1000), ))
+		lines.append(_("ENCODE: %dms") % (round(result["encode"] * 1000), ))
 
-	self.opencvimage.set_from_pixbuf(buffer)
+		if result["certainty"] is not None:
+			lines.append(_("CERTAINTY: %.1f") % (result["certainty"], ))
 
-	gobject.timeout_add(20, self.capture_frame)
+	for line_number, text in enumerate(lines):
+		cv2.putText(frame, text, (6, 14 + 12 * line_number), cv2.FONT_HERSHEY_SIMPLEX, .35, OVERLAY_COLOR, 0, cv2.LINE_AA)
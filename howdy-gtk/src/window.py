@@ -5,6 +5,7 @@ import os
 import signal
 import subprocess
 import sys
+import threading
 from typing import Any
 
 import elevate
@@ -18,8 +19,19 @@ gi.require_version("Gtk", "3.0")
 gi.require_version("Gdk", "3.0")
 
 # Import them
+from gi.repository import GLib as glib
 from gi.repository import Gtk as gtk
 
+# Modules shared with Howdy are imported from its sources, appended so our own modules take precedence
+if paths_factory.howdy_src_dir_path() not in sys.path:
+	sys.path.append(paths_factory.howdy_src_dir_path())
+
+# Without the Howdy sources files are read again every time they're used, only the overlay is unavailable
+try:
+	from file_watcher import CachedFile, FileWatcher, load_config
+except ImportError:
+	CachedFile = FileWatcher = load_config = None
+
 
 class MainWindow(gtk.Window):
 	def __init__(self) -> None:
@@ -38,9 +50,34 @@ class MainWindow(gtk.Window):
 
 		self.window.connect("destroy", self.exit)
 		self.window.connect("delete_event", self.exit)
+		self.window.connect("window-state-event", self.on_window_state)
 
 		# Init capture for video tab
 		self.capture = None
+		self.preview_thread = None
+		self.preview_visible = threading.Event()
+		self.preview_visible.set()
+
+		# Detection overlay for the video tab, the worker is started when it's first turned on
+		self.overlay_enabled = False
+		self.overlay_worker = None
+		self.overlay_frame = None
+		self.overlay_result = None
+		self.overlay_error = None
+
+		# Config and models are only parsed again when they change on disk
+		self.watcher = None
+		self.config_cache = None
+		self.model_list_path = None
+
+		if FileWatcher is not None:
+			self.watcher = FileWatcher()
+			self.watcher.listeners.append(lambda changed: glib.idle_add(self.on_files_changed, changed))
+			self.config_cache = CachedFile(self.watcher, paths_factory.config_file_path(), load_config, self.on_file_reload)
+
+			# Without inotify, changes are only noticed when the files are next used
+			if self.watcher.fileno() is not None:
+				glib.io_add_watch(self.watcher.fileno(), glib.PRIORITY_DEFAULT, glib.IO_IN, self.on_watcher_ready)
 
 		# Create a treeview that will list the model data
 		self.treeview = gtk.TreeView()
@@ -60,6 +97,10 @@ class MainWindow(gtk.Window):
 		self.userlist.items = 0
 
 		for file in filelist:
+			# Only list model files, statistics are kept in the same folder
+			if not file.endswith(".dat"):
+				continue
+
 			self.userlist.append_text(file[:-4])
 			self.userlist.items += 1
 
@@ -80,6 +121,11 @@ class MainWindow(gtk.Window):
 		user = 'none'
 		if self.active_user: user = self.active_user
 
+		# Reload the list when the models of this user change
+		self.model_list_path = paths_factory.user_model_path(user)
+		if self.watcher:
+			self.watcher.watch(self.model_list_path)
+
 		# Execute the list command to get the models
 		result = subprocess.run(["howdy", "list", "--plain", "-U", user], capture_output=True, text=True)
 		status = result.returncode
@@ -97,10 +143,27 @@ class MainWindow(gtk.Window):
 			for i in range(len(lines)):
 				items = lines[i].split(",")
 				if len(items) < 3: continue
-				self.listmodel.append(items)
+				# Only the id, date and label are shown, usage statistics follow them
+				self.listmodel.append(items[:3])
 
 		self.treeview.set_model(self.listmodel)
 
+	def on_watcher_ready(self, fd: int, condition: Any) -> bool:
+		"""Handle file changes as soon as inotify reports them"""
+		self.watcher.poll()
+		return True
+
+	def on_files_changed(self, changed: set[str]) -> bool:
+		"""Refresh what's shown when a watched file changed, runs in the main loop"""
+		if self.model_list_path in changed:
+			self.load_model_list()
+
+		return False
+
+	def on_file_reload(self, path: str, seconds: float) -> None:
+		"""Report how long reading a changed file took"""
+		print(_("Reloaded {path} in {time}ms").format(path=path, time=round(seconds * 1000, 1)))
+
 	def on_about_link(self, label: Any, uri: str) -> bool:
 		"""Open links on about page as a non-root user"""
 		try:
@@ -113,8 +176,7 @@ class MainWindow(gtk.Window):
 
 	def exit(self, widget: Any = None, context: Any = None) -> None:
 		"""Cleanly exit"""
-		if self.capture is not None:
-			self.capture.release()
+		self.stop_preview()
 
 		gtk.main_quit()
 		sys.exit(0)
@@ -143,7 +205,12 @@ MainWindow.on_model_delete = tab_models.on_model_delete
 import tab_video
 
 MainWindow.on_page_switch = tab_video.on_page_switch
+MainWindow.on_window_state = tab_video.on_window_state
+MainWindow.stop_preview = tab_video.stop_preview
 MainWindow.capture_frame = tab_video.capture_frame
+MainWindow.show_frame = tab_video.show_frame
+MainWindow.on_overlay_toggle = tab_video.on_overlay_toggle
+MainWindow.overlay_loop = tab_video.overlay_loop
 
 # Open the GTK window
 window = MainWindow()
@@ -0,0 +1,272 @@
+# Check the parts of Howdy that work without a camera or dlib, like matching, indexing and the config
+#
+# Run from the repository root with: python3 howdy/scripts/verify.py
+# Only numpy is needed. Everything is written to a temporary directory, installed files are never touched.
+# Prints one line per check and exits with 1 if any of them failed.
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import traceback
+import types
+from pathlib import PurePath
+from typing import Any, Callable
+
+# Point the paths module Howdy normally gets from meson at a temporary tree before anything imports it
+root = tempfile.mkdtemp(prefix="howdy-verify.")
+paths = types.ModuleType("paths")
+paths.config_dir = PurePath(root, "etc")
+paths.dlib_data_dir = PurePath(root, "dlib-data")
+paths.user_models_dir = PurePath(root, "models")
+paths.log_path = PurePath(root, "log")
+paths.cache_dir = PurePath(root, "cache")
+paths.data_dir = PurePath(root, "data")
+sys.modules["paths"] = paths
+
+for directory in ("etc", "models", "log"):
+	os.makedirs(os.path.join(root, directory))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np
+
+import settings
+from model_store import ModelsChanged, ModelStore
+from recog import EncodingMatcher, FaceRectangle
+from recog.cluster import agglomerate, medoid
+from recog.enrollment import representatives
+from recog.fusion import ScoreFusion
+from recog.index import IdentificationIndex
+from snapshot import FrameSelector
+
+# Registered checks, in the order they run
+checks: list[Callable[[], None]] = []
+
+
+def check(function: Callable[[], None]) -> Callable[[], None]:
+	"""Register a check"""
+	checks.append(function)
+	return function
+
+
+def encodings(count: int, seed: int) -> list[list[float]]:
+	"""Random encodings shaped like the ones dlib makes"""
+	return np.random.default_rng(seed).normal(0, 0.1, (count, 128)).tolist()
+
+
+def model(model_id: int, data: list[list[float]]) -> dict[str, Any]:
+	"""A model as stored in a model file"""
+	return {"id": model_id, "label": "Model #" + str(model_id), "time": 0, "data": data}
+
+
+@check
+def matcher_finds_closest() -> None:
+	models = [model(0, encodings(3, 1)), model(1, encodings(100, 2))]
+	matcher = EncodingMatcher(models)
+	target = np.array(models[1]["data"][42]) + 0.001
+
+	index, distance = matcher.match(target)
+	assert index == 45, index
+	assert matcher.position(index) == (1, 42)
+	assert matcher.model_index(index) == 1
+	assert 0 < distance < 0.05, distance
+
+
+@check
+def matcher_threshold_stops_early() -> None:
+	models = [model(0, encodings(3, 1)), model(1, encodings(100, 2))]
+	matcher = EncodingMatcher(models)
+
+	# A match in the first model ends the search before the other blocks are compared
+	target = np.array(models[0]["data"][1]) + 0.001
+	assert matcher._blocks(True) == [(0, 3), (3, 67), (67, 103)]
+	assert matcher.match(target, threshold=0.4)[0] == 1
+
+	# Without a match below the threshold every block is searched and the closest is still found
+	far = np.full(128, 5.0)
+	assert matcher.match(far, threshold=0.4) == matcher.match(far)
+
+
+@check
+def matcher_without_models() -> None:
+	assert EncodingMatcher([]).match(np.zeros(128)) == (-1, float("inf"))
+
+
+@check
+def model_store_versions() -> None:
+	store = ModelStore("alice")
+
+	# Reading doesn't create the lock file
+	try:
+		store.load()
+		raise AssertionError("load without models should raise FileNotFoundError")
+	except FileNotFoundError:
+		pass
+	assert not os.path.exists(store.lock_path)
+	assert store.version() == 0
+
+	store.save([model(0, encodings(2, 3))])
+	assert store.version() == 1
+	assert not store.changed()
+
+	other = ModelStore("alice")
+	with other.update() as models:
+		models.append(model(1, encodings(2, 4)))
+	assert store.changed()
+	assert len(store.load()) == 2
+	assert store.loaded_version == 2
+
+	# An update based on an old version is refused and leaves the models alone
+	try:
+		with store.update(expected_version=1) as models:
+			models.clear()
+		raise AssertionError("update with a stale version should raise ModelsChanged")
+	except ModelsChanged:
+		pass
+	assert len(store.load()) == 2
+
+	with store.locked() as version:
+		assert version == 2
+
+	store.delete()
+	assert not store.exists()
+	assert store.version() == 3
+
+
+@check
+def index_identifies_users() -> None:
+	ModelStore("bob").save([model(0, encodings(5, 5))])
+	ModelStore("carol").save([model(3, encodings(5, 6))])
+	ModelStore("dave").save([model(0, [[0.0] * 128])])
+
+	index = IdentificationIndex()
+	assert index.update()
+	assert not index.update()
+
+	target = np.array(ModelStore("carol").load()[0]["data"][2])
+	results = index.identify(target + 0.001, threshold=0.4)
+	assert [(user, model_id) for user, model_id, _ in results] == [("carol", 3)], results
+
+	# A distance of exactly 0 isn't a match, like in compare
+	assert index.identify(np.zeros(128), threshold=0.4) == []
+
+
+@check
+def index_is_stored_privately() -> None:
+	index = IdentificationIndex()
+	index.update()
+	index.save()
+
+	mode = os.stat(os.path.join(root, "cache", "identify.npz")).st_mode
+	assert mode & 0o777 == 0o600, oct(mode)
+	assert os.stat(os.path.join(root, "cache")).st_mode & 0o077 == 0
+
+	loaded = IdentificationIndex.load()
+	assert loaded.users == index.users
+	assert np.array_equal(loaded.matrix, index.matrix)
+	assert not loaded.update()
+
+
+@check
+def fusion_needs_full_window() -> None:
+	fusion = ScoreFusion(window=3, certainty=0.38)
+	rect = FaceRectangle(10, 10, 110, 110)
+
+	track = fusion.add(rect, 0.3, 1)
+	assert not fusion.accepts(track)
+	fusion.add(FaceRectangle(12, 12, 112, 112), 0.5, 2)
+	track = fusion.add(rect, 0.3, 3)
+
+	# The slightly moved face stays on the same track, and the average is below the threshold
+	assert len(fusion.tracks) == 1
+	assert fusion.accepts(track)
+
+	# A face elsewhere gets its own track
+	other = fusion.add(FaceRectangle(300, 300, 400, 400), 0.1, 4)
+	assert other.track_id != track.track_id
+	assert not fusion.accepts(other)
+
+
+@check
+def fusion_rejects_zero_distance() -> None:
+	fusion = ScoreFusion(window=2, certainty=0.38)
+	rect = FaceRectangle(10, 10, 110, 110)
+	fusion.add(rect, 0.0, 1)
+	assert not fusion.accepts(fusion.add(rect, 0.2, 2))
+
+
+@check
+def frame_selector_keeps_best() -> None:
+	selector = FrameSelector(count=2, max_height=320)
+
+	for number, score in enumerate([5.0, 1.0, 4.0, 2.0, 3.0]):
+		selector.offer(np.full((4, 4), number, dtype=np.uint8), score)
+
+	# The two best frames, in the order they were captured
+	assert [int(frame[0, 0]) for frame in selector.frames()] == [1, 3]
+
+
+@check
+def settings_compile_and_validate() -> None:
+	path = os.path.join(root, "etc", "config.ini")
+	with open(path, "w") as f:
+		f.write("[core]\ndisabled = off\nuse_cnn = maybe\n[video]\ncertainty = 4.2\ntimeout = 11\n[unknown]\na = b\n")
+
+	config = settings.Settings.compile(path)
+	assert config.getfloat("video", "certainty") == 4.2
+	assert config.getint("video", "timeout") == 11
+	assert config.getboolean("core", "disabled") is False
+
+	# Invalid values are listed and fall back to the default
+	assert config.getboolean("core", "use_cnn") is False
+	assert any("use_cnn" in error for error in config.errors)
+	assert any("unknown" in error for error in config.errors)
+
+	# Reading with a different type than the schema parses the text like ConfigParser
+	assert config.getboolean("core", "workaround") is False
+	assert config.get("core", "disabled") == "false"
+	assert config.getint("video", "fusion_frames") == 0
+	assert config.get("video", "missing", fallback="x") == "x"
+
+	# The compiled form survives the cache
+	assert settings.load(path).to_dict() == config.to_dict()
+	assert settings.load(path).to_dict() == config.to_dict()
+	assert os.stat(os.path.join(root, "cache", "config.json")).st_mode & 0o777 == 0o600
+
+	assert settings.validate("video", "certainty", "11") is not None
+	assert settings.validate("video", "certainty", "3") is None
+	assert settings.validate("core", "workaround", "sideways") is not None
+
+
+@check
+def clusters_and_representatives() -> None:
+	rng = np.random.default_rng(7)
+	centers = rng.normal(0, 1, (3, 128))
+	points = [center + rng.normal(0, 0.01, 128) for center in centers for _ in range(4)]
+
+	clusters = agglomerate(points, max_clusters=3)
+	assert sorted(sorted(members) for members in clusters) == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+	assert medoid(points, [0, 1, 2, 3]) in (0, 1, 2, 3)
+
+	# Only the group size orders the representatives, the largest comes first
+	points += [centers[2] + rng.normal(0, 0.01, 128)]
+	chosen = representatives(points, 3)
+	assert len(chosen) == 3
+	assert np.linalg.norm(chosen[0] - centers[2]) < 0.5
+
+	assert len(representatives(points, 3, merge_distance=100)) == 1
+
+
+failures = 0
+for function in checks:
+	try:
+		function()
+		print("ok     " + function.__name__)
+	except Exception:
+		failures += 1
+		print("FAILED " + function.__name__)
+		traceback.print_exc()
+
+print(str(len(checks) - failures) + "/" + str(len(checks)) + " checks passed, files are in " + root)
+sys.exit(1 if failures else 0)
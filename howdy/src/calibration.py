@@ -0,0 +1,118 @@
+# Remember per-device camera calibration between authentication attempts
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+from typing import Any
+
+import paths_factory
+from model_store import make_private_dir, write_json
+
+# Amount of runs to remember the first lit frame for
+LIT_FRAME_HISTORY = 5
+# Weight given to the darkness of the current run when updating the running averages
+DARKNESS_WEIGHT = 0.3
+# Orientation value used before any match was recorded, OpenCV rotation codes are never negative
+UNKNOWN_ORIENTATION = -1
+
+
+class DeviceCalibration:
+	"""Calibration learned for a single capture device"""
+
+	def __init__(self, device_path: str, data: dict[str, Any] | None = None) -> None:
+		data = data or {}
+
+		self.device_path = device_path
+		# The rotation code that last produced a match, None if the frame was not rotated
+		self.orientation = data.get("orientation", UNKNOWN_ORIENTATION)
+		# The manual exposure value that was active during the last match
+		self.exposure = data.get("exposure", None)
+		# Frame index of the first lit frame in the last few runs
+		self.lit_frames = data.get("lit_frames", [])
+		# Seconds between the first frame and the first lit frame in the last run
+		self.lit_time = data.get("lit_time", None)
+		# Running averages of frame darkness, split by frames that were used and frames that were skipped
+		self.darkness = data.get("darkness", {"lit": None, "dark": None})
+
+	def skippable_frames(self) -> int:
+		"""Amount of frames that were unlit in every recent run and can be grabbed without processing"""
+		if len(self.lit_frames) < 2:
+			return 0
+
+		return max(0, min(self.lit_frames) - 1)
+
+	def rotations(self, candidates: list[Any]) -> list[Any]:
+		"""Order the candidate rotations so the last winning one is tried first"""
+		if self.orientation == UNKNOWN_ORIENTATION or self.orientation not in candidates:
+			return candidates
+
+		index = candidates.index(self.orientation)
+		return candidates[index:] + candidates[:index]
+
+	def record_lit_frame(self, frame_number: int, seconds: float) -> None:
+		"""Remember when the first lit frame arrived in this run"""
+		self.lit_frames = (self.lit_frames + [frame_number])[-LIT_FRAME_HISTORY:]
+		self.lit_time = round(seconds, 3)
+
+	def record_darkness(self, lit: float | None, dark: float | None) -> None:
+		"""Fold the average darkness of this run into the running averages"""
+		for key, value in (("lit", lit), ("dark", dark)):
+			if value is None:
+				continue
+
+			previous = self.darkness.get(key)
+			if previous is None:
+				self.darkness[key] = round(value, 2)
+			else:
+				self.darkness[key] = round(previous + (value - previous) * DARKNESS_WEIGHT, 2)
+
+	def to_dict(self) -> dict[str, Any]:
+		return {
+			"orientation": self.orientation,
+			"exposure": self.exposure,
+			"lit_frames": self.lit_frames,
+			"lit_time": self.lit_time,
+			"darkness": self.darkness,
+		}
+
+
+def _read_all() -> dict[str, Any]:
+	"""Read the calibration of all devices, returns an empty dict if there is none"""
+	try:
+		with open(paths_factory.calibration_path()) as f:
+			data = json.load(f)
+	except (OSError, ValueError):
+		return {}
+
+	return data if isinstance(data, dict) else {}
+
+
+def load(device_path: str) -> DeviceCalibration:
+	"""Load the calibration for a device, or a blank one if it has not been seen before"""
+	data = _read_all().get(device_path)
+	return DeviceCalibration(device_path, data if isinstance(data, dict) else None)
+
+
+def save(calibration: DeviceCalibration) -> None:
+	"""
+	Write the calibration of a device to disk, failures are not fatal. The calibration of
+	other devices is read and written back under a lock, so concurrent saves don't drop them.
+	"""
+	try:
+		make_private_dir(str(paths_factory.cache_dir_path()))
+
+		fd = os.open(paths_factory.calibration_lock_path(), os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			fcntl.flock(fd, fcntl.LOCK_EX)
+
+			data = _read_all()
+			data[calibration.device_path] = calibration.to_dict()
+
+			# Calibration is only a hint, losing the latest update in a crash is harmless
+			write_json(paths_factory.calibration_path(), data, sync=False)
+		finally:
+			# Closing the file releases the lock
+			os.close(fd)
+	except OSError:
+		pass
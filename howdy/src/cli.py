@@ -1,27 +1,40 @@
 # CLI directly called by running the howdy command
 
 # Import required modules
+# Only what's needed to parse the arguments is imported here, commands import what they need themselves
+import sys
+
+# Run the command again with import timing if asked to, before anything else is imported
+if "--profile-startup" in sys.argv:
+	import startup_profile
+	sys.exit(startup_profile.run(__file__, [arg for arg in sys.argv[1:] if arg != "--profile-startup"]))
+
 import argparse
 import builtins
-import getpass
 import os
-import pwd
-import sys
 
 from i18n import _
 
-# Try to get the original username (not "root") from shell
-sudo_user = os.environ.get("SUDO_USER")
-doas_user = os.environ.get("DOAS_USER")
-pkexec_uid = os.environ.get("PKEXEC_UID")
-pkexec_user = pwd.getpwuid(int(pkexec_uid))[0] if pkexec_uid else ""
-env_user = getpass.getuser()
-user = next((u for u in [sudo_user, doas_user, pkexec_user, env_user] if u), "")
 
-# If that fails, error out
-if user == "":
-    print(_("Could not determine user, please use the --user flag"))
-    sys.exit(1)
+def detect_user() -> str:
+	"""Try to get the original username (not "root") from shell"""
+	sudo_user = os.environ.get("SUDO_USER")
+	doas_user = os.environ.get("DOAS_USER")
+	pkexec_uid = os.environ.get("PKEXEC_UID")
+
+	if sudo_user or doas_user:
+		return sudo_user or doas_user
+
+	if pkexec_uid:
+		import pwd
+		return pwd.getpwuid(int(pkexec_uid))[0]
+
+	import getpass
+	return getpass.getuser() or ""
+
+
+# All commands the CLI knows
+COMMANDS = ["add", "clear", "compact", "config", "disable", "identify", "list", "remove", "set", "snapshot", "test", "version"]
 
 # Basic command setup
 parser = argparse.ArgumentParser(
@@ -29,15 +42,15 @@ parser = argparse.ArgumentParser(
 	formatter_class=argparse.RawDescriptionHelpFormatter,
 	add_help=False,
 	prog="howdy",
-	usage="howdy [-U USER] [--plain] [-h] [-y] {command} [{arguments}...]".format(command=_("command"), arguments=_("arguments")),
+	usage="howdy [-U USER] [--plain] [--profile-startup] [-h] [-y] {command} [{arguments}...]".format(command=_("command"), arguments=_("arguments")),
 	epilog=_("For support please visit\nhttps://github.com/boltgolt/howdy"))
 
 # Add an argument for the command
 parser.add_argument(
 	"command",
-	help=_("The command option to execute, can be one of the following: add, clear, config, disable, list, remove, snapshot, set, test or version."),
+	help=_("The command option to execute, can be one of the following: add, clear, compact, config, disable, identify, list, remove, snapshot, set, test or version."),
 	metavar="command",
-	choices=["add", "clear", "config", "disable", "list", "remove", "set", "snapshot", "test", "version"])
+	choices=COMMANDS)
 
 # Add an argument for the extra arguments of disable and remove
 parser.add_argument(
@@ -45,10 +58,9 @@ parser.add_argument(
 	help=_("Optional arguments for the add, disable, remove and set commands."),
 	nargs="*")
 
-# Add the user flag
+# Add the user flag, it defaults to the user that ran sudo
 parser.add_argument(
 	"-U", "--user",
-	default=user,
 	help=_("Set the user account to use."))
 
 # Add the -y flag
@@ -63,6 +75,20 @@ parser.add_argument(
 	help=_("Print machine-friendly output."),
 	action="store_true")
 
+# Add the --profile-startup flag, handled before the arguments are parsed
+parser.add_argument(
+	"--profile-startup",
+	help=_("Print how long importing the modules of the command took."),
+	action="store_true")
+
+# Add the --benchmark flag, it makes the test command run without a window for a number of seconds or frames
+parser.add_argument(
+	"--benchmark",
+	help=_("Run the test command without a window for LIMIT seconds, or LIMIT frames if it ends in f, and print a JSON summary. Goes after the command, as in: howdy test --benchmark 30"),
+	metavar="LIMIT",
+	nargs="?",
+	const="")
+
 # Overwrite the default help message so we can use a uppercase S
 parser.add_argument(
 	"-h", "--help",
@@ -72,13 +98,32 @@ parser.add_argument(
 
 # If we only have 1 argument we print the help text
 if len(sys.argv) < 2:
-	print(_("current active user: ") + user + "\n")
+	print(_("current active user: ") + detect_user() + "\n")
 	parser.print_help()
 	sys.exit(0)
 
+# The benchmark is a mode of the test command. Its limit is optional, so in "howdy --benchmark test"
+# the command would be taken for the limit
+if "--benchmark" in sys.argv[1:-1] and sys.argv[sys.argv.index("--benchmark") + 1] in COMMANDS:
+	print(_("The --benchmark flag can only be used after the test command, as in: howdy test --benchmark 30"))
+	sys.exit(1)
+
 # Parse all arguments above
 args = parser.parse_args()
 
+if args.benchmark is not None and args.command != "test":
+	print(_("The --benchmark flag can only be used after the test command, as in: howdy test --benchmark 30"))
+	sys.exit(1)
+
+# Only look up the user if none was given
+if not args.user:
+	args.user = detect_user()
+
+# If that fails, error out
+if args.user == "":
+	print(_("Could not determine user, please use the --user flag"))
+	sys.exit(1)
+
 # Save the args and user as builtins which can be accessed by the imports
 builtins.howdy_args = args
 builtins.howdy_user = args.user
@@ -91,7 +136,8 @@ if os.geteuid() != 0:
 	sys.exit(1)
 
 # Beyond this point the user can't change anymore, if we still have root as user we need to abort
-if args.user == "root":
+# Identify works across all users, so it doesn't need one
+if args.user == "root" and args.command != "identify":
 	print(_("Can't run howdy commands as root, please run this command with the --user flag"))
 	sys.exit(1)
 
@@ -100,10 +146,14 @@ if args.command == "add":
 	import cli.add
 elif args.command == "clear":
 	import cli.clear
+elif args.command == "compact":
+	import cli.compact
 elif args.command == "config":
 	import cli.config
 elif args.command == "disable":
 	import cli.disable
+elif args.command == "identify":
+	import cli.identify
 elif args.command == "list":
 	import cli.list
 elif args.command == "remove":
@@ -113,6 +163,9 @@ elif args.command == "set":
 elif args.command == "snapshot":
 	import cli.snap
 elif args.command == "test":
-	import cli.test
+	if args.benchmark is not None:
+		import cli.benchmark
+	else:
+		import cli.test
 else:
 	print("Howdy 3.0.0 BETA")
@@ -2,8 +2,6 @@
 from __future__ import annotations
 
 import builtins
-import configparser
-import json
 import os
 import sys
 
@@ -13,13 +11,16 @@ import time
 import numpy as np
 
 import paths_factory
+import settings
 from i18n import _
+from model_store import ModelStore
 from recorders.video_capture import VideoCapture
 
 # Try to import the recognition module and give a nice error if we can't
 # Add should be the first point where import issues show up
 try:
 	from recog import create_backend
+	from recog.enrollment import FaceSample, encode_samples, representatives
 except ImportError as err:
 	print(err)
 
@@ -30,11 +31,20 @@ except ImportError as err:
 # OpenCV needs to be imported after dlib
 import cv2
 
-# Read config from disk
-config = configparser.ConfigParser()
-config.read(paths_factory.config_file_path())
+# Encodings closer together than this add nothing to a model and are merged
+DUPLICATE_DISTANCE = 0.1
+# Frames to read before giving up, however many faces a burst asks for
+MAX_FRAMES = 60
+
+# Read the compiled config, it's only parsed again if config.ini changed
+config = settings.load()
 
 use_cnn = config.getboolean("core", "use_cnn", fallback=False)
+burst_frames = config.getint("enrollment", "burst_frames", fallback=1)
+max_encodings = config.getint("enrollment", "max_encodings", fallback=1)
+jitters = config.getint("enrollment", "jitters", fallback=1)
+workers = config.getint("enrollment", "workers", fallback=1)
+
 try:
 	backend = create_backend(use_cnn=use_cnn)
 except FileNotFoundError:
@@ -44,8 +54,8 @@ except FileNotFoundError:
 	sys.exit(1)
 
 user = builtins.howdy_user
-# The permanent file to store the encoded model in
-enc_file = paths_factory.user_model_path(user)
+# The permanent store of the encoded models
+store = ModelStore(user)
 # Known encodings
 encodings = []
 
@@ -56,8 +66,7 @@ if not os.path.exists(paths_factory.user_models_dir_path()):
 
 # To try read a premade encodings file if it exists
 try:
-	with open(enc_file) as f:
-		encodings = json.load(f)
+	encodings = store.load()
 except FileNotFoundError:
 	encodings = []
 
@@ -113,11 +122,15 @@ video_capture = VideoCapture(config)
 
 print(_("\nPlease look straight into the camera"))
 
+# Faces from slightly different angles make for a more robust model
+if burst_frames > 1:
+	print(_("Then slowly move your head a little from side to side"))
+
 # Give the user time to read
 time.sleep(2)
 
-# Will contain found face encodings
-enc = []
+# Faces found in lit frames, the best of them are encoded
+samples = []
 # Count the number of read frames
 frames = 0
 # Count the number of illuminated read frames
@@ -127,14 +140,15 @@ valid_frames = 0
 dark_tries = 0
 # Track the running darkness total
 dark_running_total = 0
-face_locations = None
+# Count the frames that were skipped because they showed more than one face
+multi_face_frames = 0
 
 dark_threshold = config.getfloat("video", "dark_threshold", fallback=60)
 
 clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
 
-# Loop through frames till we hit a timeout
-while frames < 60:
+# Loop through frames till we have enough faces or hit a timeout
+while frames < MAX_FRAMES and len(samples) < burst_frames:
 	frames += 1
 	# Grab a single frame of video
 	frame, gsframe = video_capture.read_frame()
@@ -167,42 +181,45 @@ while frames < 60:
 	# Get all faces from that frame as encodings
 	face_locations = backend.detect_faces(gsframe, 1)
 
-	# If we've found at least one, we can continue
+	# If more than 1 faces are detected we can't know which one belongs to the user, so skip the frame
+	if len(face_locations) > 1:
+		multi_face_frames += 1
+		continue
+
+	# Keep the face to encode it later, along with how sharp it is
 	if face_locations:
-		break
+		samples.append(FaceSample(frame, gsframe, face_locations[0]))
 
 video_capture.release()
 
 # If we've found no faces, try to determine why
-if not face_locations:
+if not samples:
 	if valid_frames == 0:
 		print(_("Camera saw only black frames - is IR emitter working?"))
 	elif valid_frames == dark_tries:
 		print(_("All frames were too dark, please check dark_threshold in config"))
 		print(_("Average darkness: {avg}, Threshold: {threshold}").format(avg=str(dark_running_total / valid_frames), threshold=str(dark_threshold)))
+	elif multi_face_frames:
+		print(_("Multiple faces detected, aborting"))
 	else:
 		print(_("No face detected, aborting"))
 	sys.exit(1)
 
-# If more than 1 faces are detected we can't know which one belongs to the user
-elif len(face_locations) > 1:
-	print(_("Multiple faces detected, aborting"))
-	sys.exit(1)
-
-face_location = face_locations[0]
-
-# Get the encodings in the frame
-face_landmark = backend.get_landmarks(frame, face_location)
-face_encoding = backend.compute_encoding(frame, face_landmark, 1)
+# Encode the sharpest faces and keep a few encodings that represent them all
+face_encodings = encode_samples(backend, samples, jitters, workers)
 
-insert_model["data"].append(face_encoding.tolist())
+for face_encoding in representatives(face_encodings, max_encodings, DUPLICATE_DISTANCE):
+	insert_model["data"].append(face_encoding.tolist())
 
-# Insert full object into the list
-encodings.append(insert_model)
+if not builtins.howdy_args.plain and burst_frames > 1:
+	print(_("Encoded {encoded} of {found} faces into {stored} encodings").format(
+		encoded=len(face_encodings), found=len(samples), stored=len(insert_model["data"])))
 
-# Save the new encodings to disk
-with open(enc_file, "w") as datafile:
-	json.dump(encodings, datafile)
+# Insert full object into the list and save it to disk, re-reading the models in case they changed while scanning
+with store.update() as encodings:
+	# Take the next id again, another model may have been added in the meantime
+	insert_model["id"] = encodings[-1]["id"] + 1 if encodings else 0
+	encodings.append(insert_model)
 
 # Give let the user know how it went
 print(_("""\nScan complete
@@ -0,0 +1,254 @@
+# Measure the recognition pipeline without a window and print a JSON summary
+from __future__ import annotations
+
+import builtins
+import json
+import os
+import sys
+import time
+
+import settings
+from i18n import _
+
+# Run time when no limit is given, in seconds
+DEFAULT_SECONDS = 10.0
+
+# Read the compiled config, it's only parsed again if config.ini changed
+config = settings.load()
+
+
+def parse_limit(text: str) -> tuple[float | None, int | None]:
+	"""Parse a limit like "30" or "30s" into seconds, or one like "300f" into a frame count"""
+	if text == "":
+		return DEFAULT_SECONDS, None
+
+	if text.endswith("f"):
+		frames = int(text[:-1])
+		if frames < 1:
+			raise ValueError(text)
+		return None, frames
+
+	seconds = float(text[:-1] if text.endswith("s") else text)
+	if seconds <= 0:
+		raise ValueError(text)
+	return seconds, None
+
+
+def summarize(samples: list[float]) -> dict[str, float | int]:
+	"""Count, mean, median, 95th percentile and maximum of a list of durations, in milliseconds"""
+	if not samples:
+		return {"count": 0}
+
+	ordered = sorted(samples)
+
+	def percentile(fraction: float) -> float:
+		return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000, 3)
+
+	return {
+		"count": len(ordered),
+		"mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+		"p50_ms": percentile(0.5),
+		"p95_ms": percentile(0.95),
+		"max_ms": round(ordered[-1] * 1000, 3),
+	}
+
+
+try:
+	max_seconds, max_frames = parse_limit(builtins.howdy_args.benchmark)
+except ValueError:
+	print(_("Invalid benchmark limit, use a number of seconds like 30 or a number of frames like 300f"))
+	sys.exit(1)
+
+# Only load OpenCV and the camera code once we know the benchmark can run
+import cv2
+
+from model_store import ModelStore
+from recog import EncodingMatcher, create_backend
+from recorders.video_capture import VideoCapture
+
+# Read config values to use in the main loop, the same way compare does
+recording_plugin = config.get("video", "recording_plugin", fallback="opencv")
+video_certainty = config.getfloat("video", "certainty", fallback=3.5) / 10
+dark_threshold = config.getfloat("video", "dark_threshold", fallback=60)
+max_height = config.getfloat("video", "max_height", fallback=320.0)
+exposure = config.getint("video", "exposure", fallback=-1)
+use_cnn = config.getboolean("core", "use_cnn", fallback=False)
+
+# Stage timings, in seconds per frame or per face
+timings: dict[str, list[float]] = {
+	"open": [],
+	"load": [],
+	"capture": [],
+	"prepare": [],
+	"detect": [],
+	"landmarks": [],
+	"encode": [],
+	"match": [],
+}
+
+# Keep all output but the summary out of stdout, so it can be piped straight into a parser
+print(_("Benchmarking recognition, press ctrl+C to stop early"), file=sys.stderr)
+
+start = time.perf_counter()
+video_capture = VideoCapture(config)
+timings["open"].append(time.perf_counter() - start)
+
+# Camera controls go through OpenCV as a fallback, so only apply them with that recorder
+camera_controls = None
+if recording_plugin == "opencv" and exposure != -1:
+	from recorders.camera_controls import CameraControls
+
+	camera_controls = CameraControls(video_capture)
+	camera_controls.request_exposure(exposure)
+	camera_controls.apply()
+
+start = time.perf_counter()
+backend = create_backend(use_cnn=use_cnn)
+
+try:
+	models = ModelStore(builtins.howdy_user).load()
+except FileNotFoundError:
+	models = []
+
+matcher = EncodingMatcher(models)
+timings["load"].append(time.perf_counter() - start)
+
+clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+frames = 0
+black_frames = 0
+dark_frames = 0
+face_frames = 0
+faces = 0
+matched_frames = 0
+best_distance = float("inf")
+best_label = None
+resolution = None
+
+loop_start = time.perf_counter()
+
+# Stop early on ctrl+C, the frames so far still make a summary
+try:
+	while True:
+		elapsed = time.perf_counter() - loop_start
+		if (max_seconds is not None and elapsed >= max_seconds) or (max_frames is not None and frames >= max_frames):
+			break
+
+		frames += 1
+
+		start = time.perf_counter()
+		frame, gsframe = video_capture.read_frame()
+		timings["capture"].append(time.perf_counter() - start)
+
+		if resolution is None:
+			resolution = [int(gsframe.shape[1]), int(gsframe.shape[0])]
+
+		# Equalize and judge the frame like compare does
+		start = time.perf_counter()
+		gsframe = clahe.apply(gsframe)
+		hist = cv2.calcHist([gsframe], [0], None, [8], [0, 256])
+		hist_total = float(hist.sum())
+		darkness = float(hist.flat[0]) / hist_total * 100 if hist_total else 100.0
+
+		if hist_total == 0 or darkness == 100:
+			timings["prepare"].append(time.perf_counter() - start)
+			black_frames += 1
+			continue
+
+		if darkness > dark_threshold:
+			timings["prepare"].append(time.perf_counter() - start)
+			dark_frames += 1
+			continue
+
+		# Shrink the frame to the configured height
+		scaling_factor = max_height / gsframe.shape[0]
+		if scaling_factor != 1:
+			frame = cv2.resize(frame, None, fx=scaling_factor, fy=scaling_factor, interpolation=cv2.INTER_AREA)
+			gsframe = cv2.resize(gsframe, None, fx=scaling_factor, fy=scaling_factor, interpolation=cv2.INTER_AREA)
+		timings["prepare"].append(time.perf_counter() - start)
+
+		start = time.perf_counter()
+		face_locations = backend.detect_faces(gsframe, 1)
+		timings["detect"].append(time.perf_counter() - start)
+
+		if face_locations:
+			face_frames += 1
+
+		frame_matched = False
+
+		for location in face_locations:
+			faces += 1
+
+			start = time.perf_counter()
+			face_landmark = backend.get_landmarks(frame, location)
+			timings["landmarks"].append(time.perf_counter() - start)
+
+			start = time.perf_counter()
+			face_encoding = backend.compute_encoding(frame, face_landmark, 1)
+			timings["encode"].append(time.perf_counter() - start)
+
+			# Without models there's nothing to match against, the other stages are still measured
+			if not models:
+				continue
+
+			start = time.perf_counter()
+			match_index, match = matcher.match(face_encoding)
+			timings["match"].append(time.perf_counter() - start)
+
+			if match < best_distance:
+				best_distance = match
+				best_label = models[matcher.model_index(match_index)]["label"]
+
+			if 0 < match < video_certainty:
+				frame_matched = True
+
+		if frame_matched:
+			matched_frames += 1
+
+		if camera_controls:
+			camera_controls.verify()
+except KeyboardInterrupt:
+	pass
+
+elapsed = time.perf_counter() - loop_start
+video_capture.release()
+
+summary = {
+	"host": os.uname().nodename,
+	"user": builtins.howdy_user,
+	"time": round(time.time(), 3),
+	"config": {
+		"device_path": config.get("video", "device_path", fallback="none"),
+		"recording_plugin": recording_plugin,
+		"use_cnn": use_cnn,
+		"max_height": max_height,
+		"dark_threshold": dark_threshold,
+		"certainty": video_certainty * 10,
+	},
+	"resolution": resolution,
+	"models": len(models),
+	"encodings": len(matcher),
+	"duration": round(elapsed, 3),
+	"frames": frames,
+	"fps": round(frames / elapsed, 2) if elapsed else 0.0,
+	"black_frames": black_frames,
+	"dark_frames": dark_frames,
+	"dark_ratio": round((black_frames + dark_frames) / frames, 4) if frames else 0.0,
+	"face_frames": face_frames,
+	"faces": faces,
+	"matched_frames": matched_frames,
+	# Distances are shown as certainty elsewhere, which is the distance times 10
+	"best_distance": round(best_distance, 4) if best_distance != float("inf") else None,
+	"best_certainty": round(best_distance * 10, 3) if best_distance != float("inf") else None,
+	"best_label": best_label,
+	"timings": {stage: summarize(samples) for stage, samples in timings.items()},
+}
+
+if camera_controls:
+	summary["timings"]["controls"] = {"total_ms": round(camera_controls.time * 1000, 3), "writes": camera_controls.writes}
+
+# One line per summary with --plain, so results from many machines can be appended to one file
+if builtins.howdy_args.plain:
+	print(json.dumps(summary, sort_keys=True))
+else:
+	print(json.dumps(summary, indent=2, sort_keys=True))
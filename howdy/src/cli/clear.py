@@ -5,8 +5,10 @@ import builtins
 import os
 import sys
 
+import model_stats
 import paths_factory
 from i18n import _
+from model_store import ModelStore
 
 # Get the passed user
 user = builtins.howdy_user
@@ -33,5 +35,6 @@ if not builtins.howdy_args.y:
 		sys.exit(1)
 
 # Delete otherwise
-os.remove(paths_factory.user_model_path(user))
+ModelStore(user).delete()
+model_stats.remove(user)
 print(_("\nModels cleared"))
@@ -0,0 +1,137 @@
+# Merge near duplicate encodings in the models of a user
+from __future__ import annotations
+
+import builtins
+import os
+import sys
+
+import paths_factory
+from i18n import _
+from model_stats import ModelStats
+from model_store import ModelsChanged, ModelStore
+from recog.cluster import agglomerate, medoid
+
+# Encodings closer together than this are merged by default
+DEFAULT_DISTANCE = 0.2
+
+user = builtins.howdy_user
+
+# Check if the models file has been created yet
+if not os.path.exists(paths_factory.user_models_dir_path()):
+	print(_("Face models have not been initialized yet, please run:"))
+	print("\n\tsudo howdy -U " + user + " add\n")
+	sys.exit(1)
+
+# The models of the user
+store = ModelStore(user)
+
+# Try to load the models file and abort if the user does not have it yet
+try:
+	models = store.load()
+except FileNotFoundError:
+	print(_("No face model known for the user {}, please run:").format(user))
+	print("\n\tsudo howdy -U " + user + " add\n")
+	sys.exit(1)
+
+# Get the merge distance from the cli arguments if provided
+distance = DEFAULT_DISTANCE
+if builtins.howdy_args.arguments:
+	try:
+		distance = float(builtins.howdy_args.arguments[0]) / 10
+	except ValueError:
+		print(_("Please give the certainty below which encodings are merged as a number, for example:"))
+		print("\n\thowdy compact 2\n")
+		sys.exit(1)
+
+stats = ModelStats.load(user)
+
+# Every encoding of the user as (model index, index within the model)
+positions = [(model_index, encoding_index) for model_index, model in enumerate(models) for encoding_index in range(len(model["data"]))]
+encodings = [models[model_index]["data"][encoding_index] for model_index, encoding_index in positions]
+hits = [stats.hits(models[model_index]["id"], encoding_index) for model_index, encoding_index in positions]
+
+if not encodings:
+	print(_("No encodings to compact"))
+	sys.exit(0)
+
+# Group encodings that are closer together than the merge distance
+clusters = agglomerate(encodings, merge_distance=distance)
+
+# The encoding every encoding is merged into
+kept_by = {}
+for members in clusters:
+	# Keep the encoding that matched most often, or the most central one if none did
+	keep = max(members, key=lambda member: hits[member]) if any(hits[member] for member in members) else medoid(encodings, members)
+
+	for member in members:
+		kept_by[member] = keep
+
+# Show how every encoding has been used and what happens to it
+if not builtins.howdy_args.plain:
+	print(_("Encodings of {}:").format(user))
+	print("\n\033[1;29m" + _("Model  Encoding  Hits  Result\033[0m"))
+
+for index, (model_index, encoding_index) in enumerate(positions):
+	model_id = models[model_index]["id"]
+
+	if kept_by[index] == index:
+		result = _("kept")
+	else:
+		merged_model, merged_encoding = positions[kept_by[index]]
+		result = _("merged into {model}.{encoding}").format(model=models[merged_model]["id"], encoding=merged_encoding)
+
+	if builtins.howdy_args.plain:
+		print("{},{},{},{}".format(model_id, encoding_index, hits[index], result))
+	else:
+		print("{:<7}{:<10}{:<6}{}".format(model_id, encoding_index, hits[index], result))
+
+kept = sorted(set(kept_by.values()))
+
+if len(kept) == len(encodings):
+	print(_("\nNo encodings closer than {} to merge").format(distance * 10))
+	sys.exit(0)
+
+print(_("\n{before} encodings will be compacted to {after}").format(before=len(encodings), after=len(kept)))
+
+# Only ask the user if there's no -y flag
+if not builtins.howdy_args.y:
+	ans = input(_("Do you want to continue [y/N]: "))
+
+	# Abort if the answer isn't yes
+	if (ans.lower() != "y"):
+		print(_('\nInterpreting as a "NO", aborting'))
+		sys.exit(1)
+
+# Build the new models, the kept encodings stay in their model and inherit the hits of the ones merged into them
+new_models = []
+new_stats = ModelStats(user)
+
+for model_index, model in enumerate(models):
+	merged_hits = {
+		index: sum(hits[member] for member, keep in kept_by.items() if keep == index)
+		for index in kept if positions[index][0] == model_index
+	}
+
+	# Put the most used encodings first, matching stops at the first good enough one
+	order = sorted(merged_hits, key=lambda index: -merged_hits[index])
+	data = [encodings[index] for index in order]
+
+	# Models that had all their encodings merged into others are dropped
+	if data:
+		new_models.append(dict(model, data=data))
+		new_stats.encodings[str(model["id"])] = [merged_hits[index] for index in order]
+		if str(model["id"]) in stats.models:
+			new_stats.models[str(model["id"])] = stats.models[str(model["id"])]
+	else:
+		print(_('Model {id} ("{label}") was merged into other models').format(id=model["id"], label=model["label"]))
+
+# Save the compacted models to disk, unless they were changed while we were busy
+try:
+	with store.update(store.loaded_version) as stored_models:
+		stored_models[:] = new_models
+		new_stats.save()
+except ModelsChanged:
+	print(_("The models of {} were changed while compacting, please try again").format(user))
+	sys.exit(1)
+
+print(_("Compacted the models of {}").format(user))
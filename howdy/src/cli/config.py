@@ -1,13 +1,45 @@
-# Open the config file in an editor
+# Open the config file in an editor, then check what was written
 
 # Import required modules
+import builtins
 import os
 import shutil
 import subprocess
+import sys
 
 import paths_factory
+import settings
 from i18n import _
 
+
+def check_config() -> None:
+    """Compile the config and report the problems in it, so they show up now and not while authenticating"""
+    config = settings.load()
+
+    # Rules for stamps that aren't installed would only fail when a face matches
+    if config.getboolean("rubberstamps", "enabled", fallback=False):
+        from rubberstamps import registry
+        installed = registry().installed()
+        for rule in config.stamp_rules:
+            if rule[0] not in installed:
+                config.errors.append(_("Stamp not installed: {}").format(rule[0]))
+
+    if not config.errors:
+        print(_("The config is valid"))
+        return
+
+    print(_("Found {} problems in the config, invalid options use their default value:").format(len(config.errors)))
+    for error in config.errors:
+        print("  " + error)
+
+    sys.exit(1)
+
+
+# Only check the config if asked to
+if builtins.howdy_args.arguments and builtins.howdy_args.arguments[0] == "check":
+    check_config()
+    sys.exit(0)
+
 # Determine the editor to use
 editor = None
 preferred_editor = os.environ.get("EDITOR")
@@ -36,6 +68,10 @@ if editor:
         subprocess.call([editor, paths_factory.config_file_path()])
     except Exception as e:
         print(_("Failed to open editor: {error}").format(error=e))
+        sys.exit(1)
+
+    # Compile the edited config right away, so mistakes are reported here
+    check_config()
 else:
     print(_("Error: Could not find a suitable text editor."))
     print(_("Please install 'nano' or 'vi', or set the EDITOR environment variable."))
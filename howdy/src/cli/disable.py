@@ -8,12 +8,13 @@ import configparser
 import sys
 
 import paths_factory
+import settings
 from i18n import _
 
 # Get the absolute filepath
 config_path = paths_factory.config_file_path()
 
-# Read config from disk
+# Read config from disk, only to write it back with the new value
 config = configparser.ConfigParser()
 config.read(config_path)
 
@@ -35,8 +36,8 @@ else:
 	print(_("Please only use 0 (enable) or 1 (disable) as an argument"))
 	sys.exit(1)
 
-# Don't do anything when the state is already the requested one
-if out_value == config.get("core", "disabled", fallback=True):
+# Don't do anything when the state is already the requested one, read through the validated config
+if settings.load().getboolean("core", "disabled") == (out_value == "true"):
 	print(_("The disable option has already been set to ") + out_value)
 	sys.exit(1)
 
@@ -0,0 +1,96 @@
+# Find out which user is in front of the camera
+from __future__ import annotations
+
+import builtins
+import sys
+import time
+
+import numpy as np
+
+import paths_factory
+import settings
+from i18n import _
+from recorders.video_capture import VideoCapture
+
+# Try to import the recognition module and give a nice error if we can't
+try:
+	from recog import create_backend
+	from recog.index import IdentificationIndex
+except ImportError as err:
+	print(err)
+
+	print(_("\nCan't import the recognition module, check the output of"))
+	print("pip3 show dlib")
+	sys.exit(1)
+
+# OpenCV needs to be imported after dlib
+import cv2
+
+# Read the compiled config, it's only parsed again if config.ini changed
+config = settings.load()
+
+timeout = config.getint("video", "timeout", fallback=4)
+dark_threshold = config.getfloat("video", "dark_threshold", fallback=60)
+video_certainty = config.getfloat("video", "certainty", fallback=3.5) / 10
+
+# Bring the index up to date, only model files that changed since the last run are read
+index = IdentificationIndex.load()
+if index.update():
+	index.save()
+
+if not len(index):
+	print(_("No face models have been added yet, please run:"))
+	print("\n\tsudo howdy add\n")
+	sys.exit(1)
+
+try:
+	backend = create_backend(use_cnn=config.getboolean("core", "use_cnn", fallback=False))
+except FileNotFoundError:
+	print(_("Data files have not been downloaded, please run the following commands:"))
+	print("\n\tcd " + paths_factory.dlib_data_dir_path())
+	print("\tsudo ./install.sh\n")
+	sys.exit(1)
+
+video_capture = VideoCapture(config)
+clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+# Users found in front of the camera, as (username, model id, distance)
+results = []
+start_time = time.time()
+
+# Loop through frames till someone is identified or we hit the timeout
+while not results and time.time() - start_time < timeout:
+	# Grab a single frame of video
+	frame, gsframe = video_capture.read_frame()
+	gsframe = clahe.apply(gsframe)
+
+	# Create a histogram of the image with 8 values
+	hist = cv2.calcHist([gsframe], [0], None, [8], [0, 256])
+	# All values combined for percentage calculation
+	hist_total = np.sum(hist)
+
+	# Skip black frames and frames that are too dark
+	if hist_total == 0 or hist[0][0] / hist_total * 100 > dark_threshold:
+		continue
+
+	# Identify every face in the frame
+	for face_location in backend.detect_faces(gsframe, 1):
+		face_landmark = backend.get_landmarks(frame, face_location)
+		face_encoding = backend.compute_encoding(frame, face_landmark, 1)
+
+		results += index.identify(face_encoding, video_certainty, limit=1)
+
+video_capture.release()
+
+if not results:
+	if not builtins.howdy_args.plain:
+		print(_("No known face found"))
+	sys.exit(1)
+
+# Print the closest users first
+for username, model_id, distance in sorted(results, key=lambda result: result[2]):
+	if builtins.howdy_args.plain:
+		print("{},{},{}".format(username, model_id, round(distance * 10, 3)))
+	else:
+		print(_("Identified {user} (model {id}, certainty {certainty})").format(
+			user=username, id=model_id, certainty=round(distance * 10, 3)))
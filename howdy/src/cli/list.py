@@ -2,7 +2,6 @@
 from __future__ import annotations
 
 import builtins
-import json
 import os
 
 # Import required modules
@@ -11,6 +10,8 @@ import time
 
 import paths_factory
 from i18n import _
+from model_stats import ModelStats
+from model_store import ModelStore
 
 user = builtins.howdy_user
 
@@ -20,23 +21,22 @@ if not os.path.exists(paths_factory.user_models_dir_path()):
 	print("\n\tsudo howdy -U " + user + " add\n")
 	sys.exit(1)
 
-# Path to the models file
-enc_file = paths_factory.user_model_path(user)
-
 # Try to load the models file and abort if the user does not have it yet
 try:
-	with open(enc_file) as f:
-		encodings = json.load(f)
+	encodings = ModelStore(user).load()
 except FileNotFoundError:
 	if not builtins.howdy_args.plain:
 		print(_("No face model known for the user {}, please run:").format(user))
 		print("\n\tsudo howdy -U " + user + " add\n")
 	sys.exit(1)
 
+# How often and how well every model matched
+stats = ModelStats.load(user)
+
 # Print a header if we're not in plain mode
 if not builtins.howdy_args.plain:
 	print(_("Known face models for {}:").format(user))
-	print("\n\033[1;29m" + _("ID  Date                 Label\033[0m"))
+	print("\n\033[1;29m" + _("ID  Date                 Hits  Last used            Certainty  Label\033[0m"))
 
 # Loop through all encodings and print info about them
 for enc in encodings:
@@ -56,8 +56,15 @@ for enc in encodings:
 	# Separate with commas again for machines, spaces otherwise
 	print("," if builtins.howdy_args.plain else "  ", end="")
 
-	# End with the label
-	print(enc["label"])
+	model_stats = stats.model(enc["id"])
+	last_used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(model_stats["last_used"])) if model_stats["hits"] else "-"
+	certainty = str(round(model_stats["mean_distance"] * 10, 2)) if model_stats["hits"] else "-"
+
+	# In plain mode the label is kept as the third column and the statistics follow it
+	if builtins.howdy_args.plain:
+		print(",".join([enc["label"], str(model_stats["hits"]), last_used, certainty]))
+	else:
+		print("{:<6}{:<21}{:<11}{}".format(model_stats["hits"], last_used, certainty, enc["label"]))
 
 # Add a closing enter
 print()
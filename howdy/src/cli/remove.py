@@ -2,14 +2,15 @@
 from __future__ import annotations
 
 import builtins
-import json
 import os
 
 # Import required modules
 import sys
 
+import model_stats
 import paths_factory
 from i18n import _
+from model_store import ModelStore
 
 user = builtins.howdy_user
 
@@ -28,13 +29,12 @@ if not os.path.exists(paths_factory.user_models_dir_path()):
 	print("\n\thowdy add\n")
 	sys.exit(1)
 
-# Path to the models file
-enc_file = paths_factory.user_model_path(user)
+# The models of the user
+store = ModelStore(user)
 
 # Try to load the models file and abort if the user does not have it yet
 try:
-	with open(enc_file) as f:
-		encodings = json.load(f)
+	encodings = store.load()
 except FileNotFoundError:
 	print(_("No face model known for the user {}, please run:").format(user))
 	print("\n\thowdy add\n")
@@ -72,21 +72,19 @@ if not found:
 	print(_("No model with ID {id} exists for {user}").format(id=id, user=user))
 	sys.exit(1)
 
-# Remove the entire file if this encoding is the only one
-if len(encodings) == 1:
-	os.remove(paths_factory.user_model_path(user))
-	print(_("Removed last model, howdy disabled for user"))
-else:
-	# A place holder to contain the encodings that will remain
-	new_encodings = []
-
-	# Loop though all encodings and only add those that don't need to be removed
-	for enc in encodings:
-		if str(enc["id"]) != id:
-			new_encodings.append(enc)
+# Only keep the encodings that don't need to be removed, the file is removed entirely if none remain
+with store.update() as encodings:
+	encodings[:] = [enc for enc in encodings if str(enc["id"]) != id]
 
-	# Save this new set to disk
-	with open(enc_file, "w") as datafile:
-		json.dump(new_encodings, datafile)
+	# Forget how often the removed model matched, while the models can't change under us
+	if encodings:
+		stats = model_stats.ModelStats.load(user)
+		stats.forget(id)
+		stats.save()
+	else:
+		model_stats.remove(user)
 
+if not store.exists():
+	print(_("Removed last model, howdy disabled for user"))
+else:
 	print(_("Removed model {}").format(id))
@@ -8,12 +8,13 @@ import configparser
 import sys
 
 import paths_factory
+import settings
 from i18n import _
 
 # Get the absolute filepath
 config_path = paths_factory.config_file_path()
 
-# Read config from disk
+# Read config from disk, only to write it back with the new value
 config = configparser.ConfigParser()
 config.read(config_path)
 
@@ -28,10 +29,11 @@ if len(builtins.howdy_args.arguments) < 2:
 set_name = builtins.howdy_args.arguments[0]
 set_value = builtins.howdy_args.arguments[1]
 
-# Search for the option across all sections
+# Search for the option across all sections of the validated config
+current = settings.load()
 found_section = None
-for section in config.sections():
-	if config.has_option(section, set_name):
+for section in current.sections():
+	if current.has_option(section, set_name):
 		found_section = section
 		break
 
@@ -40,6 +42,12 @@ if not found_section:
 	print(_('Could not find a "{}" config option to set').format(set_name))
 	sys.exit(1)
 
+# Check the new value before writing it, so a typo can't break authentication
+error = settings.validate(found_section, set_name, set_value)
+if error:
+	print(_('Invalid value for "{name}": {error}').format(name=set_name, error=error))
+	sys.exit(1)
+
 # Update the config value and write it back
 config.set(found_section, set_name, set_value)
 with open(config_path, "w") as f:
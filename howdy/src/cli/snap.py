@@ -1,17 +1,54 @@
-# Create a snapshot
+# Create a snapshot, or list the stored ones
 
 # Import required modules
-import configparser
+import builtins
+import sys
+import time
 from datetime import datetime, timezone
 
-import paths_factory
+import settings
 import snapshot
 from i18n import _
-from recorders.video_capture import VideoCapture
 
-# Read the config
-config = configparser.ConfigParser()
-config.read(paths_factory.config_file_path())
+# Read the compiled config, it's only parsed again if config.ini changed
+config = settings.load()
+
+# List stored snapshots page by page if requested
+if builtins.howdy_args.arguments and builtins.howdy_args.arguments[0] == "list":
+	page = 1
+	if len(builtins.howdy_args.arguments) > 1:
+		try:
+			page = max(1, int(builtins.howdy_args.arguments[1]))
+		except ValueError:
+			print(_("Please give the page number as a number"))
+			sys.exit(1)
+
+	entries = snapshot.SnapshotStore(config).page(page)
+
+	if not entries:
+		if not builtins.howdy_args.plain:
+			print(_("No snapshots on page {}").format(page))
+		sys.exit(0)
+
+	# Print a header if we're not in plain mode
+	if not builtins.howdy_args.plain:
+		print(_("Snapshots, page {}:").format(page))
+		print("\n\033[1;29m" + _("Date                 Size      Label                 File\033[0m"))
+
+	for entry in entries:
+		date = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"]))
+
+		if builtins.howdy_args.plain:
+			print(",".join([date, str(entry["size"]), entry["label"], entry["file"]]))
+		else:
+			size = str(round(entry["size"] / 1024)) + " KiB"
+			print(date + "  " + size.ljust(8) + "  " + entry["label"].ljust(20) + "  " + entry["file"])
+
+	print()
+	sys.exit(0)
+
+# Only import the camera code when we need it, listing doesn't
+from recorders.video_capture import VideoCapture
 
 # Start video capture
 video_capture = VideoCapture(config)
@@ -43,7 +80,7 @@ file = snapshot.generate(frames, [
 	_("Date: ") + datetime.now(timezone.utc).strftime("%Y/%m/%d %H:%M:%S UTC"),
 	_("Dark threshold config: ") + str(config.getfloat("video", "dark_threshold", fallback=60.0)),
 	_("Certainty config: ") + str(config.getfloat("video", "certainty", fallback=3.5))
-])
+], config)
 
 # Show the file location in console
 print(_("Generated snapshot saved as"))
@@ -4,27 +4,32 @@ from __future__ import annotations
 import builtins
 
 # Import required modules
-import configparser
-import json
 import sys
 import time
+from collections import deque
 from typing import Any
 
-import cv2
-import numpy as np
-
-import paths_factory
+import settings
 from i18n import _
-from recorders.video_capture import VideoCapture
 
-# Read config from disk
-config = configparser.ConfigParser()
-config.read(paths_factory.config_file_path())
+# Amount of frames between two checks of whether the camera looks like an infrared camera
+IR_CHECK_INTERVAL = 30
+
+# Read the compiled config, it's only parsed again if config.ini changed
+config = settings.load()
 
 if config.get("video", "recording_plugin", fallback="opencv") != "opencv":
-	print(_("Howdy has been configured to use a recorder which doesn't support the test command yet, aborting"))
+	print(_("Howdy has been configured to use a recorder which doesn't support the test window yet, use --benchmark to test it without one"))
 	sys.exit(12)
 
+# Only load OpenCV and the camera code once we know the test can run
+import cv2
+
+from model_store import ModelStore
+from recorders import ir_analysis
+from recorders.camera_controls import CameraControls
+from recorders.video_capture import VideoCapture
+
 video_capture = VideoCapture(config)
 
 # Read config values to use in the main loop
@@ -32,6 +37,11 @@ video_certainty = config.getfloat("video", "certainty", fallback=3.5) / 10
 exposure = config.getint("video", "exposure", fallback=-1)
 dark_threshold = config.getfloat("video", "dark_threshold", fallback=60)
 
+# Keep the configured exposure applied without setting it on every frame
+camera_controls = CameraControls(video_capture)
+if exposure != -1:
+	camera_controls.request_exposure(exposure)
+
 # Let the user know what's up
 print(_("""
 Opening a window with a test feed
@@ -57,23 +67,21 @@ def print_text(line_number: int, text: str) -> None:
 
 use_cnn = config.getboolean('core', 'use_cnn', fallback=False)
 
-from recog import create_backend
+from recog import EncodingMatcher, create_backend
 
 backend = create_backend(use_cnn=use_cnn)
 
-encodings = []
 models = None
 
 try:
 	user = builtins.howdy_user
-	with open(paths_factory.user_model_path(user)) as f:
-		models = json.load(f)
-
-	for model in models:
-		encodings += model["data"]
+	models = ModelStore(user).load()
 except FileNotFoundError:
 	pass
 
+# Build the matcher once, it's reused for every face in every frame
+matcher = EncodingMatcher(models or [])
+
 clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
 
 # Open the window and attach a a mouse listener
@@ -92,6 +100,9 @@ fps = 0
 sec = int(time.time())
 # recognition time
 rec_tm = 0
+# The last few frames and how much they look like they come from an infrared camera
+ir_frames = deque(maxlen=ir_analysis.IR_FRAMES)
+ir_score = 0.0
 
 # Wrap everything in an keyboard interrupt handler
 try:
@@ -146,6 +157,13 @@ try:
 		print_text(1, _("FPS: %d") % (fps, ))
 		print_text(2, _("FRAMES: %d") % (total_frames, ))
 		print_text(3, _("RECOGNITION: %dms") % (round(rec_tm * 1000), ))
+		print_text(4, _("CONTROLS: %dms (%d writes)") % (round(camera_controls.time * 1000), camera_controls.writes))
+
+		# Judge the camera on the last few frames every now and then
+		ir_frames.append(orig_frame)
+		if total_frames % IR_CHECK_INTERVAL == 1:
+			ir_score = ir_analysis.analyze(list(ir_frames))["score"]
+		print_text(5, _("IR SCORE: %.2f") % (ir_score, ))
 
 		# Show that slow mode is on, if it's on
 		if slow_mode:
@@ -186,12 +204,8 @@ try:
 					face_landmark = backend.get_landmarks(orig_frame, loc)
 					face_encoding = backend.compute_encoding(orig_frame, face_landmark, 1)
 
-					# Match this found face against a known face
-					matches = np.linalg.norm(encodings - face_encoding, axis=1)
-
-					# Get best match
-					match_index = np.argmin(matches)
-					match = matches[match_index]
+					# Match this found face against the known faces
+					match_index, match = matcher.match(face_encoding)
 
 					# If a model matches
 					if 0 < match < video_certainty:
@@ -199,7 +213,7 @@ try:
 						color = (0, 230, 0)
 
 						# Print the name of the model next to the circle
-						circle_text = "{} (certainty: {})".format(models[match_index]["label"], round(match * 10, 3))
+						circle_text = "{} (certainty: {})".format(models[matcher.model_index(match_index)]["label"], round(match * 10, 3))
 						cv2.putText(overlay, circle_text, (int(x + r / 3), y - r), cv2.FONT_HERSHEY_SIMPLEX, .3, (0, 255, 0), 0, cv2.LINE_AA)
 					# If no approved matches, show red text
 					else:
@@ -226,14 +240,8 @@ try:
 		if slow_mode:
 			time.sleep(max([.5 - frame_time, 0.0]))
 
-		if exposure != -1:
-			# For a strange reason on some cameras (e.g. Lenoxo X1E)
-			# setting manual exposure works only after a couple frames
-			# are captured and even after a delay it does not
-			# always work. Setting exposure at every frame is
-			# reliable though.
-			video_capture.internal.set(cv2.CAP_PROP_AUTO_EXPOSURE, 1.0)  # 1 = Manual
-			video_capture.internal.set(cv2.CAP_PROP_EXPOSURE, float(exposure))
+		# Make sure the camera still uses the configured controls
+		camera_controls.verify()
 
 # On ctrl+C
 except KeyboardInterrupt:
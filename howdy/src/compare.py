@@ -12,8 +12,6 @@ timings = {
 
 # Import required modules
 import atexit
-import configparser
-import json
 import os
 import subprocess
 import sys
@@ -23,19 +21,44 @@ from datetime import datetime, timezone
 import cv2
 import numpy as np
 
+import calibration
 import paths_factory
+import settings
 import snapshot
+from deferred import DeferredWork
 from i18n import _
+from model_stats import ModelStats
+from model_store import ModelStore
+from recog import EncodingMatcher
+from recog.fusion import ScoreFusion
+from recorders.camera_controls import CameraControls
 from recorders.video_capture import VideoCapture
+from ui_channel import UIChannel
+
+# Highest amount of times per second the auth ui is updated
+UI_MAX_RATE = 10
+
+# Guards starting the auth ui against exiting at the same time
+ui_lock = threading.Lock()
+ui_closed = False
+
+# Snapshots and other writes that don't affect the result, run by a separate process on exit.
+# Started from atexit, so the work is also handed off when rubberstamps exit or an error ends compare
+deferred = DeferredWork()
+atexit.register(deferred.start)
 
 
 def exit(code: int | None = None) -> None:
 	"""Exit while closing howdy-gtk properly"""
-	global gtk_proc
+	global gtk_proc, ui_closed
 
-	# Exit the auth ui process if there is one
-	if "gtk_proc" in globals():
-		gtk_proc.terminate()
+	with ui_lock:
+		# Make sure the auth ui isn't started anymore while exiting
+		ui_closed = True
+
+		# Exit the auth ui process if there is one
+		if "gtk_proc" in globals():
+			gtk_proc.terminate()
 
 	# Exit compare
 	if code is not None:
@@ -60,10 +83,15 @@ def init_detector(lock: threading.Lock) -> None:
 	timings["ll"] = time.time() - timings["ll"]
 	lock.release()
 
+	# Load the rubberstamps while the camera is still scanning, so they're ready when a face matches
+	if config.getboolean("rubberstamps", "enabled", fallback=False):
+		import rubberstamps
+		rubberstamps.preload(config)
+
 
 def make_snapshot(type: str) -> None:
 	"""Generate snapshot after detection"""
-	snapshot.generate(snapframes, [
+	deferred.add_snapshot(snapframes.frames(), [
 		type + _(" LOGIN"),
 		_("Date: ") + datetime.now(timezone.utc).strftime("%Y/%m/%d %H:%M:%S UTC"),
 		_("Scan time: ") + str(round(time.time() - timings["fr"], 2)) + "s",
@@ -73,22 +101,40 @@ def make_snapshot(type: str) -> None:
 	])
 
 
-def send_to_ui(type: str, message: str) -> None:
-	"""Send message to the auth ui"""
+def save_calibration() -> None:
+	"""Store what was learned about the camera in this attempt for the next one"""
+	lit_frames = valid_frames - dark_tries
+	device_calibration.record_darkness(
+		lit_darkness_total / lit_frames if lit_frames else None,
+		(dark_running_total - lit_darkness_total) / dark_tries if dark_tries else None)
+
+	# Written after the result is in, by the same process that makes snapshots
+	deferred.add("calibration", device_path=device_calibration.device_path, data=device_calibration.to_dict())
+
+
+def start_ui() -> None:
+	"""Start the auth ui, unless it's already running or compare is exiting"""
 	global gtk_proc
 
-	# Only execute of the process started
-	if "gtk_proc" in globals():
-		# Format message so the ui can parse it
-		message = type + "=" + message + " \n"
+	with ui_lock:
+		if ui_closed or "gtk_proc" in globals():
+			return
 
-		# Try to send the message to the auth ui, but it's okay if that fails
+		# Start the auth ui, register it to be always be closed on exit
 		try:
-			if gtk_proc.poll() is None: # Make sure the gtk_proc is still running before write into the pipe
-				gtk_proc.stdin.write(bytearray(message.encode("utf-8")))
-				gtk_proc.stdin.flush()
-		except IOError:
-			pass
+			gtk_proc = subprocess.Popen(["howdy-gtk", "--start-auth-ui"], stdin=subprocess.PIPE, stdout=gtk_pipe, stderr=gtk_pipe)
+			atexit.register(exit)
+		except FileNotFoundError:
+			return
+
+	# Show the ui what we've been up to so far
+	ui_channel.attach(gtk_proc)
+
+
+def send_to_ui(type: str, message: str) -> None:
+	"""Send message to the auth ui"""
+	# Messages are merged and written in the background, so this never waits on the ui
+	ui_channel.send(type, message)
 
 
 # Make sure we were given an username to test against
@@ -99,16 +145,16 @@ if len(sys.argv) < 2:
 user = sys.argv[1]
 # The model file contents
 models = []
-# Encoded face models
-encodings = []
+# Matcher over all known face encodings
+matcher = None
 # Amount of ignored 100% black frames
 black_tries = 0
 # Amount of ignored dark frames
 dark_tries = 0
 # Total amount of frames captured
 frames = 0
-# Captured frames for snapshot capture
-snapframes = []
+# Keeps the most useful frames for snapshots, if enabled
+snapframes = None
 # Tracks the lowest certainty value in the loop
 lowest_certainty = 10
 # Face recognition/detection backend
@@ -116,11 +162,8 @@ backend = None
 
 # Try to load the face model from the models folder
 try:
-	with open(paths_factory.user_model_path(user)) as f:
-		models = json.load(f)
-
-	for model in models:
-		encodings += model["data"]
+	store = ModelStore(user)
+	models = store.load()
 except FileNotFoundError:
 	exit(10)
 
@@ -128,30 +171,46 @@ except FileNotFoundError:
 if len(models) < 1:
 	exit(10)
 
-# Read config from disk
-config = configparser.ConfigParser()
-config.read(paths_factory.config_file_path())
+# Check the most used models first, the matcher can stop at the first good enough match
+model_stats = ModelStats.load(user)
+models = model_stats.order(models)
+
+# Build the matcher once, it's reused for every face in every frame
+matcher = EncodingMatcher(models)
+
+# Read the compiled config, it's only parsed again if config.ini changed
+config = settings.load()
 
 # Get all config values needed
 use_cnn = config.getboolean("core", "use_cnn", fallback=False)
 timeout = config.getint("video", "timeout", fallback=4)
-dark_threshold = config.getfloat("video", "dark_threshold", fallback=50.0)
+dark_threshold = config.getfloat("video", "dark_threshold", fallback=60.0)
 video_certainty = config.getfloat("video", "certainty", fallback=3.5) / 10
 end_report = config.getboolean("debug", "end_report", fallback=False)
 save_failed = config.getboolean("snapshots", "save_failed", fallback=False)
 save_successful = config.getboolean("snapshots", "save_successful", fallback=False)
 gtk_stdout = config.getboolean("debug", "gtk_stdout", fallback=False)
+auth_ui_delay = config.getfloat("core", "auth_ui_delay", fallback=1.0)
 rotate = config.getint("video", "rotate", fallback=0)
+fusion_frames = config.getint("video", "fusion_frames", fallback=0)
+fusion_certainty = config.getfloat("video", "fusion_certainty", fallback=3.8) / 10
+exposure = config.getint("video", "exposure", fallback=-1)
+max_height = config.getfloat("video", "max_height", fallback=320.0)
 
 # Send the gtk output to the terminal if enabled in the config
 gtk_pipe = sys.stdout if gtk_stdout else subprocess.DEVNULL
 
-# Start the auth ui, register it to be always be closed on exit
-try:
-	gtk_proc = subprocess.Popen(["howdy-gtk", "--start-auth-ui"], stdin=subprocess.PIPE, stdout=gtk_pipe, stderr=gtk_pipe)
-	atexit.register(exit)
-except FileNotFoundError:
-	pass
+# Channel to the auth ui, updates are merged and written at most UI_MAX_RATE times a second
+ui_channel = UIChannel(None, UI_MAX_RATE)
+
+# Only start the auth ui if recognition takes longer than the configured delay,
+# so quick matches don't have to share the CPU with starting it
+if auth_ui_delay > 0:
+	ui_timer = threading.Timer(auth_ui_delay, start_ui)
+	ui_timer.daemon = True
+	ui_timer.start()
+else:
+	start_ui()
 
 # Write to the stdin to redraw ui
 send_to_ui("M", _("Starting up..."))
@@ -172,8 +231,17 @@ timings["ic"] = time.time()
 
 video_capture = VideoCapture(config)
 
-# Read exposure from config to use in the main loop
-exposure = config.getint("video", "exposure", fallback=-1)
+# Load what we learned about this camera in previous attempts
+device_calibration = calibration.load(config.get("video", "device_path"))
+
+# Keep the configured exposure applied without setting it on every frame
+camera_controls = CameraControls(video_capture)
+if exposure != -1:
+	camera_controls.request_exposure(exposure)
+
+	# If this exposure worked before, apply it right away instead of after the first frame
+	if device_calibration.exposure == exposure:
+		camera_controls.apply()
 
 # Note the time it took to open the camera
 timings["ic"] = time.time() - timings["ic"]
@@ -183,8 +251,9 @@ lock.acquire()
 lock.release()
 del lock
 
-# Fetch the max frame height
-max_height = config.getfloat("video", "max_height", fallback=320.0)
+# If snapshots have been turned on, keep the 3 best frames of the attempt
+if save_failed or save_successful:
+	snapframes = snapshot.FrameSelector(3, max_height)
 
 # Get the height of the image (which would be the width if screen is portrait oriented)
 height = video_capture.internal.get(cv2.CAP_PROP_FRAME_HEIGHT) or 1
@@ -193,22 +262,33 @@ if rotate == 2:
 # Calculate the amount the image has to shrink
 scaling_factor = (max_height / height) or 1
 
-# Fetch config settings out of the loop
-timeout = config.getint("video", "timeout", fallback=4)
-dark_threshold = config.getfloat("video", "dark_threshold", fallback=60)
-end_report = config.getboolean("debug", "end_report", fallback=False)
-
 # Initiate histogram equalization
 clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
 
+# The orientations to check frames in, the one that matched last time goes first
+rotations = [None]
+if rotate == 1:
+	rotations = device_calibration.rotations([cv2.ROTATE_90_COUNTERCLOCKWISE, cv2.ROTATE_90_CLOCKWISE, None])
+elif rotate == 2:
+	rotations = device_calibration.rotations([cv2.ROTATE_90_CLOCKWISE, cv2.ROTATE_90_COUNTERCLOCKWISE])
+
+# Follow faces over multiple frames if enabled, so they can be judged on their average distance
+fusion = ScoreFusion(fusion_frames, fusion_certainty) if fusion_frames > 1 else None
+
+# Frames at the start that were unlit in every recent attempt, these are grabbed but not processed
+skip_frames = device_calibration.skippable_frames()
+
 # Let the ui know that we're ready
 send_to_ui("M", _("Identifying you..."))
 
 # Start the read loop
 frames = 0
 valid_frames = 0
+scanned_frames = 0
+lit_frame = 0
 timings["fr"] = time.time()
 dark_running_total = 0
+lit_darkness_total = 0
 
 while True:
 	# Increment the frame count every loop
@@ -227,22 +307,31 @@ while True:
 		if save_failed:
 			make_snapshot(_("FAILED"))
 
+		save_calibration()
+
 		if dark_tries == valid_frames:
 			print(_("All frames were too dark, please check dark_threshold in config"))
 			print(_("Average darkness: {avg}, Threshold: {threshold}").format(avg=str(dark_running_total / max(1, valid_frames)), threshold=str(dark_threshold)))
+			if device_calibration.darkness["lit"] is not None:
+				print(_("Average darkness of usable frames in earlier attempts: {avg}").format(avg=str(device_calibration.darkness["lit"])))
 			exit(13)
 		else:
 			exit(11)
 
+	# Frames that were never lit in earlier attempts are only grabbed to keep the stream moving
+	if frames <= skip_frames:
+		video_capture.internal.grab()
+		continue
+
 	# Grab a single frame of video
 	frame, gsframe = video_capture.read_frame()
 	gsframe = clahe.apply(gsframe)
 
-	# If snapshots have been turned on
-	if save_failed or save_successful:
-		# Start capturing frames for the snapshot
-		if len(snapframes) < 3:
-			snapframes.append(frame)
+	# Make sure the camera still uses the configured controls
+	camera_controls.verify()
+
+	# Keep the frame as captured for snapshots
+	raw_frame = frame
 
 	# Create a histogram of the image with 8 values
 	hist = cv2.calcHist([gsframe], [0], None, [8], [0, 256])
@@ -250,7 +339,10 @@ while True:
 	hist_total = np.sum(hist)
 
 	# Calculate frame darkness
-	darkness = (hist[0] / hist_total * 100)
+	darkness = float(hist[0][0] / hist_total * 100)
+
+	# Score of this frame for snapshots, lit frames are preferred and frames with a close face even more
+	snapshot_score = 1 + darkness / 100
 
 	# If the image is fully black due to a bad camera read,
 	# skip to the next frame
@@ -265,31 +357,36 @@ while True:
 	# skip to the next frame
 	if (darkness > dark_threshold):
 		dark_tries += 1
+
+		if snapframes:
+			snapframes.offer(raw_frame, snapshot_score)
 		continue
 
+	lit_darkness_total += darkness
+
+	# Remember when the first lit frame arrived, so the next attempt can skip the frames before it
+	if not lit_frame:
+		lit_frame = frames
+		# If the first processed frame was already lit, probe one frame earlier next time
+		# in case the camera became faster
+		if frames == skip_frames + 1 and skip_frames > 0:
+			lit_frame -= 1
+		device_calibration.record_lit_frame(lit_frame, time.time() - timings["fr"])
+
 	# If the height is too high
 	if scaling_factor != 1:
 		# Apply that factor to the frame
 		frame = cv2.resize(frame, None, fx=scaling_factor, fy=scaling_factor, interpolation=cv2.INTER_AREA)
 		gsframe = cv2.resize(gsframe, None, fx=scaling_factor, fy=scaling_factor, interpolation=cv2.INTER_AREA)
 
-	# If camera is configured to rotate = 1, check portrait in addition to landscape
-	if rotate == 1:
-		if frames % 3 == 1:
-			frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-			gsframe = cv2.rotate(gsframe, cv2.ROTATE_90_COUNTERCLOCKWISE)
-		if frames % 3 == 2:
-			frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-			gsframe = cv2.rotate(gsframe, cv2.ROTATE_90_CLOCKWISE)
-
-	# If camera is configured to rotate = 2, check portrait orientation
-	elif rotate == 2:
-		if frames % 2 == 0:
-			frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-			gsframe = cv2.rotate(gsframe, cv2.ROTATE_90_COUNTERCLOCKWISE)
-		else:
-			frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-			gsframe = cv2.rotate(gsframe, cv2.ROTATE_90_CLOCKWISE)
+	# Cycle through the configured orientations, rotate = 1 checks portrait in addition to landscape
+	# and rotate = 2 checks portrait orientation only
+	rotation = rotations[scanned_frames % len(rotations)]
+	scanned_frames += 1
+
+	if rotation is not None:
+		frame = cv2.rotate(frame, rotation)
+		gsframe = cv2.rotate(gsframe, rotation)
 
 	# Get all faces from that frame as encodings
 	# Upsamples 1 time
@@ -300,19 +397,20 @@ while True:
 		face_landmark = backend.get_landmarks(frame, fl)
 		face_encoding = backend.compute_encoding(frame, face_landmark, 1)
 
-		# Match this found face against a known face
-		matches = np.linalg.norm(encodings - face_encoding, axis=1)
-
-		# Get best match
-		match_index = np.argmin(matches)
-		match = matches[match_index]
+		# Match this found face against the known faces, stopping early if a good enough match is found
+		match_index, match = matcher.match(face_encoding, video_certainty)
 
 		# Update certainty if we have a new low
 		if lowest_certainty > match:
 			lowest_certainty = match
 
-		# Check if a match that's confident enough
-		if 0 < match < video_certainty:
+		snapshot_score = min(snapshot_score, match)
+
+		# Add the distance to the track of this face, so it can be judged over the last few frames
+		track = fusion.add(fl, match, scanned_frames, rotation) if fusion else None
+
+		# Check if a match that's confident enough, either in this frame alone or averaged over the last few
+		if 0 < match < video_certainty or (track and fusion.accepts(track)):
 			timings["tt"] = time.time() - timings["st"]
 			timings["fl"] = time.time() - timings["fr"]
 
@@ -329,6 +427,7 @@ while True:
 				print_timing(_("  Opening the camera"), "ic")
 				print_timing(_("  Importing recognition libs"), "ll")
 				print_timing(_("Searching for known face"), "fl")
+				print(_("  Camera controls: %dms (%d checks, %d writes)") % (round(camera_controls.time * 1000), camera_controls.checks, camera_controls.writes))
 				print_timing(_("Total time"), "tt")
 
 				print(_("\nResolution"))
@@ -344,32 +443,65 @@ while True:
 				print(_("Dark frames ignored: %d ") % (dark_tries, ))
 				print(_("Certainty of winning frame: %.3f") % (match * 10, ))
 
-				print(_("Winning model: %d (\"%s\")") % (match_index, models[match_index]["label"]))
+				model_index = matcher.model_index(match_index)
+				print(_("Winning model: %d (\"%s\")") % (models[model_index]["id"], models[model_index]["label"]))
+
+				if track:
+					print(_("Fused certainty: %.3f over %d frames") % (track.fused() * 10, len(track.distances)))
+					print(_("Fused scores (frame, face, certainty, fused):"))
+					for frame_number, track_id, distance, fused in fusion.log:
+						print("  %d, %d, %.3f, %.3f" % (frame_number, track_id, distance * 10, fused * 10))
+
+				print(_("\nCalibration"))
+				print(_("  Unlit frames skipped: %d") % (skip_frames, ))
+				print(_("  First lit frame: %d") % (lit_frame, ))
+
+			# Remember what worked for this camera
+			device_calibration.orientation = rotation
+			if exposure != -1:
+				device_calibration.exposure = exposure
+			save_calibration()
+
+			# Count which encoding matched and how well, for ordering models and compacting them.
+			# Written after the result is in, and dropped if the models changed in the meantime
+			model_index, encoding_index = matcher.position(match_index)
+			deferred.add(
+				"stats", user=user, model_id=models[model_index]["id"], encoding_index=encoding_index,
+				distance=match, version=store.loaded_version)
 
 			# Make snapshot if enabled
 			if save_successful:
+				snapframes.offer(raw_frame, snapshot_score)
 				make_snapshot(_("SUCCESSFUL"))
 
 			# Run rubberstamps if enabled
 			if config.getboolean("rubberstamps", "enabled", fallback=False):
 				import rubberstamps
 
+				# Stamps may need to ask the user something, so start the ui if the match was quick
+				start_ui()
 				send_to_ui("S", "")
 
 				if "gtk_proc" not in vars():
 					gtk_proc = None
 
 				rubberstamps.execute(config, gtk_proc, {
+					"ui_channel": ui_channel,
 					"video_capture": video_capture,
 					"backend": backend,
-					"clahe": clahe
+					"clahe": clahe,
+					"frame": frame,
+					"gsframe": gsframe,
+					"face": fl,
+					"landmarks": face_landmark,
+					"scaling_factor": scaling_factor,
+					"rotation": rotation,
+					"dark_threshold": dark_threshold
 				})
 
 			# End peacefully
 			exit(0)
 
-	if exposure != -1:
-		# For a strange reason on some cameras (e.g. Lenoxo X1E) setting manual exposure works only after a couple frames
-		# are captured and even after a delay it does not always work. Setting exposure at every frame is reliable though.
-		video_capture.internal.set(cv2.CAP_PROP_AUTO_EXPOSURE, 1.0)  # 1 = Manual
-		video_capture.internal.set(cv2.CAP_PROP_EXPOSURE, float(exposure))
+	# Offer the frame for snapshots now that we know how close the faces in it were
+	if snapframes:
+		snapframes.offer(raw_frame, snapshot_score)
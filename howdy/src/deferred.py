@@ -0,0 +1,145 @@
+# Work that compare hands to a separate process, so it never holds up the result of an attempt
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any
+
+import paths_factory
+from model_store import make_private_dir
+
+
+class DeferredWork:
+	"""
+	Tasks that are collected during an attempt and run once compare is done.
+
+	The tasks are written to a payload file in the cache directory, frames for snapshots to
+	an .npz file next to it. A new Python process is spawned in its own session to run them,
+	so it shares no threads or locks with compare and PAM doesn't wait for it.
+	"""
+
+	def __init__(self) -> None:
+		self.tasks: list[dict[str, Any]] = []
+		# Frames of the snapshot to generate, if any
+		self.frames: list[Any] = []
+
+	def add(self, task: str, **arguments: Any) -> None:
+		"""Queue a task, the arguments have to be JSON serializable"""
+		self.tasks.append(dict(arguments, task=task))
+
+	def add_snapshot(self, frames: list[Any], text_lines: list[str]) -> None:
+		"""Queue generating a snapshot, only one snapshot is made per attempt"""
+		if len(frames) == 0:
+			return
+
+		self.frames = frames
+		self.add("snapshot", text_lines=text_lines)
+
+	def start(self) -> None:
+		"""
+		Spawn the process that runs the queued tasks. If that's not possible, for example because
+		the cache directory can't be written, the tasks are dropped rather than run here, as
+		they're never worth holding up the result for.
+		"""
+		if not self.tasks:
+			return
+
+		tasks, self.tasks = self.tasks, []
+		frames, self.frames = self.frames, []
+		written = []
+
+		try:
+			cache_dir = str(paths_factory.cache_dir_path())
+			make_private_dir(cache_dir)
+
+			payload = {"tasks": tasks, "frames": None}
+
+			if frames:
+				import numpy as np
+
+				fd, payload["frames"] = tempfile.mkstemp(prefix="deferred-", suffix=".npz", dir=cache_dir)
+				written.append(payload["frames"])
+				with os.fdopen(fd, "wb") as f:
+					np.savez(f, *frames)
+
+			fd, payload_path = tempfile.mkstemp(prefix="deferred-", suffix=".json", dir=cache_dir)
+			written.append(payload_path)
+			with os.fdopen(fd, "w") as f:
+				json.dump(payload, f)
+
+			subprocess.Popen(
+				[sys.executable, os.path.abspath(__file__), payload_path],
+				stdin=subprocess.DEVNULL,
+				stdout=subprocess.DEVNULL,
+				stderr=subprocess.DEVNULL,
+				start_new_session=True)
+		except OSError:
+			# Nothing will pick the payload up, so don't leave it behind
+			for path in written:
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+
+
+def run(tasks: list[dict[str, Any]], frames: list[Any]) -> None:
+	"""Run tasks, a failing task doesn't stop the others"""
+	for task in tasks:
+		try:
+			_run_task(task, frames)
+		except Exception:
+			continue
+
+
+def _run_task(task: dict[str, Any], frames: list[Any]) -> None:
+	"""Run a single task"""
+	if task["task"] == "calibration":
+		import calibration
+
+		calibration.save(calibration.DeviceCalibration(task["device_path"], task["data"]))
+
+	elif task["task"] == "stats":
+		import model_stats
+
+		model_stats.record(task["user"], task["model_id"], task["encoding_index"], task["distance"], task["version"])
+
+	elif task["task"] == "snapshot":
+		import settings
+		import snapshot
+
+		snapshot.generate(frames, task["text_lines"], settings.load())
+
+
+def _run_payload(payload_path: str) -> None:
+	"""Run the tasks in a payload file, and remove it and its frames afterwards"""
+	frames_path = None
+
+	try:
+		with open(payload_path) as f:
+			payload = json.load(f)
+
+		frames = []
+		frames_path = payload.get("frames")
+
+		if frames_path:
+			import numpy as np
+
+			with np.load(frames_path) as data:
+				frames = [data["arr_" + str(index)] for index in range(len(data.files))]
+
+		# Snapshots are the slowest, so the small writes go first
+		run(sorted(payload["tasks"], key=lambda task: task["task"] == "snapshot"), frames)
+	finally:
+		for path in (payload_path, frames_path):
+			if path:
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+
+
+if __name__ == "__main__":
+	_run_payload(sys.argv[1])
@@ -0,0 +1,239 @@
+# Notices changes to config and model files, so long-lived processes only parse them again when needed
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import threading
+import time
+from typing import Any, Callable
+
+import settings
+
+# Flags for inotify_init1
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Events that mean a file got new contents or disappeared. Writes in progress (IN_MODIFY)
+# are left out, a file is only ready when it's closed or renamed into place
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Header of every inotify event: watch descriptor, mask, cookie and length of the name
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify() -> Any:
+	"""Load the inotify functions from libc, None if they're not available"""
+	try:
+		libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+		libc.inotify_init1.argtypes = [ctypes.c_int]
+		libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+		return libc
+	except (OSError, AttributeError):
+		return None
+
+
+class FileWatcher:
+	"""
+	Watches files through inotify and counts the changes to every one of them.
+
+	The directory of a file is watched rather than the file itself, as files that are replaced
+	by a rename get a new inode. Every file has a generation that goes up when it changes, so
+	any amount of caches can each check whether a file changed since they last read it.
+
+	Without inotify the files are compared to their last stat instead, which is still a lot
+	cheaper than parsing them.
+
+	Listeners are called with the set of changed files by whichever thread polls, so they
+	should hand the work over to their own thread if that matters.
+	"""
+
+	def __init__(self) -> None:
+		self.fd: int | None = None
+		# Directory and watched file names in it, by watch descriptor
+		self.watches: dict[int, tuple[str, set[str]]] = {}
+		# Amount of times every watched file changed
+		self.generations: dict[str, int] = {}
+		# Last stat of every file, only used without inotify
+		self.stats: dict[str, tuple[int, int, int] | None] = {}
+		# Functions called with the changed files after every poll that found changes
+		self.listeners: list[Callable[[set[str]], None]] = []
+
+		self._lock = threading.Lock()
+		self._libc = _load_inotify()
+
+		if self._libc:
+			fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+			if fd >= 0:
+				self.fd = fd
+
+	def fileno(self) -> int | None:
+		"""The inotify file descriptor to wait on in a main loop, None without inotify"""
+		return self.fd
+
+	def watch(self, path: str) -> None:
+		"""Start watching a file, it doesn't have to exist yet"""
+		path = os.path.abspath(path)
+		directory, name = os.path.split(path)
+
+		with self._lock:
+			if path in self.generations:
+				return
+
+			self.generations[path] = 0
+			self.stats[path] = _stat(path)
+
+			if self.fd is None:
+				return
+
+			# Adding a directory again returns the descriptor of the existing watch
+			wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+			if wd < 0:
+				return
+
+			self.watches.setdefault(wd, (directory, set()))[1].add(name)
+
+	def poll(self) -> set[str]:
+		"""Process pending changes without waiting, returns the watched files that changed"""
+		with self._lock:
+			if self.fd is None:
+				changed = self._poll_stats()
+			else:
+				changed = set()
+
+				while True:
+					try:
+						data = os.read(self.fd, 64 * 1024)
+					except BlockingIOError:
+						break
+
+					changed |= self._parse_events(data)
+
+		if changed:
+			for listener in self.listeners:
+				listener(changed)
+
+		return changed
+
+	def generation(self, path: str) -> int:
+		"""How often a watched file changed since it was first watched"""
+		self.poll()
+		return self.generations[os.path.abspath(path)]
+
+	def close(self) -> None:
+		"""Stop watching"""
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
+
+	def _parse_events(self, data: bytes) -> set[str]:
+		"""Count the changes in a buffer of inotify events, the lock must be held"""
+		changed = set()
+		offset = 0
+
+		while offset < len(data):
+			wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+			name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+			offset += EVENT_HEADER.size + length
+
+			# Events were lost, any file could have changed
+			if mask & IN_Q_OVERFLOW:
+				changed |= set(self.generations)
+				continue
+
+			if wd in self.watches and name in self.watches[wd][1]:
+				changed.add(os.path.join(self.watches[wd][0], name))
+
+		for path in changed:
+			self.generations[path] += 1
+
+		return changed
+
+	def _poll_stats(self) -> set[str]:
+		"""Compare every file to its last stat, the lock must be held"""
+		changed = set()
+
+		for path in self.generations:
+			stat = _stat(path)
+			if stat != self.stats[path]:
+				self.stats[path] = stat
+				self.generations[path] += 1
+				changed.add(path)
+
+		return changed
+
+
+class CachedFile:
+	"""
+	A value parsed from a file, only parsed again after the watcher saw the file change.
+
+	The time the last load took is kept in reload_time. If a report function is given, it's
+	called with the path and that time after every load.
+	"""
+
+	def __init__(
+		self,
+		watcher: FileWatcher,
+		path: str,
+		loader: Callable[[str], Any],
+		report: Callable[[str, float], None] | None = None,
+	) -> None:
+		self.watcher = watcher
+		self.path = path
+		self.loader = loader
+		self.report = report
+
+		self.value: Any = None
+		# Generation of the file the value was loaded from, -1 if it was never loaded
+		self.loaded_generation = -1
+		# Seconds the last load took and the amount of loads so far
+		self.reload_time = 0.0
+		self.loads = 0
+
+		# Held while checking and loading, so threads sharing the cache never load the file twice at once
+		self._lock = threading.Lock()
+
+		watcher.watch(path)
+
+	def stale(self) -> bool:
+		"""Whether the file changed since the value was loaded"""
+		return self.watcher.generation(self.path) != self.loaded_generation
+
+	def get(self) -> Any:
+		"""The value, parsed again only if the file changed. Safe to call from multiple threads"""
+		with self._lock:
+			generation = self.watcher.generation(self.path)
+
+			if generation != self.loaded_generation:
+				start = time.perf_counter()
+				self.value = self.loader(self.path)
+				self.reload_time = time.perf_counter() - start
+				self.loaded_generation = generation
+				self.loads += 1
+
+				if self.report:
+					self.report(self.path, self.reload_time)
+
+			return self.value
+
+
+def load_config(path: str) -> settings.Settings:
+	"""Parse and validate a config file, a loader for CachedFile. The watcher already caches it, so it's compiled directly"""
+	return settings.Settings.compile(path)
+
+
+def _stat(path: str) -> tuple[int, int, int] | None:
+	"""The parts of a stat that change when a file is written or replaced"""
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+
+	return stat.st_mtime_ns, stat.st_size, stat.st_ino
@@ -0,0 +1,109 @@
+# Usage statistics of face models, kept next to the model files
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any
+
+import paths_factory
+from model_store import ModelStore, write_json
+
+
+class ModelStats:
+	"""
+	How often and how well the models of a user matched, per model and per encoding.
+
+	Stored as <user>.stats in the models directory, keyed by model id. Statistics are only
+	a hint for ordering and compaction, so a missing or unreadable file is not an error.
+	"""
+
+	def __init__(self, user: str, data: dict | None = None) -> None:
+		self.user = user
+		# Hits per encoding, as a list per model id. Ids are strings, like JSON keys
+		self.encodings: dict[str, list[int]] = dict((data or {}).get("encodings", {}))
+		# Hit count, last use time and mean distance of every match, by model id
+		self.models: dict[str, dict[str, float]] = dict((data or {}).get("models", {}))
+
+	@classmethod
+	def load(cls, user: str) -> ModelStats:
+		"""Load the statistics of a user, or empty ones if there are none"""
+		try:
+			with open(paths_factory.user_stats_path(user)) as f:
+				return cls(user, json.load(f))
+		except (OSError, ValueError):
+			return cls(user)
+
+	def save(self, sync: bool = True) -> None:
+		"""
+		Write the statistics to disk, failures are not fatal. Writers should hold the lock of the
+		model store, so the statistics can't get out of step with the models they count.
+		"""
+		path = paths_factory.user_stats_path(self.user)
+
+		try:
+			write_json(path, {"encodings": self.encodings, "models": self.models}, sync)
+		except OSError:
+			pass
+
+	def record_hit(self, model_id: int, encoding_index: int, distance: float | None = None) -> None:
+		"""Count a match of an encoding, at the given distance if known"""
+		hits = self.encodings.setdefault(str(model_id), [])
+		hits += [0] * (encoding_index + 1 - len(hits))
+		hits[encoding_index] += 1
+
+		model = self.models.setdefault(str(model_id), {"hits": 0, "last_used": 0, "mean_distance": 0.0})
+		model["hits"] += 1
+		model["last_used"] = int(time.time())
+
+		# Keep a running mean, so old matches don't have to be stored
+		if distance is not None:
+			model["mean_distance"] += (distance - model["mean_distance"]) / model["hits"]
+
+	def hits(self, model_id: int, encoding_index: int) -> int:
+		"""The amount of times an encoding matched"""
+		hits = self.encodings.get(str(model_id), [])
+		return hits[encoding_index] if encoding_index < len(hits) else 0
+
+	def model(self, model_id: int | str) -> dict[str, float]:
+		"""The hit count, last use time and mean distance of a model, all 0 if it never matched"""
+		return self.models.get(str(model_id), {"hits": 0, "last_used": 0, "mean_distance": 0.0})
+
+	def order(self, models: list[dict[str, Any]]) -> list[dict[str, Any]]:
+		"""
+		Sort models so the most used ones come first, and the most recently used of those.
+		Matching can stop at the first good enough encoding, so the common case is found sooner.
+		"""
+		return sorted(models, key=lambda model: (-self.model(model["id"])["hits"], -self.model(model["id"])["last_used"]))
+
+	def forget(self, model_id: int | str) -> None:
+		"""Drop the statistics of a removed model"""
+		self.encodings.pop(str(model_id), None)
+		self.models.pop(str(model_id), None)
+
+
+def record(user: str, model_id: int, encoding_index: int, distance: float | None, version: int) -> None:
+	"""
+	Count a match in the stored statistics of a user. Encoding indexes only mean something for
+	the models they were matched against, so the hit is dropped if the models changed since the
+	given version, e.g. because they were compacted.
+	"""
+	try:
+		with ModelStore(user).locked() as current:
+			if current != version:
+				return
+
+			stats = ModelStats.load(user)
+			stats.record_hit(model_id, encoding_index, distance)
+			# Losing the latest hit in a crash is harmless, so don't wait for the disk
+			stats.save(sync=False)
+	except OSError:
+		pass
+
+
+def remove(user: str) -> None:
+	"""Delete the statistics of a user"""
+	try:
+		os.remove(paths_factory.user_stats_path(user))
+	except FileNotFoundError:
+		pass
@@ -0,0 +1,225 @@
+# Reads and writes face models, safe against concurrent access and crashes
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+from typing import Any, BinaryIO, Callable, Iterator
+
+import paths_factory
+
+# Width of the version counter in the lock file, always written whole in one write
+VERSION_WIDTH = 20
+
+
+class ModelsChanged(Exception):
+	"""The models were changed by another process since they were loaded"""
+
+
+def write_json(path: str, data: Any, sync: bool = True, mode: int = 0o644) -> None:
+	"""Atomically replace a file with JSON data, see atomic_write"""
+	atomic_write(path, lambda f: f.write(json.dumps(data).encode()), sync, mode)
+
+
+def atomic_write(path: str, write: Callable[[BinaryIO], Any], sync: bool = True, mode: int = 0o644) -> None:
+	"""
+	Atomically replace a file with what write writes to the given binary file. The data goes to a
+	uniquely named temporary file that's renamed over the original, so readers see either the old
+	or the new file, never a truncated one, and concurrent writers never write to the same
+	temporary file. The file gets the given mode before any data is written to it.
+
+	With sync, the file and the directory are synced as well, so a crash halfway leaves the old
+	file in place. Files that are only a hint can skip that.
+	"""
+	directory = os.path.dirname(path)
+	fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+
+	try:
+		os.fchmod(fd, mode)
+
+		with os.fdopen(fd, "wb") as f:
+			write(f)
+			if sync:
+				f.flush()
+				os.fsync(f.fileno())
+
+		os.replace(tmp_path, path)
+	except BaseException:
+		try:
+			os.remove(tmp_path)
+		except OSError:
+			pass
+		raise
+
+	if sync:
+		sync_dir(directory)
+
+
+def make_private_dir(path: str) -> None:
+	"""Create a directory only its owner can enter, and tighten it if it already exists more open"""
+	os.makedirs(path, mode=0o700, exist_ok=True)
+
+	if os.stat(path).st_mode & 0o077:
+		try:
+			os.chmod(path, 0o700)
+		except PermissionError:
+			pass
+
+
+def sync_dir(path: str) -> None:
+	"""Sync a directory, so a rename or removal in it survives a crash"""
+	fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+class ModelStore:
+	"""
+	The face models of a user, stored as <user>.dat in the models directory.
+
+	Writers hold an exclusive flock on <user>.lock, readers a shared one. The lock file also
+	holds a version counter that is raised on every change, so processes that keep models in
+	memory can cheaply check whether they have to reload them.
+	"""
+
+	def __init__(self, user: str) -> None:
+		self.user = user
+		self.path = paths_factory.user_model_path(user)
+		self.lock_path = paths_factory.user_model_lock_path(user)
+		# The version of the models as last loaded or written by this store
+		self.loaded_version = -1
+
+	def exists(self) -> bool:
+		"""Whether the user has any models"""
+		return os.path.isfile(self.path)
+
+	def version(self) -> int:
+		"""The current version counter, 0 if the models were never written through a store"""
+		try:
+			with open(self.lock_path, "rb") as f:
+				return _parse_version(f.read(VERSION_WIDTH))
+		except FileNotFoundError:
+			return 0
+
+	def changed(self) -> bool:
+		"""Whether the models changed since they were last loaded"""
+		return self.version() != self.loaded_version
+
+	def load(self) -> list[dict[str, Any]]:
+		"""Read the models, raises FileNotFoundError if the user has none"""
+		with self._lock(fcntl.LOCK_SH) as fd:
+			with open(self.path) as f:
+				models = json.load(f)
+
+			self.loaded_version = self._read_version(fd)
+
+		return models
+
+	def save(self, models: list[dict[str, Any]]) -> None:
+		"""Replace the models"""
+		with self._lock(fcntl.LOCK_EX) as fd:
+			self._write(fd, models)
+
+	def delete(self) -> None:
+		"""Remove all models. The lock file and its counter are kept, so caches still see the change"""
+		with self._lock(fcntl.LOCK_EX) as fd:
+			try:
+				os.remove(self.path)
+			except FileNotFoundError:
+				return
+
+			sync_dir(os.path.dirname(self.path))
+			self._bump(fd)
+
+	@contextlib.contextmanager
+	def update(self, expected_version: int | None = None) -> Iterator[list[dict[str, Any]]]:
+		"""
+		Change the models while holding the lock, so no other writer can get in between.
+
+		Yields the current models to be changed in place, they are written when the block ends
+		without an exception, or removed if the list was emptied. If an expected version is given
+		and the models have changed since, ModelsChanged is raised instead.
+		"""
+		with self._lock(fcntl.LOCK_EX) as fd:
+			if expected_version is not None and self._read_version(fd) != expected_version:
+				raise ModelsChanged(self.user)
+
+			try:
+				with open(self.path) as f:
+					models = json.load(f)
+			except FileNotFoundError:
+				models = []
+
+			yield models
+
+			if models:
+				self._write(fd, models)
+			elif self.exists():
+				os.remove(self.path)
+				sync_dir(os.path.dirname(self.path))
+				self._bump(fd)
+
+	@contextlib.contextmanager
+	def locked(self) -> Iterator[int]:
+		"""
+		Hold the exclusive lock without changing the models, yields their current version.
+		Files that refer to the models, like their statistics, are written under it to stay in step.
+		"""
+		with self._lock(fcntl.LOCK_EX) as fd:
+			yield self._read_version(fd)
+
+	@contextlib.contextmanager
+	def _lock(self, operation: int) -> Iterator[int | None]:
+		"""
+		Hold a flock on the lock file, yields its file descriptor. Only writers create the lock
+		file, readers that can't open it read without it, the atomic writes keep that safe.
+		"""
+		fd = None
+
+		try:
+			if operation == fcntl.LOCK_EX:
+				fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+			else:
+				fd = os.open(self.lock_path, os.O_RDONLY)
+		except OSError:
+			if operation == fcntl.LOCK_EX:
+				raise
+
+		try:
+			if fd is not None:
+				fcntl.flock(fd, operation)
+			yield fd
+		finally:
+			# Closing the file releases the lock
+			if fd is not None:
+				os.close(fd)
+
+	def _read_version(self, fd: int | None) -> int:
+		"""Read the version counter through the lock file if it's open"""
+		if fd is None:
+			return self.version()
+
+		return _parse_version(os.pread(fd, VERSION_WIDTH, 0))
+
+	def _write(self, fd: int, models: list[dict[str, Any]]) -> None:
+		"""Write the models and raise the version, the exclusive lock must be held"""
+		write_json(self.path, models)
+		self._bump(fd)
+
+	def _bump(self, fd: int) -> None:
+		"""Raise the version counter, the exclusive lock must be held"""
+		version = max(self._read_version(fd), 0) + 1
+		os.pwrite(fd, str(version).zfill(VERSION_WIDTH).encode(), 0)
+		self.loaded_version = version
+
+
+def _parse_version(content: bytes) -> int:
+	"""Parse a version counter, a missing one is 0"""
+	try:
+		return int(content or 0)
+	except ValueError:
+		return 0
@@ -29,6 +29,14 @@ def user_model_path(user: str) -> str:
     return str(paths.user_models_dir / f"{user}.dat")
 
 
+def user_model_lock_path(user: str) -> str:
+    return str(paths.user_models_dir / f"{user}.lock")
+
+
+def user_stats_path(user: str) -> str:
+    return str(paths.user_models_dir / f"{user}.stats")
+
+
 def config_file_path() -> str:
     return str(paths.config_dir / "config.ini")
 
@@ -47,3 +55,23 @@ def user_models_dir_path() -> PurePath:
 
 def logo_path() -> str:
     return str(paths.data_dir / "logo.png")
+
+
+def cache_dir_path() -> PurePath:
+    return paths.cache_dir
+
+
+def config_cache_path() -> str:
+    return str(paths.cache_dir / "config.json")
+
+
+def calibration_path() -> str:
+    return str(paths.cache_dir / "calibration.json")
+
+
+def calibration_lock_path() -> str:
+    return str(paths.cache_dir / "calibration.lock")
+
+
+def identify_index_path() -> str:
+    return str(paths.cache_dir / "identify.npz")
@@ -1,6 +1,7 @@
 from recog.backend import FaceRectangle, LandmarkPoint, LandmarkSet, RecognitionBackend
+from recog.matcher import EncodingMatcher
 
-__all__ = ["FaceRectangle", "LandmarkPoint", "LandmarkSet", "RecognitionBackend", "create_backend"]
+__all__ = ["EncodingMatcher", "FaceRectangle", "LandmarkPoint", "LandmarkSet", "RecognitionBackend", "create_backend"]
 
 
 def create_backend(use_cnn: bool = False) -> RecognitionBackend:
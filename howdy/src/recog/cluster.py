@@ -0,0 +1,58 @@
+# Group face encodings that are close together
+from __future__ import annotations
+
+import numpy as np
+import numpy.typing as npt
+
+
+def pairwise_distances(encodings: npt.ArrayLike) -> npt.NDArray:
+	"""Euclidean distances between every pair of encodings"""
+	matrix = np.asarray(encodings, dtype=np.float64)
+	norms = np.einsum("ij,ij->i", matrix, matrix)
+	squared = norms[:, None] + norms[None, :] - 2 * (matrix @ matrix.T)
+
+	# Rounding errors can make the squared distance of near identical encodings slightly negative
+	return np.sqrt(np.maximum(squared, 0))
+
+
+def agglomerate(encodings: npt.ArrayLike, max_clusters: int | None = None, merge_distance: float = 0.0) -> list[list[int]]:
+	"""
+	Cluster encodings with average linkage, returns the indexes of the members of every cluster.
+
+	The two closest clusters are merged as long as there are more than max_clusters of them,
+	or as long as they are closer than merge_distance.
+	"""
+	distances = pairwise_distances(encodings)
+	clusters = [[index] for index in range(len(distances))]
+
+	# Distances between clusters, a cluster that was merged away is at an infinite distance
+	linkage = distances.copy()
+	np.fill_diagonal(linkage, np.inf)
+
+	while len([cluster for cluster in clusters if cluster]) > 1:
+		a, b = np.unravel_index(np.argmin(linkage), linkage.shape)
+		closest = linkage[a, b]
+		remaining = len([cluster for cluster in clusters if cluster])
+
+		if not (max_clusters is not None and remaining > max_clusters) and not closest < merge_distance:
+			break
+
+		# The average distance to the merged cluster is the weighted average of both
+		size_a, size_b = len(clusters[a]), len(clusters[b])
+		merged = (linkage[a] * size_a + linkage[b] * size_b) / (size_a + size_b)
+		linkage[a, :] = merged
+		linkage[:, a] = merged
+		linkage[a, a] = np.inf
+		linkage[b, :] = np.inf
+		linkage[:, b] = np.inf
+
+		clusters[a] += clusters[b]
+		clusters[b] = []
+
+	return [cluster for cluster in clusters if cluster]
+
+
+def medoid(encodings: npt.ArrayLike, members: list[int]) -> int:
+	"""The member with the smallest total distance to the other members"""
+	matrix = np.asarray(encodings, dtype=np.float64)[members]
+	return members[int(np.argmin(pairwise_distances(matrix).sum(axis=1)))]
@@ -0,0 +1,81 @@
+# Turn a burst of frames of a face into a few representative encodings
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import numpy.typing as npt
+
+from recog.backend import FaceRectangle, RecognitionBackend
+from recog.cluster import agglomerate, medoid
+
+# Share of the collected frames, best first, that is encoded
+ENCODE_SHARE = 0.5
+
+# Backend used by worker processes, they inherit it when they are forked
+_backend: RecognitionBackend | None = None
+
+
+class FaceSample:
+	"""A face found in a frame collected for enrollment"""
+
+	def __init__(self, frame: npt.NDArray, gsframe: npt.NDArray, rect: FaceRectangle) -> None:
+		self.frame = frame
+		self.rect = rect
+		self.quality = face_quality(gsframe, rect)
+
+
+def face_quality(gsframe: npt.NDArray, rect: FaceRectangle) -> float:
+	"""Score a face on its sharpness and size, sharp and close faces give the most reliable encodings"""
+	top, bottom = max(rect.top(), 0), max(rect.bottom(), 0)
+	left, right = max(rect.left(), 0), max(rect.right(), 0)
+	face = gsframe[top:bottom, left:right].astype(np.float32)
+
+	if face.shape[0] < 2 or face.shape[1] < 2:
+		return 0.0
+
+	# Blurry faces have little variation between neighbouring pixels
+	sharpness = np.var(np.diff(face, axis=0)) + np.var(np.diff(face, axis=1))
+	return float(sharpness * np.sqrt(face.size))
+
+
+def encode_samples(backend: RecognitionBackend, samples: list[FaceSample], jitters: int = 1, workers: int = 1) -> list[npt.NDArray]:
+	"""
+	Encode the best share of the samples. With more than 1 worker the encodings are computed
+	in forked processes, which helps most when they are jittered.
+	"""
+	global _backend
+	_backend = backend
+
+	samples = sorted(samples, key=lambda sample: -sample.quality)
+	samples = samples[:max(1, int(len(samples) * ENCODE_SHARE))]
+
+	frames = [sample.frame for sample in samples]
+	rects = [sample.rect for sample in samples]
+
+	if workers <= 1 or len(samples) < 2:
+		return [_encode(frame, rect, jitters) for frame, rect in zip(frames, rects)]
+
+	with ProcessPoolExecutor(min(workers, len(samples)), mp_context=multiprocessing.get_context("fork")) as pool:
+		return list(pool.map(_encode, frames, rects, [jitters] * len(samples)))
+
+
+def representatives(encodings: list[npt.NDArray], count: int, merge_distance: float = 0.0) -> list[npt.NDArray]:
+	"""
+	Cluster the encodings into at most count groups and return the medoid of every group,
+	the largest group first. Groups closer than merge_distance are merged as well.
+	"""
+	if len(encodings) <= 1:
+		return list(encodings)
+
+	clusters = agglomerate(encodings, count, merge_distance)
+	clusters.sort(key=lambda members: -len(members))
+
+	return [encodings[medoid(encodings, members)] for members in clusters]
+
+
+def _encode(frame: npt.NDArray, rect: FaceRectangle, jitters: int) -> npt.NDArray:
+	"""Encode a single face, runs in a worker process when there's a pool"""
+	landmarks = _backend.get_landmarks(frame, rect)
+	return _backend.compute_encoding(frame, landmarks, jitters)
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Any
+
+from recog.backend import FaceRectangle
+
+# Minimal overlap between face rectangles in consecutive frames to consider them the same face
+MIN_OVERLAP = 0.3
+
+
+class FaceTrack:
+	"""Match distances of a single face followed over consecutive scanned frames"""
+
+	def __init__(self, track_id: int, rect: FaceRectangle, orientation: Any, window: int) -> None:
+		self.track_id = track_id
+		self.rect = rect
+		self.orientation = orientation
+		self.distances: deque[float] = deque(maxlen=window)
+		self.last_frame = 0
+
+	def fused(self) -> float:
+		"""Average distance over the frames in the window"""
+		return sum(self.distances) / len(self.distances)
+
+
+class ScoreFusion:
+	"""
+	Fuses per-frame match distances of the same face over the last few scanned frames.
+
+	Averaging several frames evens out noise from a single bad frame, so the fused distance can
+	be held to a slightly more lenient threshold than a single frame while being as reliable.
+	Faces are followed between frames by the overlap of their rectangles.
+	"""
+
+	def __init__(self, window: int, certainty: float) -> None:
+		# Amount of frames to average over, a face needs this many frames before it can be accepted
+		self.window = window
+		# Threshold for the fused distance
+		self.certainty = certainty
+		# All tracks that are still being followed
+		self.tracks: list[FaceTrack] = []
+		# Every fused score, as (frame number, track id, frame distance, fused distance)
+		self.log: list[tuple[int, int, float, float]] = []
+
+		self._next_id = 0
+
+	def add(self, rect: FaceRectangle, distance: float, frame_number: int, orientation: Any = None) -> FaceTrack:
+		"""Add the match distance of a face found in a frame, returns the track it belongs to"""
+		# Forget faces that have not been seen for a full window
+		self.tracks = [track for track in self.tracks if frame_number - track.last_frame <= self.window]
+
+		candidates = [track for track in self.tracks if track.orientation == orientation and track.last_frame < frame_number]
+		track = max(candidates, key=lambda track: _overlap(track.rect, rect), default=None)
+
+		if track is None or _overlap(track.rect, rect) < MIN_OVERLAP:
+			track = FaceTrack(self._next_id, rect, orientation, self.window)
+			self._next_id += 1
+			self.tracks.append(track)
+
+		track.rect = rect
+		track.last_frame = frame_number
+		track.distances.append(distance)
+
+		self.log.append((frame_number, track.track_id, distance, track.fused()))
+		return track
+
+	def accepts(self, track: FaceTrack) -> bool:
+		"""Whether the track has a full window of frames with a fused distance below the threshold"""
+		if len(track.distances) < self.window or min(track.distances) <= 0:
+			return False
+
+		return track.fused() < self.certainty
+
+
+def _overlap(a: FaceRectangle, b: FaceRectangle) -> float:
+	"""Intersection over union of two face rectangles"""
+	width = min(a.right(), b.right()) - max(a.left(), b.left())
+	height = min(a.bottom(), b.bottom()) - max(a.top(), b.top())
+
+	if width <= 0 or height <= 0:
+		return 0.0
+
+	intersection = width * height
+	area_a = (a.right() - a.left()) * (a.bottom() - a.top())
+	area_b = (b.right() - b.left()) * (b.bottom() - b.top())
+
+	return intersection / float(area_a + area_b - intersection)
@@ -0,0 +1,268 @@
+# Persistent index over the face encodings of all users, used to identify who is in front of the camera
+from __future__ import annotations
+
+import os
+from typing import BinaryIO
+
+import numpy as np
+import numpy.typing as npt
+
+import paths_factory
+from model_store import ModelStore, atomic_write, make_private_dir
+from recog.matcher import euclidean_distances
+
+# Above this many encodings searches go through an inverted file index instead of comparing against every encoding
+IVF_THRESHOLD = 2048
+# Amount of rows compared at once in exact searches, bounds memory use
+SEARCH_BLOCK_SIZE = 4096
+# Amount of k-means iterations when training the coarse quantizer
+KMEANS_ITERATIONS = 8
+# Retrain the coarse quantizer once the amount of encodings has grown by this factor since it was trained
+RETRAIN_GROWTH = 2.0
+
+
+class IdentificationIndex:
+	"""
+	Index over the encodings of every user model file.
+
+	Small sets are searched exactly in blocks. Once there are more than IVF_THRESHOLD encodings,
+	they are partitioned with k-means into inverted lists and only the lists closest to the query
+	are searched. The index is stored in the cache directory and updated incrementally: only model
+	files whose size or modification time changed are read again.
+	"""
+
+	def __init__(self) -> None:
+		self.matrix = np.zeros((0, 0), dtype=np.float32)
+		self.norms = np.zeros(0, dtype=np.float32)
+		# Per row: index into self.users and the id of the model the encoding belongs to
+		self.owners = np.zeros(0, dtype=np.int32)
+		self.model_ids = np.zeros(0, dtype=np.int32)
+		# Usernames with at least one encoding
+		self.users: list[str] = []
+		# The (mtime_ns, size) of every model file when it was indexed, by username
+		self.sources: dict[str, tuple[int, int]] = {}
+		# Coarse quantizer, empty when searches are exact
+		self.centroids = np.zeros((0, 0), dtype=np.float32)
+		self.assignments = np.zeros(0, dtype=np.int32)
+		self.trained_size = 0
+
+		self._lists: list[npt.NDArray] = []
+
+	def __len__(self) -> int:
+		return len(self.owners)
+
+	@classmethod
+	def load(cls) -> IdentificationIndex:
+		"""Load the stored index, or an empty one if there is none or it can't be read"""
+		index = cls()
+
+		try:
+			with np.load(paths_factory.identify_index_path()) as data:
+				index.matrix = data["matrix"]
+				index.owners = data["owners"]
+				index.model_ids = data["model_ids"]
+				index.users = [str(user) for user in data["users"]]
+				index.sources = {
+					str(name): (int(stat[0]), int(stat[1])) for name, stat in zip(data["source_names"], data["source_stats"])
+				}
+				index.centroids = data["centroids"]
+				index.assignments = data["assignments"]
+				index.trained_size = int(data["trained_size"])
+		except (OSError, KeyError, ValueError):
+			return cls()
+
+		index.norms = np.einsum("ij,ij->i", index.matrix, index.matrix)
+		index._build_lists()
+		return index
+
+	def save(self) -> None:
+		"""
+		Write the index to the cache directory, failures are not fatal. It holds the encodings of
+		every user, so it's only readable by root, like the model files it's built from.
+		"""
+		def write(f: BinaryIO) -> None:
+			np.savez(
+				f,
+				matrix=self.matrix,
+				owners=self.owners,
+				model_ids=self.model_ids,
+				users=np.array(self.users, dtype=str),
+				source_names=np.array(list(self.sources), dtype=str),
+				source_stats=np.array(list(self.sources.values()), dtype=np.int64).reshape(-1, 2),
+				centroids=self.centroids,
+				assignments=self.assignments,
+				trained_size=self.trained_size,
+			)
+
+		try:
+			make_private_dir(str(paths_factory.cache_dir_path()))
+			# The index can always be rebuilt from the models, so don't wait for the disk
+			atomic_write(paths_factory.identify_index_path(), write, sync=False, mode=0o600)
+		except OSError:
+			pass
+
+	def update(self) -> bool:
+		"""Bring the index in line with the model files on disk, returns True if anything changed"""
+		models_dir = str(paths_factory.user_models_dir_path())
+		current = {}
+
+		try:
+			filenames = os.listdir(models_dir)
+		except OSError:
+			filenames = []
+
+		for filename in filenames:
+			if not filename.endswith(".dat"):
+				continue
+
+			try:
+				stat = os.stat(os.path.join(models_dir, filename))
+			except OSError:
+				continue
+
+			current[filename[:-4]] = (stat.st_mtime_ns, stat.st_size)
+
+		if current == self.sources:
+			return False
+
+		# Keep the rows of users whose model file did not change
+		kept_users = sorted(user for user in self.users if current.get(user) == self.sources.get(user))
+		kept_owners = [self.users.index(user) for user in kept_users]
+		keep = np.isin(self.owners, kept_owners)
+
+		# Map the owners of the kept rows onto their place in the new users list
+		remap = np.zeros(len(self.users), dtype=np.int32)
+		remap[kept_owners] = np.arange(len(kept_users))
+
+		users = list(kept_users)
+		rows = [self.matrix[keep]] if keep.any() else []
+		owners = [remap[self.owners[keep]]]
+		model_ids = [self.model_ids[keep]]
+		assignments = self.assignments[keep] if len(self.centroids) else None
+
+		# Read the model files that are new or changed
+		for user in sorted(set(current) - set(kept_users)):
+			try:
+				models = ModelStore(user).load()
+			except (OSError, ValueError):
+				continue
+
+			encodings = [(model["id"], encoding) for model in models for encoding in model["data"]]
+			if not encodings:
+				continue
+
+			users.append(user)
+			rows.append(np.array([encoding for _, encoding in encodings], dtype=np.float32))
+			owners.append(np.full(len(encodings), len(users) - 1, dtype=np.int32))
+			model_ids.append(np.array([model_id for model_id, _ in encodings], dtype=np.int32))
+
+		self.matrix = np.ascontiguousarray(np.concatenate(rows)) if rows else np.zeros((0, 0), dtype=np.float32)
+		self.norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+		self.owners = np.concatenate(owners).astype(np.int32)
+		self.model_ids = np.concatenate(model_ids).astype(np.int32)
+		self.users = users
+		self.sources = current
+
+		self._update_quantizer(assignments)
+		return True
+
+	def identify(self, encoding: npt.ArrayLike, threshold: float, limit: int = 3) -> list[tuple[str, int, float]]:
+		"""
+		Find the users whose encodings are closest to the given one. Returns up to limit
+		(username, model id, distance) tuples below the threshold, closest first.
+		"""
+		if not len(self):
+			return []
+
+		if len(self.centroids):
+			candidates = self._probe(encoding)
+		else:
+			candidates = None
+
+		best: dict[int, tuple[float, int]] = {}
+		for rows in self._blocks(candidates):
+			distances = euclidean_distances(self.matrix[rows], self.norms[rows], encoding)
+
+			# The same bounds as compare uses, a distance of exactly 0 is not a match there either
+			for position in np.flatnonzero((distances > 0) & (distances < threshold)):
+				row = rows[position]
+				owner = int(self.owners[row])
+
+				if owner not in best or distances[position] < best[owner][0]:
+					best[owner] = (float(distances[position]), int(self.model_ids[row]))
+
+		results = [(self.users[owner], model_id, distance) for owner, (distance, model_id) in best.items()]
+		return sorted(results, key=lambda result: result[2])[:limit]
+
+	def _blocks(self, candidates: npt.NDArray | None) -> list[npt.NDArray]:
+		"""Split the rows to search into blocks"""
+		if candidates is None:
+			candidates = np.arange(len(self))
+
+		return [candidates[start:start + SEARCH_BLOCK_SIZE] for start in range(0, len(candidates), SEARCH_BLOCK_SIZE)]
+
+	def _probe(self, encoding: npt.ArrayLike) -> npt.NDArray:
+		"""Rows in the inverted lists closest to the encoding"""
+		probes = max(1, int(np.sqrt(len(self.centroids))))
+		distances = euclidean_distances(self.centroids, np.einsum("ij,ij->i", self.centroids, self.centroids), encoding)
+		closest = np.argsort(distances)[:probes]
+
+		return np.concatenate([self._lists[list_index] for list_index in closest])
+
+	def _update_quantizer(self, kept_assignments: npt.NDArray | None) -> None:
+		"""Train, extend or drop the coarse quantizer depending on the index size"""
+		if len(self) < IVF_THRESHOLD:
+			self.centroids = np.zeros((0, 0), dtype=np.float32)
+			self.assignments = np.zeros(0, dtype=np.int32)
+			self.trained_size = 0
+		elif not len(self.centroids) or kept_assignments is None or len(self) > self.trained_size * RETRAIN_GROWTH:
+			self._train()
+		else:
+			# Only assign the new rows, the rows that were kept stay in their list
+			new_rows = self.matrix[len(kept_assignments):]
+			self.assignments = np.concatenate([kept_assignments, _nearest(new_rows, self.centroids)]).astype(np.int32)
+
+		self._build_lists()
+
+	def _train(self) -> None:
+		"""Partition all encodings with k-means"""
+		count = int(np.sqrt(len(self)) * 2)
+		rng = np.random.default_rng(0)
+		centroids = self.matrix[rng.choice(len(self), count, replace=False)].copy()
+
+		for _ in range(KMEANS_ITERATIONS):
+			assignments = _nearest(self.matrix, centroids)
+			sums = np.zeros_like(centroids)
+			np.add.at(sums, assignments, self.matrix)
+			sizes = np.bincount(assignments, minlength=count)
+
+			# Empty clusters keep their previous centroid
+			filled = sizes > 0
+			centroids[filled] = sums[filled] / sizes[filled, None]
+
+		self.centroids = centroids
+		self.assignments = _nearest(self.matrix, centroids).astype(np.int32)
+		self.trained_size = len(self)
+
+	def _build_lists(self) -> None:
+		"""Group row numbers by the inverted list they are assigned to"""
+		if not len(self.centroids):
+			self._lists = []
+			return
+
+		order = np.argsort(self.assignments, kind="stable")
+		bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+		self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+
+
+def _nearest(matrix: npt.NDArray, centroids: npt.NDArray) -> npt.NDArray:
+	"""Index of the closest centroid for every row"""
+	centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+	result = np.zeros(len(matrix), dtype=np.int32)
+
+	for start in range(0, len(matrix), SEARCH_BLOCK_SIZE):
+		block = matrix[start:start + SEARCH_BLOCK_SIZE]
+		# The norm of the row is the same for every centroid, so it can be left out of the comparison
+		result[start:start + SEARCH_BLOCK_SIZE] = np.argmin(centroid_norms - 2 * (block @ centroids.T), axis=1)
+
+	return result
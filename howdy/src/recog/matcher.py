@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+# Amount of known encodings compared at once when an early exit is allowed
+BLOCK_SIZE = 64
+
+
+def euclidean_distances(matrix: npt.NDArray, norms: npt.NDArray, encoding: npt.ArrayLike) -> npt.NDArray:
+	"""Euclidean distances between an encoding and every row of a matrix with precomputed squared norms"""
+	encoding = np.asarray(encoding, dtype=np.float32)
+	squared = norms + np.dot(encoding, encoding) - 2 * (matrix @ encoding)
+
+	# Rounding errors can make the squared distance of near identical encodings slightly negative
+	return np.sqrt(np.maximum(squared, 0, out=squared), out=squared)
+
+
+class EncodingMatcher:
+	"""
+	Matches face encodings against a fixed set of known encodings.
+
+	The known encodings are kept as one contiguous float32 matrix with their squared norms
+	precomputed, so the distances to a new encoding take a single matrix-vector product:
+
+	|a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+	"""
+
+	def __init__(self, models: list[dict[str, Any]]) -> None:
+		rows = []
+		# The index of the model every encoding belongs to
+		self.model_indexes = []
+		# The index of the first encoding of every model
+		self.model_starts = []
+
+		for model_index, model in enumerate(models):
+			self.model_starts.append(len(rows))
+			rows += model["data"]
+			self.model_indexes += [model_index] * len(model["data"])
+
+		self.matrix = np.ascontiguousarray(np.array(rows, dtype=np.float32).reshape(len(rows), -1 if rows else 0))
+		self.norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+
+	def __len__(self) -> int:
+		return len(self.model_indexes)
+
+	def distances(self, encoding: npt.ArrayLike, start: int = 0, end: int | None = None) -> npt.NDArray:
+		"""Euclidean distances between an encoding and the known encodings in the given range"""
+		return euclidean_distances(self.matrix[start:end], self.norms[start:end], encoding)
+
+	def match(self, encoding: npt.ArrayLike, threshold: float | None = None) -> tuple[int, float]:
+		"""
+		Find the closest known encoding, returns its index and distance.
+
+		If a threshold is given, the search stops at the first block of encodings that contains
+		a distance below it, so the returned match is good enough but not always the closest.
+		The encodings of the first model are searched on their own first, models are ordered
+		with the most used first so a usual match doesn't need the others at all.
+		"""
+		if not len(self):
+			return -1, float("inf")
+
+		best_index, best_distance = -1, float("inf")
+
+		for start, end in self._blocks(threshold is not None):
+			distances = self.distances(encoding, start, end)
+			index = int(np.argmin(distances))
+
+			if distances[index] < best_distance:
+				best_index, best_distance = start + index, float(distances[index])
+
+			if threshold is not None and 0 < best_distance < threshold:
+				break
+
+		return best_index, best_distance
+
+	def _blocks(self, early_exit: bool) -> list[tuple[int, int]]:
+		"""The (start, end) ranges of encodings to compare at once"""
+		if not early_exit:
+			return [(0, len(self))]
+
+		# The first model forms a block of its own, the rest is split into blocks of BLOCK_SIZE
+		first_end = self.model_starts[1] if len(self.model_starts) > 1 else len(self)
+		first_end = min(first_end, BLOCK_SIZE)
+
+		return [(0, first_end)] + [(start, min(start + BLOCK_SIZE, len(self))) for start in range(first_end, len(self), BLOCK_SIZE)]
+
+	def model_index(self, encoding_index: int) -> int:
+		"""The index of the model a known encoding belongs to"""
+		return self.model_indexes[encoding_index]
+
+	def position(self, encoding_index: int) -> tuple[int, int]:
+		"""The index of the model a known encoding belongs to, and its index within that model"""
+		model_index = self.model_indexes[encoding_index]
+		return model_index, encoding_index - self.model_starts[model_index]
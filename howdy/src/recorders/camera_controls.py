@@ -0,0 +1,148 @@
+# Apply camera controls once and only touch them again when the camera drifts away from them
+from __future__ import annotations
+
+import fcntl
+import os
+import time
+from typing import Any
+
+import cv2
+
+from recorders import v4l2
+
+# Amount of consecutive successful checks before the check interval starts to grow
+SETTLE_CHECKS = 5
+# Largest amount of frames between two checks once the controls have settled
+MAX_CHECK_INTERVAL = 32
+
+# OpenCV properties used when the device can't be reached with ioctls directly
+_CV2_PROPERTIES = {
+	v4l2.V4L2_CID_EXPOSURE_AUTO: cv2.CAP_PROP_AUTO_EXPOSURE,
+	v4l2.V4L2_CID_EXPOSURE_ABSOLUTE: cv2.CAP_PROP_EXPOSURE,
+}
+
+
+class CameraControls:
+	"""
+	Keeps a set of V4L2 controls applied to a camera.
+
+	Controls are written with VIDIOC_S_CTRL and read back with VIDIOC_G_CTRL. Some drivers
+	(e.g. on the Lenovo X1E) only accept manual exposure after a couple of frames have been
+	captured, so the values are checked every frame at first and progressively less often
+	once they stick. They are only written again when the read back value has drifted.
+	"""
+
+	def __init__(self, video_capture: Any) -> None:
+		# The desired value of every managed control, by control id
+		self.wanted: dict[int, int] = {}
+		# Seconds spent reading and writing controls
+		self.time = 0.0
+		# Amount of times the controls have been read back
+		self.checks = 0
+		# Amount of times the controls had to be written
+		self.writes = 0
+
+		self._internal = video_capture.internal
+		self._frames_until_check = 0
+		self._interval = 1
+		self._stable_checks = 0
+		self._applied = False
+
+		# Open a second handle on the device for control ioctls, OpenCV keeps its own for streaming
+		try:
+			self._fd = os.open(video_capture.config.get("video", "device_path"), os.O_RDWR | os.O_NONBLOCK)
+		except OSError:
+			self._fd = None
+
+	def __del__(self) -> None:
+		self.close()
+
+	def close(self) -> None:
+		"""Close the control handle on the device"""
+		if getattr(self, "_fd", None) is not None:
+			os.close(self._fd)
+			self._fd = None
+
+	def request_exposure(self, exposure: int) -> None:
+		"""Ask for manual exposure with the given value"""
+		self.wanted[v4l2.V4L2_CID_EXPOSURE_AUTO] = v4l2.V4L2_EXPOSURE_MANUAL
+		self.wanted[v4l2.V4L2_CID_EXPOSURE_ABSOLUTE] = int(exposure)
+
+	def apply(self) -> None:
+		"""Write all wanted controls to the camera and restart the check schedule"""
+		start = time.time()
+
+		for control, value in self.wanted.items():
+			self._set(control, value)
+
+		self.writes += 1
+		self._applied = True
+		self._interval = 1
+		self._stable_checks = 0
+		self._frames_until_check = 1
+
+		self.time += time.time() - start
+
+	def verify(self) -> bool:
+		"""
+		Call once per frame. Reads the controls back if a check is due and writes them
+		again if the camera drifted. Returns True if the controls had to be written.
+		"""
+		if not self.wanted:
+			return False
+
+		# Controls are first applied after a frame has been captured, as some cameras ignore them before that
+		if not self._applied:
+			self.apply()
+			return True
+
+		self._frames_until_check -= 1
+		if self._frames_until_check > 0:
+			return False
+
+		start = time.time()
+		self.checks += 1
+		# A control that can't be read back can't be seen drifting, so it's only written by apply
+		drifted = any(self._get(control) not in (None, value) for control, value in self.wanted.items())
+		self.time += time.time() - start
+
+		if drifted:
+			self.apply()
+			return True
+
+		# Check less often the longer the controls stay put
+		self._stable_checks += 1
+		if self._stable_checks >= SETTLE_CHECKS:
+			self._interval = min(self._interval * 2, MAX_CHECK_INTERVAL)
+
+		self._frames_until_check = self._interval
+		return False
+
+	def _get(self, control: int) -> int | None:
+		"""Read the current value of a control, None if neither the device nor the recorder can report it"""
+		if self._fd is not None:
+			ctrl = v4l2.v4l2_control(control, 0)
+			try:
+				fcntl.ioctl(self._fd, v4l2.VIDIOC_G_CTRL, ctrl)
+				return ctrl.value
+			except OSError:
+				pass
+
+		# The ffmpeg and pyv4l2 recorders only report the frame size and return None for the rest
+		try:
+			value = self._internal.get(_CV2_PROPERTIES[control])
+		except (AttributeError, cv2.error):
+			return None
+
+		return int(value) if value is not None else None
+
+	def _set(self, control: int, value: int) -> None:
+		"""Write a control to the camera"""
+		if self._fd is not None:
+			try:
+				fcntl.ioctl(self._fd, v4l2.VIDIOC_S_CTRL, v4l2.v4l2_control(control, value))
+				return
+			except OSError:
+				pass
+
+		self._internal.set(_CV2_PROPERTIES[control], float(value))
@@ -3,11 +3,12 @@ from __future__ import annotations
 
 import glob
 import os
-import re
 import subprocess
 
 import cv2
 
+from recorders.device_probe import device_name, probe_device
+
 
 def detect_camera_environment() -> dict:
 	"""Detect the available camera environment on the system.
@@ -78,7 +79,7 @@ def discover_devices() -> list[dict]:
 		seen_paths.add(real_path)
 		devices.append({
 			"path": dev_path,
-			"name": _get_device_name(dev_path),
+			"name": device_name(dev_path),
 			"source": "video-glob",
 		})
 
@@ -90,42 +91,7 @@ def test_device_open(device_path: str, backend: int | None = None) -> dict:
 
 	Returns a dict with keys: success, is_gray, error.
 	"""
-	if backend is None:
-		backend = cv2.CAP_V4L2
-
-	try:
-		cap = cv2.VideoCapture(device_path, backend)
-		if not cap.isOpened():
-			return {"success": False, "is_gray": False, "error": "Camera could not be opened"}
-
-		ret, frame = cap.read()
-		cap.release()
-
-		if not ret or frame is None:
-			return {"success": False, "is_gray": False, "error": "Failed to read a frame"}
-
-		return {"success": True, "is_gray": _is_gray_frame(frame), "error": None}
-	except Exception as e:
-		return {"success": False, "is_gray": False, "error": str(e)}
-
-
-def _get_device_name(path: str) -> str:
-	"""Get a human-readable name for a device using udevadm.
-
-	Falls back to os.path.basename(path) if udevadm is unavailable or fails.
-	"""
-	try:
-		udevadm = subprocess.check_output(
-			["udevadm", "info", "-r", "--query=all", "-n", path],
-			timeout=5,
-		).decode("utf-8")
-		for line in udevadm.split("\n"):
-			re_name = re.search(r'product.*=(.*)$', line, re.IGNORECASE)
-			if re_name:
-				return re_name.group(1)
-	except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
-		pass
-	return os.path.basename(path)
+	return probe_device(device_path, backend)
 
 
 def _scan_v4l_dir(dir_path: str, devices: list[dict], seen_paths: set[str], source: str) -> None:
@@ -143,22 +109,7 @@ def _scan_v4l_dir(dir_path: str, devices: list[dict], seen_paths: set[str], sour
 		seen_paths.add(real_path)
 		devices.append({
 			"path": real_path,
-			"name": _get_device_name(real_path),
+			"name": device_name(real_path),
 			"source": source,
 		})
 
-
-def _is_gray_frame(frame) -> bool:
-	"""Check if a frame is grayscale by sampling pixels.
-
-	Checks every 10th row and column for performance on large frames.
-	"""
-	if len(frame.shape) < 3:
-		return True
-
-	for row_idx in range(0, frame.shape[0], 10):
-		for col_idx in range(0, frame.shape[1], 10):
-			pixel = frame[row_idx, col_idx]
-			if not (pixel[0] == pixel[1] == pixel[2]):
-				return False
-	return True
@@ -0,0 +1,136 @@
+# Probe camera devices concurrently, used by device discovery and onboarding
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from typing import Callable
+
+import cv2
+
+from recorders import ir_analysis
+
+# Seconds a single device may take to open and deliver a frame
+DEFAULT_TIMEOUT = 5.0
+# Highest amount of devices probed at the same time
+MAX_WORKERS = 8
+
+
+def device_name(path: str) -> str:
+	"""Get a human-readable name for a device from sysfs.
+
+	This is the same name udev reports as ID_V4L_PRODUCT, without starting udevadm.
+	Falls back to os.path.basename(path) if the device has no sysfs entry.
+	"""
+	node = os.path.basename(os.path.realpath(path))
+
+	try:
+		with open("/sys/class/video4linux/" + node + "/name") as f:
+			name = f.read().strip()
+			if name:
+				return name
+	except OSError:
+		pass
+
+	return os.path.basename(path)
+
+
+def probe_device(path: str, backend: int | None = None) -> dict:
+	"""Open a device and judge a few frames.
+
+	Returns a dict with keys: path, name, success, is_gray, ir_score, error.
+	"""
+	if backend is None:
+		backend = cv2.CAP_V4L2
+
+	result = {"path": path, "name": device_name(path), "success": False, "is_gray": False, "ir_score": 0.0, "error": None}
+
+	try:
+		cap = cv2.VideoCapture(path, backend)
+		if not cap.isOpened():
+			result["error"] = "Camera could not be opened"
+			return result
+
+		# Read a few frames, infrared emitters don't light every frame
+		frames = []
+		for _ in range(ir_analysis.IR_FRAMES):
+			ret, frame = cap.read()
+			if not ret or frame is None:
+				break
+			frames.append(frame)
+		cap.release()
+
+		if not frames:
+			result["error"] = "Failed to read a frame"
+			return result
+
+		result["success"] = True
+		result["ir_score"] = ir_analysis.analyze(frames)["score"]
+		result["is_gray"] = result["ir_score"] >= ir_analysis.IR_THRESHOLD
+	except Exception as e:
+		result["error"] = str(e)
+
+	return result
+
+
+def probe_devices(
+	paths: list[str],
+	timeout: float = DEFAULT_TIMEOUT,
+	progress: Callable[[dict, int, int], None] | None = None,
+	backend: int | None = None,
+) -> list[dict]:
+	"""Probe multiple devices at the same time.
+
+	Returns a result dict per path, in the same order as the paths. Devices that don't
+	respond within the timeout get an error result. If given, progress is called from
+	the calling thread with every result as it comes in, and the amount of done and
+	total devices.
+
+	Probes run in daemon threads, as a camera stuck in its driver can't be interrupted
+	and should not keep the process alive.
+	"""
+	pending: queue.Queue[str] = queue.Queue()
+	done: queue.Queue[dict] = queue.Queue()
+
+	for path in paths:
+		pending.put(path)
+
+	def worker() -> None:
+		"""Probe devices until none are left"""
+		while True:
+			try:
+				path = pending.get_nowait()
+			except queue.Empty:
+				return
+
+			done.put(probe_device(path, backend))
+
+	for _ in range(min(len(paths), MAX_WORKERS)):
+		threading.Thread(target=worker, daemon=True).start()
+
+	# Every worker gets the full timeout for each device it handles
+	rounds = -(-len(paths) // MAX_WORKERS)
+	deadline = time.time() + timeout * rounds
+	results: dict[str, dict] = {}
+
+	while len(results) < len(paths):
+		try:
+			result = done.get(timeout=max(deadline - time.time(), 0))
+		except queue.Empty:
+			break
+
+		results[result["path"]] = result
+		if progress:
+			progress(result, len(results), len(paths))
+
+	# Report devices that never answered
+	for path in paths:
+		if path not in results:
+			results[path] = {"path": path, "name": device_name(path), "success": False, "is_gray": False, "ir_score": 0.0, "error": "Timed out"}
+
+			if progress:
+				progress(results[path], len(results), len(paths))
+
+	return [results[path] for path in paths]
+
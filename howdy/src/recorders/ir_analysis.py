@@ -0,0 +1,70 @@
+# Judge from a few frames whether a camera is an infrared camera
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+
+# Only every STRIDE-th row and column is looked at, plenty for frame statistics
+STRIDE = 4
+# Average difference between the color channels, in pixel values, up to which a frame is grayscale.
+# Compression and debayering leave some noise on cameras that only capture gray
+GRAY_TOLERANCE = 2.0
+# Channel difference above the tolerance at which a camera is certainly a color camera
+COLOR_RANGE = 8.0
+# Standard deviation of pixel values below which a frame is considered blank
+MIN_CONTRAST = 8.0
+# Score from which a camera is considered an infrared camera
+IR_THRESHOLD = 0.7
+# Amount of frames to read when probing a camera
+IR_FRAMES = 3
+
+
+def channel_difference(frame: Any) -> float:
+	"""Average difference between the largest and smallest color channel of a pixel, 0 for single channel frames"""
+	if len(frame.shape) < 3 or frame.shape[2] == 1:
+		return 0.0
+
+	sample = frame[::STRIDE, ::STRIDE, :3].astype(np.int16)
+	return float(np.mean(sample.max(axis=2) - sample.min(axis=2)))
+
+
+def analyze(frames: list[Any]) -> dict:
+	"""Judge how likely the frames come from an infrared camera.
+
+	Returns a dict with keys:
+		score: float - confidence between 0 and 1 that the camera is an infrared camera
+		channel_difference: float - average difference between the color channels
+		brightness: list - average pixel value of every frame
+		contrast: list - standard deviation of the pixel values of every frame
+	"""
+	if not frames:
+		return {"score": 0.0, "channel_difference": 0.0, "brightness": [], "contrast": []}
+
+	differences = []
+	brightness = []
+	contrast = []
+
+	for frame in frames:
+		differences.append(channel_difference(frame))
+
+		# The first channel is enough for brightness, all channels are about equal on gray frames
+		sample = frame[::STRIDE, ::STRIDE, 0] if len(frame.shape) == 3 else frame[::STRIDE, ::STRIDE]
+		brightness.append(float(sample.mean()))
+		contrast.append(float(sample.std()))
+
+	difference = float(np.mean(differences))
+
+	# Mostly decided by color, infrared cameras don't capture any
+	color_score = 1 - min(max(difference - GRAY_TOLERANCE, 0) / COLOR_RANGE, 1)
+	# Blank frames say little about the camera, frames with an image are more convincing
+	signal_score = min(max(contrast) / MIN_CONTRAST, 1)
+	# Infrared emitters often flash, giving frames of very different brightness
+	flicker_score = min((max(brightness) - min(brightness)) / 64, 1)
+
+	return {
+		"score": color_score * (0.7 + 0.2 * signal_score + 0.1 * flicker_score),
+		"channel_difference": difference,
+		"brightness": brightness,
+		"contrast": contrast,
+	}
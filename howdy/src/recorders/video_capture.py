@@ -10,6 +10,7 @@ from typing import Any
 
 import cv2
 
+import settings
 from i18n import _
 
 # Class to provide boilerplate code to build a video recorder with the
@@ -19,18 +20,17 @@ from i18n import _
 
 
 class VideoCapture:
-	def __init__(self, config: configparser.ConfigParser | str) -> None:
+	def __init__(self, config: configparser.ConfigParser | settings.Settings | str) -> None:
 		"""
 		Creates a new VideoCapture instance depending on the settings in the
 		provided config file.
 
-		Config can either be a string to the path, or a pre-setup configparser.
+		Config can either be a string to the path, or a pre-setup configparser or compiled config.
 		"""
 
 		# Parse config from string if needed
 		if isinstance(config, str):
-			self.config = configparser.ConfigParser()
-			self.config.read(config)
+			self.config = settings.load(config)
 		else:
 			self.config = config
 
@@ -41,12 +41,16 @@ class VideoCapture:
 				print(_("Howdy could not find a camera device at: {}").format(device_path))
 				# Lazy import to avoid overhead on the success path
 				from recorders.device_discovery import detect_camera_environment, discover_devices
+				from recorders.device_probe import probe_devices
 				env = detect_camera_environment()
 				available = discover_devices()
 				if available:
 					print(_("Available camera devices on this system:"))
-					for dev in available:
-						print("  {}  ({})".format(dev["path"], dev["name"]))
+					# Open all devices at once to see which ones work
+					probes = probe_devices([dev["path"] for dev in available], timeout=3)
+					for dev, probe in zip(available, probes):
+						status = _("infrared") if probe["is_gray"] else _("color") if probe["success"] else probe["error"]
+						print("  {}  ({}, {})".format(dev["path"], dev["name"], status))
 				else:
 					print(_("No camera devices were detected on this system."))
 				if env["pipewire_running"]:
@@ -1,15 +1,20 @@
 from __future__ import annotations
 
-import configparser
 import importlib.util
 import os
-import re
 import subprocess
 import sys
+import time
 import traceback
 from typing import Any
 
+import cv2
+import numpy as np
+
 from i18n import _
+from recog.backend import FaceRectangle, LandmarkSet
+from settings import Settings
+from ui_channel import UIChannel
 
 
 class RubberStamp:
@@ -18,88 +23,194 @@ class RubberStamp:
 	UI_TEXT = "ui_text"
 	UI_SUBTEXT = "ui_subtext"
 
-	def set_ui_text(self, text: str, type: str | None = None) -> None:
-		"""Convert an ui string to input howdy-gtk understands"""
+	# The face compare.py matched and the frame it was found in, scaled and rotated the way compare.py does
+	face: FaceRectangle | None = None
+	landmarks: LandmarkSet | None = None
+	frame: Any = None
+	gsframe: Any = None
+	scaling_factor = 1.0
+	rotation: int | None = None
+	dark_threshold = 60.0
+	# Channel to the auth ui, messages are batched until flushed
+	ui: UIChannel
+	verbose = False
+
+	def read_frame(self) -> tuple[Any, Any] | None:
+		"""
+		Read the next frame and prepare it the way compare.py did, so faces in it can be compared
+		with the matched face. Returns the frame and its CLAHE applied grayscale version, or None
+		if the frame is too dark to be used.
+		"""
+		frame, gsframe = self.video_capture.read_frame()
+		gsframe = self.clahe.apply(gsframe)
+
+		# Skip frames the IR emitters didn't light up, like compare.py does
+		hist = cv2.calcHist([gsframe], [0], None, [8], [0, 256])
+		hist_total = np.sum(hist)
+		if hist_total == 0 or hist[0][0] / hist_total * 100 > self.dark_threshold:
+			return None
+
+		if self.scaling_factor != 1:
+			frame = cv2.resize(frame, None, fx=self.scaling_factor, fy=self.scaling_factor, interpolation=cv2.INTER_AREA)
+			gsframe = cv2.resize(gsframe, None, fx=self.scaling_factor, fy=self.scaling_factor, interpolation=cv2.INTER_AREA)
+
+		if self.rotation is not None:
+			frame = cv2.rotate(frame, self.rotation)
+			gsframe = cv2.rotate(gsframe, self.rotation)
+
+		return frame, gsframe
+
+	def set_ui_text(self, text: str, type: str | None = None, flush: bool = True) -> None:
+		"""
+		Show a text in the ui. Pass flush=False when more updates follow right after,
+		so they are all written to the ui at once.
+		"""
 		typedec = "M"
 
 		if type == self.UI_SUBTEXT:
 			typedec = "S"
 
-		return self.send_ui_raw(typedec + "=" + text)
+		if self.verbose:
+			print("Sending command to howdy-gtk: " + typedec + "=" + text)
+
+		self.ui.send(typedec, text)
+
+		if flush:
+			self.ui.flush()
 
 	def send_ui_raw(self, command: str) -> None:
 		"""Write raw command to howdy-gtk stdin"""
-		if self.config.getboolean("debug", "verbose_stamps", fallback=False):
+		if self.verbose:
 			print("Sending command to howdy-gtk: " + command)
 
-		# Add a newline because the ui reads per line
-		command += " \n"
+		# Split the command into its type and text, the way the ui parses it
+		self.ui.send(command[0], command[2:])
+		self.ui.flush()
 
-		# If we're connected to the ui
-		if self.gtk_proc:
-			# Send the command as bytes
-			self.gtk_proc.stdin.write(bytearray(command.encode("utf-8")))
-			self.gtk_proc.stdin.flush()
 
-			# Write a padding line to force the command through any buffers
-			self.gtk_proc.stdin.write(bytearray("P=_PADDING \n".encode("utf-8")))
-			self.gtk_proc.stdin.flush()
+class StampRule:
+	"""A single parsed line of the stamp_rules config option"""
 
+	def __init__(self, type: str, timeout: float, failsafe: bool, raw_options: list[str]) -> None:
+		self.type = type
+		self.timeout = timeout
+		self.failsafe = failsafe
+		self.raw_options = raw_options
 
-def execute(config: configparser.ConfigParser, gtk_proc: subprocess.Popen | None, opencv: dict[str, Any]) -> None:
-	verbose = config.getboolean("debug", "verbose_stamps", fallback=False)
-	dir_path = os.path.dirname(os.path.realpath(__file__))
-	installed_stamps = []
 
-	# Go through each file in the rubberstamp folder
-	for filename in os.listdir(dir_path):
-		# Remove non-readable file or directories
-		if not os.path.isfile(dir_path + "/" + filename):
-			continue
+class StampRegistry:
+	"""
+	Installed stamps and their imported classes.
 
-		# Remove meta files
-		if filename in ["__init__.py", ".gitignore"]:
-			continue
+	The stamps folder is only listed once and every stamp file is only imported once, so a process
+	that authenticates repeatedly (or that preloads the stamps while the camera starts) doesn't pay
+	for this on the critical path. The rules are parsed when the config is compiled.
+	"""
 
-		# Add the found file to the list of enabled rubberstamps
-		installed_stamps.append(filename.split(".")[0])
+	def __init__(self, dir_path: str) -> None:
+		self.dir_path = dir_path
 
-	if verbose: print("Installed rubberstamps: " + ", ".join(installed_stamps))
+		self._installed: list[str] | None = None
+		self._classes: dict[str, Any] = {}
 
-	# Get the rules defined in the config
-	raw_rules = config.get("rubberstamps", "stamp_rules")
-	rules = raw_rules.split("\n")
+	def installed(self) -> list[str]:
+		"""Names of all stamps in the stamps folder"""
+		if self._installed is None:
+			self._installed = []
 
-	# Go through the rules one by one
-	for rule in rules:
-		rule = rule.strip()
+			# Go through each file in the rubberstamp folder
+			for filename in os.listdir(self.dir_path):
+				# Remove non-readable file or directories
+				if not os.path.isfile(self.dir_path + "/" + filename):
+					continue
 
-		if len(rule) <= 1:
-			continue
+				# Remove meta files
+				if filename in ["__init__.py", ".gitignore"]:
+					continue
+
+				# Add the found file to the list of enabled rubberstamps
+				self._installed.append(filename.split(".")[0])
+
+		return self._installed
+
+	def stamp_class(self, type: str) -> Any:
+		"""Import a stamp file once and return its stamp class, raises AttributeError if it has none"""
+		if type not in self._classes:
+			# Load the module from file
+			spec = importlib.util.spec_from_file_location(type, self.dir_path + "/" + type + ".py")
+			module = importlib.util.module_from_spec(spec)
+			spec.loader.exec_module(module)
+
+			# Try to get the class with the same name
+			self._classes[type] = getattr(module, type)
+
+		return self._classes[type]
+
+
+# The registry of this process, created on first use
+_registry: StampRegistry | None = None
+
+
+def registry() -> StampRegistry:
+	"""Get the stamp registry of this process"""
+	global _registry
+
+	if _registry is None:
+		_registry = StampRegistry(os.path.dirname(os.path.realpath(__file__)))
+
+	return _registry
 
-		# Parse the rule with regex
-		regex_result = re.search(r"^(\w+)\s+([\w\.]+)\s+([a-z]+)(.*)?$", rule, re.IGNORECASE)
 
-		# Error out if the regex did not match (invalid line)
-		if not regex_result:
-			print(_("Error parsing rubberstamp rule: {}").format(rule))
+def stamp_rules(config: Settings) -> list[StampRule]:
+	"""The rules of the compiled config"""
+	return [StampRule(*rule) for rule in config.stamp_rules]
+
+
+def preload(config: Settings) -> None:
+	"""Import the stamps the rules use ahead of time, errors are reported when executing"""
+	stamps = registry()
+
+	for rule in stamp_rules(config):
+		if rule.type not in stamps.installed():
 			continue
 
-		type = regex_result.group(1)
+		try:
+			stamps.stamp_class(rule.type)
+		except Exception:
+			pass
+
+
+def execute(config: Settings, gtk_proc: subprocess.Popen | None, opencv: dict[str, Any]) -> None:
+	verbose = config.getboolean("debug", "verbose_stamps", fallback=False)
+	stamps = registry()
+	ui = opencv.get("ui_channel") or UIChannel(gtk_proc)
+
+	setup_start = time.time()
+	installed_stamps = stamps.installed()
+
+	if verbose: print("Installed rubberstamps: " + ", ".join(installed_stamps))
+
+	# Get the rules defined in the config, they were parsed when it was compiled
+	rules = stamp_rules(config)
+
+	for error in config.stamp_rule_errors:
+		print(error)
+
+	if verbose: print("Rubberstamp rules loaded in %dms" % (round((time.time() - setup_start) * 1000), ))
+
+	# Go through the rules one by one
+	for rule in rules:
+		setup_start = time.time()
+		type = rule.type
 
 		# Error out if the stamp name in the rule is not a file
 		if type not in installed_stamps:
 			print(_("Stamp not installed: {}").format(type))
 			continue
 
-		# Load the module from file
-		spec = importlib.util.spec_from_file_location(type, dir_path + "/" + type + ".py")
-		module = importlib.util.module_from_spec(spec)
-		spec.loader.exec_module(module)
-
-		# Try to get the class with the same name
+		# Get the class of the stamp, importing it if it wasn't preloaded
 		try:
-			constructor = getattr(module, type)
+			constructor = stamps.stamp_class(type)
 		except AttributeError:
 			print(_("Stamp error: Class {} not found").format(type))
 			continue
@@ -109,6 +220,7 @@ def execute(config: configparser.ConfigParser, gtk_proc: subprocess.Popen | None
 		instance.verbose = verbose
 		instance.config = config
 		instance.gtk_proc = gtk_proc
+		instance.ui = ui
 		instance.opencv = opencv
 
 		# Set some opensv shorthands
@@ -118,10 +230,19 @@ def execute(config: configparser.ConfigParser, gtk_proc: subprocess.Popen | None
 		instance.pose_predictor = opencv["backend"].get_landmarks
 		instance.clahe = opencv["clahe"]
 
-		# Parse and set the 2 required options for all rubberstamps
+		# Hand over where compare.py found the face, so stamps don't have to search for it again
+		instance.face = opencv.get("face")
+		instance.landmarks = opencv.get("landmarks")
+		instance.frame = opencv.get("frame")
+		instance.gsframe = opencv.get("gsframe")
+		instance.scaling_factor = opencv.get("scaling_factor", 1.0)
+		instance.rotation = opencv.get("rotation")
+		instance.dark_threshold = opencv.get("dark_threshold", 60.0)
+
+		# Set the 2 required options for all rubberstamps
 		instance.options = {
-			"timeout": float(re.sub("[a-zA-Z]", "", regex_result.group(2))),
-			"failsafe": regex_result.group(3) != "faildeadly"
+			"timeout": rule.timeout,
+			"failsafe": rule.failsafe
 		}
 
 		# Try to get the class do declare its other config variables
@@ -133,11 +254,8 @@ def execute(config: configparser.ConfigParser, gtk_proc: subprocess.Popen | None
 			traceback.print_exc()
 			continue
 
-		# Split the optional arguments at the end of the rule by spaces
-		raw_options = regex_result.group(4).split()
-
-		# For each of those aoptional arguments
-		for option in raw_options:
+		# For each of the optional arguments at the end of the rule
+		for option in rule.raw_options:
 			# Get the key to the left, and the value to the right of the equal sign
 			key, value = option.split("=")
 
@@ -154,13 +272,17 @@ def execute(config: configparser.ConfigParser, gtk_proc: subprocess.Popen | None
 
 			instance.options[key] = value
 
+		setup_time = time.time() - setup_start
+
 		if verbose:
 			print("Stamp \"" + type + "\" options parsed:")
 			print(instance.options)
+			print("Stamp \"" + type + "\" set up in %dms" % (round(setup_time * 1000), ))
 			print("Executing stamp")
 
 		# Make the stamp fail by default
 		result = False
+		run_start = time.time()
 
 		# Run the stamp code
 		try:
@@ -171,7 +293,7 @@ def execute(config: configparser.ConfigParser, gtk_proc: subprocess.Popen | None
 			traceback.print_exc()
 			continue
 
-		if verbose: print("Stamp \"" + type + "\" returned: " + str(result))
+		if verbose: print("Stamp \"" + type + "\" returned: " + str(result) + " after %dms" % (round((time.time() - run_start) * 1000), ))
 
 		# Abort authentication if the stamp returned false
 		if result is False:
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import math
 import sys
+import threading
 import time
 
 from i18n import _
@@ -19,12 +21,14 @@ class hotkey(RubberStamp):
 
 	def run(self) -> bool:
 		"""Wait for the user to press a hotkey"""
-		time_left = self.options["timeout"]
+		deadline = time.time() + self.options["timeout"]
 		time_string = _("Aborting authorisation in {}") if self.options["failsafe"] else _("Authorising in {}")
 
-		# Set the ui to default strings
-		self.set_ui_text(time_string.format(int(time_left)), self.UI_TEXT)
-		self.set_ui_text(_("Press {abort_key} to abort, {confirm_key} to authorise").format(abort_key=self.options["abort_key"], confirm_key=self.options["confirm_key"]), self.UI_SUBTEXT)
+		# Set when one of the hotkeys is pressed
+		self.key_event = threading.Event()
+
+		# Set the ui subtext, it's sent together with the first countdown text
+		self.set_ui_text(_("Press {abort_key} to abort, {confirm_key} to authorise").format(abort_key=self.options["abort_key"], confirm_key=self.options["confirm_key"]), self.UI_SUBTEXT, flush=False)
 
 		# Try to import the keyboard module and tell the user to install the module if that fails
 		try:
@@ -39,29 +43,38 @@ class hotkey(RubberStamp):
 		keyboard.add_hotkey(self.options["abort_key"], self.on_key, args=["abort"])
 		keyboard.add_hotkey(self.options["confirm_key"], self.on_key, args=["confirm"])
 
-		# While we have not hit our timeout yet
-		while time_left > 0:
-			# Remove 0.1 seconds from the timer, as that's how long we sleep
-			time_left -= 0.1
-			# Update the ui with the new time
-			self.set_ui_text(time_string.format(str(int(time_left) + 1)), self.UI_TEXT)
-
-			# If the abort key was pressed while the loop was sleeping
-			if self.pressed_key == "abort":
-				# Set the ui to confirm the abort
-				self.set_ui_text(_("Authentication aborted"), self.UI_TEXT)
-				self.set_ui_text("", self.UI_SUBTEXT)
+		# The amount of seconds currently shown in the ui
+		shown_seconds = None
 
-				# Exit
-				time.sleep(1)
-				return False
-
-			# If confirm has pressed, return that auth can continue
-			elif self.pressed_key == "confirm":
-				return True
-
-			# If no key has been pressed, wait for a bit and check again
-			time.sleep(0.1)
+		# While we have not hit our timeout yet
+		while True:
+			time_left = deadline - time.time()
+			if time_left <= 0:
+				break
+
+			# Only update the ui when the shown amount of seconds changes
+			seconds = math.ceil(time_left)
+			if seconds != shown_seconds:
+				self.set_ui_text(time_string.format(str(seconds)), self.UI_TEXT)
+				shown_seconds = seconds
+
+			# Sleep until a key is pressed or the countdown reaches the next second
+			if self.key_event.wait(time_left - (seconds - 1)):
+				break
+
+		# If the abort key was pressed
+		if self.pressed_key == "abort":
+			# Set the ui to confirm the abort
+			self.set_ui_text(_("Authentication aborted"), self.UI_TEXT, flush=False)
+			self.set_ui_text("", self.UI_SUBTEXT)
+
+			# Exit
+			time.sleep(1)
+			return False
+
+		# If confirm has pressed, return that auth can continue
+		elif self.pressed_key == "confirm":
+			return True
 
 		# When our timeout hits, either abort or continue based on failsafe of faildeadly
 		return not self.options["failsafe"]
@@ -69,3 +82,4 @@ class hotkey(RubberStamp):
 	def on_key(self, type: str) -> None:
 		"""Called when the user presses a key"""
 		self.pressed_key = type
+		self.key_event.set()
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 import time
+from typing import Any
 
 from i18n import _
+from recog.backend import FaceRectangle, LandmarkSet
 
 # Import the root rubberstamp class
 from rubberstamps import RubberStamp
 
+# Range of the distance between the eyes, relative to the width of the face, for a face to count as still followed
+MIN_EYE_RATIO = 0.15
+MAX_EYE_RATIO = 0.9
+
 
 class nod(RubberStamp):
 	def declare_config(self) -> None:
@@ -16,7 +22,7 @@ class nod(RubberStamp):
 
 	def run(self) -> bool:
 		"""Track a users nose to see if they nod yes or no"""
-		self.set_ui_text(_("Nod to confirm"), self.UI_TEXT)
+		self.set_ui_text(_("Nod to confirm"), self.UI_TEXT, flush=False)
 		self.set_ui_text(_("Shake your head to abort"), self.UI_SUBTEXT)
 
 		# Stores relative distance between the 2 eyes in the last frame
@@ -27,25 +33,40 @@ class nod(RubberStamp):
 		# Contains booleans recording successful nods and their directions
 		recorded_nods = {"x": [], "y": []}
 
+		# Face to look for landmarks in, starts at the face compare.py just matched
+		face = self.face
+		# Landmarks of that face, used to follow it without running the detector again
+		face_landmarks = self.landmarks
+		# Where the landmarks sit relative to the center of the face rectangle
+		anchor = _anchor(face, face_landmarks) if face and face_landmarks else (0.0, 0.0)
+
 		starttime = time.time()
 
 		# Keep running the loop while we have not hit timeout yet
 		while time.time() < starttime + self.options["timeout"]:
-			# Read a frame from the camera
-			ret, frame = self.video_capture.read_frame()
+			# Read a frame from the camera, scaled and rotated like compare.py did, skipping dark ones
+			prepared = self.read_frame()
+			if prepared is None:
+				continue
 
-			# Apply CLAHE to get a better picture
-			frame = self.clahe.apply(frame)
+			gsframe = prepared[1]
+			face_landmarks = self.track(gsframe, face)
 
-			# Detect all faces in the frame
-			face_locations = self.face_detector(frame, 1)
+			# Detect the face again in the full frame if it was lost
+			if face_landmarks is None:
+				face_locations = self.face_detector(gsframe, 1)
 
-			# Only continue if exactly 1 face is visible in the frame
-			if len(face_locations) != 1:
-				continue
+				# Only continue if exactly 1 face is visible in the frame
+				if len(face_locations) != 1:
+					face = None
+					continue
 
-			# Get the position of the eyes and tip of the nose
-			face_landmarks = self.pose_predictor(frame, face_locations[0])
+				face = face_locations[0]
+				face_landmarks = self.pose_predictor(gsframe, face)
+				anchor = _anchor(face, face_landmarks)
+			else:
+				# Place the rectangle for the next frame around where the face is now
+				face = _follow(face, face_landmarks, anchor)
 
 			# Calculate the relative distance between the 2 eyes
 			reldist = face_landmarks.part(0).x - face_landmarks.part(2).x
@@ -80,10 +101,10 @@ class nod(RubberStamp):
 				if len(recorded_nods[axis]) >= self.options["min_directions"]:
 					# If nodded yes, show confirmation in ui
 					if (axis == "y"):
-						self.set_ui_text(_("Confirmed authentication"), self.UI_TEXT)
+						self.set_ui_text(_("Confirmed authentication"), self.UI_TEXT, flush=False)
 					# If shaken no, show abort message
 					else:
-						self.set_ui_text(_("Aborted authentication"), self.UI_TEXT)
+						self.set_ui_text(_("Aborted authentication"), self.UI_TEXT, flush=False)
 
 					# Remove subtext
 					self.set_ui_text("", self.UI_SUBTEXT)
@@ -98,3 +119,51 @@ class nod(RubberStamp):
 
 		# We've fallen out of the loop, so timeout has been hit
 		return not self.options["failsafe"]
+
+	def track(self, gsframe: Any, face: FaceRectangle | None) -> LandmarkSet | None:
+		"""Find the landmarks of the followed face within its rectangle only, None if the face was lost"""
+		if face is None:
+			return None
+
+		face_landmarks = self.pose_predictor(gsframe, face)
+
+		# The face is considered lost if the eyes don't fit the face rectangle anymore
+		width = face.right() - face.left()
+		reldist = face_landmarks.part(0).x - face_landmarks.part(2).x
+		if not MIN_EYE_RATIO * width < abs(reldist) < MAX_EYE_RATIO * width:
+			return None
+
+		# Or if the nose ended up outside of it
+		nose = face_landmarks.part(4)
+		if not (face.left() <= nose.x <= face.right() and face.top() <= nose.y <= face.bottom()):
+			return None
+
+		return face_landmarks
+
+
+def _center(face_landmarks: LandmarkSet) -> tuple[float, float]:
+	"""Average position of the 5 landmarks"""
+	points = [face_landmarks.part(i) for i in range(5)]
+	return sum(point.x for point in points) / 5, sum(point.y for point in points) / 5
+
+
+def _anchor(face: FaceRectangle, face_landmarks: LandmarkSet) -> tuple[float, float]:
+	"""Offset of the landmarks from the center of the face rectangle"""
+	x, y = _center(face_landmarks)
+	return x - (face.left() + face.right()) / 2, y - (face.top() + face.bottom()) / 2
+
+
+def _follow(face: FaceRectangle, face_landmarks: LandmarkSet, anchor: tuple[float, float]) -> FaceRectangle:
+	"""Move the face rectangle so the landmarks sit at the same place in it as when the face was detected"""
+	x, y = _center(face_landmarks)
+	half_width = (face.right() - face.left()) / 2
+	half_height = (face.bottom() - face.top()) / 2
+	center_x = x - anchor[0]
+	center_y = y - anchor[1]
+
+	return FaceRectangle(
+		int(center_y - half_height),
+		int(center_x - half_width),
+		int(center_x + half_width),
+		int(center_y + half_height)
+	)
@@ -0,0 +1,369 @@
+# Typed and validated access to config.ini, compiled once into a cache so it's cheap to load
+from __future__ import annotations
+
+import configparser
+import json
+import os
+import re
+from typing import Any
+
+import paths_factory
+from i18n import _
+from model_store import make_private_dir, write_json
+
+# Version of the compiled form, raise it when the schema or the layout of the cache changes
+COMPILED_VERSION = 1
+
+# Marks that no fallback was given, None is a valid fallback
+_UNSET = object()
+
+
+class Option:
+	"""The type, default and allowed values of a config option"""
+
+	def __init__(
+		self,
+		type: type,
+		default: Any,
+		minimum: float | None = None,
+		maximum: float | None = None,
+		choices: tuple[str, ...] | None = None,
+	) -> None:
+		self.type = type
+		self.default = default
+		self.minimum = minimum
+		self.maximum = maximum
+		self.choices = choices
+
+
+# Every option Howdy knows. The defaults apply when an option is missing from the config,
+# they match how Howdy behaved before the option existed
+SCHEMA: dict[str, dict[str, Option]] = {
+	"core": {
+		"detection_notice": Option(bool, False),
+		"timeout_notice": Option(bool, True),
+		"no_confirmation": Option(bool, False),
+		"suppress_unknown": Option(bool, False),
+		"abort_if_ssh": Option(bool, True),
+		"abort_if_lid_closed": Option(bool, True),
+		"disabled": Option(bool, False),
+		"auth_ui_delay": Option(float, 1.0, minimum=0),
+		"use_cnn": Option(bool, False),
+		"workaround": Option(str, "off", choices=("off", "input", "native")),
+	},
+	"video": {
+		"certainty": Option(float, 3.5, minimum=0, maximum=10),
+		"timeout": Option(int, 4, minimum=0),
+		"fusion_frames": Option(int, 0, minimum=0),
+		"fusion_certainty": Option(float, 3.8, minimum=0, maximum=10),
+		"device_path": Option(str, "none"),
+		"warn_no_device": Option(bool, True),
+		"max_height": Option(float, 320.0, minimum=1),
+		"frame_width": Option(int, -1, minimum=-1),
+		"frame_height": Option(int, -1, minimum=-1),
+		"dark_threshold": Option(float, 60.0, minimum=0, maximum=100),
+		"recording_plugin": Option(str, "opencv", choices=("opencv", "ffmpeg", "pyv4l2")),
+		"device_format": Option(str, "v4l2"),
+		"device_backend": Option(str, "v4l2", choices=("v4l2", "gstreamer", "any")),
+		"force_mjpeg": Option(bool, False),
+		"exposure": Option(int, -1, minimum=-1),
+		"device_fps": Option(int, 0, minimum=-1),
+		"rotate": Option(int, 0, minimum=0, maximum=2),
+	},
+	"enrollment": {
+		"burst_frames": Option(int, 1, minimum=1),
+		"max_encodings": Option(int, 1, minimum=1),
+		"jitters": Option(int, 1, minimum=1),
+		"workers": Option(int, 1, minimum=1),
+	},
+	"snapshots": {
+		"save_failed": Option(bool, False),
+		"save_successful": Option(bool, False),
+		"max_count": Option(int, 0, minimum=0),
+		"max_size": Option(float, 0.0, minimum=0),
+		"max_age": Option(float, 0.0, minimum=0),
+		"format": Option(str, "jpg", choices=("jpg", "webp")),
+		"quality": Option(int, 95, minimum=1, maximum=100),
+	},
+	"rubberstamps": {
+		"enabled": Option(bool, False),
+		"stamp_rules": Option(str, ""),
+	},
+	"debug": {
+		"end_report": Option(bool, False),
+		"verbose_stamps": Option(bool, False),
+		"gtk_stdout": Option(bool, False),
+	},
+}
+
+
+class Settings:
+	"""
+	The parsed config.
+
+	Options in the schema are converted to their type once, when the config is compiled. Values
+	that can't be converted or are out of range are listed in errors and treated as missing,
+	so a typo in the config can't break authentication halfway.
+
+	The get methods work like those of ConfigParser, so code can take either. A missing option
+	gets the given fallback, or its default from the schema if there is none.
+	"""
+
+	def __init__(
+		self,
+		raw: dict[str, dict[str, str]],
+		values: dict[str, dict[str, Any]],
+		errors: list[str],
+		stamp_rules: list[list[Any]],
+		stamp_rule_errors: list[str],
+	) -> None:
+		# The option values as written in the config, by section
+		self.raw = raw
+		# The valid values of options in the schema, converted to their type
+		self.values = values
+		# Problems found when compiling the config
+		self.errors = errors
+		# The parsed rubberstamp rules as [type, timeout, failsafe, options], and the lines that failed to parse
+		self.stamp_rules = stamp_rules
+		self.stamp_rule_errors = stamp_rule_errors
+
+	@classmethod
+	def compile(cls, path: str) -> Settings:
+		"""Parse and validate a config file"""
+		parser = configparser.ConfigParser()
+		errors = []
+
+		try:
+			parser.read(path)
+		except configparser.Error as e:
+			errors.append(_("Could not parse the config: {}").format(e))
+
+		raw = {section: dict(parser.items(section, raw=True)) for section in parser.sections()}
+		values: dict[str, dict[str, Any]] = {}
+
+		for section, options in raw.items():
+			if section not in SCHEMA:
+				errors.append(_("Unknown section [{}]").format(section))
+				continue
+
+			values[section] = {}
+
+			for name, text in options.items():
+				option = SCHEMA[section].get(name)
+
+				if option is None:
+					errors.append(_("Unknown option {section}.{name}").format(section=section, name=name))
+					continue
+
+				try:
+					value = _convert(parser, section, name, option)
+				except ValueError as e:
+					errors.append(_("Invalid value for {section}.{name}: {error}").format(section=section, name=name, error=e))
+					continue
+
+				values[section][name] = value
+
+		stamp_rules, stamp_rule_errors = parse_stamp_rules(raw.get("rubberstamps", {}).get("stamp_rules", ""))
+		return cls(raw, values, errors + stamp_rule_errors, stamp_rules, stamp_rule_errors)
+
+	def to_dict(self) -> dict[str, Any]:
+		"""The compiled form, as stored in the cache"""
+		return {
+			"raw": self.raw,
+			"values": self.values,
+			"errors": self.errors,
+			"stamp_rules": self.stamp_rules,
+			"stamp_rule_errors": self.stamp_rule_errors,
+		}
+
+	@classmethod
+	def from_dict(cls, data: dict[str, Any]) -> Settings:
+		"""Restore a compiled config"""
+		return cls(data["raw"], data["values"], data["errors"], data["stamp_rules"], data["stamp_rule_errors"])
+
+	def sections(self) -> list[str]:
+		"""The sections in the config"""
+		return list(self.raw)
+
+	def has_section(self, section: str) -> bool:
+		return section in self.raw
+
+	def has_option(self, section: str, option: str) -> bool:
+		return option in self.raw.get(section, {})
+
+	def get(self, section: str, option: str, *, fallback: Any = _UNSET) -> Any:
+		"""The option as a string. Options in the schema are only returned if they're valid"""
+		if option in SCHEMA.get(section, {}):
+			if option in self.values.get(section, {}):
+				return _format(self.values[section][option])
+		elif option in self.raw.get(section, {}):
+			return self.raw[section][option]
+
+		return self._missing(section, option, fallback, str)
+
+	def getint(self, section: str, option: str, *, fallback: Any = _UNSET) -> Any:
+		return self._typed(section, option, fallback, int)
+
+	def getfloat(self, section: str, option: str, *, fallback: Any = _UNSET) -> Any:
+		return self._typed(section, option, fallback, float)
+
+	def getboolean(self, section: str, option: str, *, fallback: Any = _UNSET) -> Any:
+		return self._typed(section, option, fallback, bool)
+
+	def _typed(self, section: str, option: str, fallback: Any, type: type) -> Any:
+		"""
+		An option converted to a type. Options outside the schema, and options read as a boolean
+		while the schema has them as something else or the other way around, are parsed from their
+		text like ConfigParser would, instead of converting the compiled value.
+		"""
+		schema = SCHEMA.get(section, {}).get(option)
+
+		if schema is not None and (schema.type is bool) == (type is bool):
+			if option in self.values.get(section, {}):
+				return type(self.values[section][option])
+		elif option in self.raw.get(section, {}):
+			return _parse(section, option, self.raw[section][option], type)
+
+		return self._missing(section, option, fallback, type)
+
+	def _missing(self, section: str, option: str, fallback: Any, type: type) -> Any:
+		"""The value of an option that is not in the config, or invalid"""
+		if fallback is not _UNSET:
+			return fallback
+
+		if option in SCHEMA.get(section, {}):
+			default = SCHEMA[section][option].default
+
+			if type is str:
+				return _format(default)
+			if isinstance(default, bool) != (type is bool):
+				return _parse(section, option, _format(default), type)
+			return type(default)
+
+		raise configparser.NoOptionError(option, section)
+
+
+def load(path: str | None = None) -> Settings:
+	"""
+	Load the config, from the compiled cache if the config file did not change since it was
+	compiled. The cache is keyed by the path, modification time and size of the config.
+	"""
+	path = path or paths_factory.config_file_path()
+
+	try:
+		stat = os.stat(path)
+		key = [path, stat.st_mtime_ns, stat.st_size, COMPILED_VERSION]
+	except OSError:
+		key = None
+
+	cache_path = paths_factory.config_cache_path()
+
+	if key is not None:
+		try:
+			with open(cache_path) as f:
+				data = json.load(f)
+
+			if data.get("key") == key:
+				return Settings.from_dict(data)
+		except (OSError, ValueError, KeyError):
+			pass
+
+	settings = Settings.compile(path)
+
+	# Caching is only an optimization, users without write access just compile every time
+	if key is not None:
+		try:
+			make_private_dir(str(paths_factory.cache_dir_path()))
+			# The cache can always be compiled again, so it skips the syncs
+			write_json(cache_path, dict(settings.to_dict(), key=key), sync=False, mode=0o600)
+		except OSError:
+			pass
+
+	return settings
+
+
+def validate(section: str, name: str, text: str) -> str | None:
+	"""Check a single value against the schema, returns what's wrong with it or None if it fits"""
+	option = SCHEMA.get(section, {}).get(name)
+	if option is None:
+		return None
+
+	parser = configparser.ConfigParser()
+	parser.read_dict({section: {name: text}})
+
+	try:
+		_convert(parser, section, name, option)
+	except ValueError as e:
+		return str(e)
+
+	return None
+
+
+def parse_stamp_rules(raw_rules: str) -> tuple[list[list[Any]], list[str]]:
+	"""Parse the stamp_rules option, returns [type, timeout, failsafe, options] for every valid rule and errors for the others"""
+	rules = []
+	errors = []
+
+	# Go through the rules one by one
+	for rule in raw_rules.split("\n"):
+		rule = rule.strip()
+
+		if len(rule) <= 1:
+			continue
+
+		# Parse the rule with regex
+		regex_result = re.search(r"^(\w+)\s+([\w\.]+)\s+([a-z]+)(.*)?$", rule, re.IGNORECASE)
+
+		# Error out if the regex did not match (invalid line)
+		if not regex_result:
+			errors.append(_("Error parsing rubberstamp rule: {}").format(rule))
+			continue
+
+		try:
+			timeout = float(re.sub("[a-zA-Z]", "", regex_result.group(2)))
+		except ValueError:
+			errors.append(_("Error parsing rubberstamp rule: {}").format(rule))
+			continue
+
+		rules.append([regex_result.group(1), timeout, regex_result.group(3) != "faildeadly", regex_result.group(4).split()])
+
+	return rules, errors
+
+
+def _convert(parser: configparser.ConfigParser, section: str, name: str, option: Option) -> Any:
+	"""Read an option as its type and check it against the schema, raises ValueError if it doesn't fit"""
+	if option.type is bool:
+		return parser.getboolean(section, name)
+
+	if option.type is int:
+		value = parser.getint(section, name)
+	elif option.type is float:
+		value = parser.getfloat(section, name)
+	else:
+		value = parser.get(section, name)
+
+	if option.choices is not None and value not in option.choices:
+		raise ValueError(_("{value} is not one of {choices}").format(value=value, choices=", ".join(option.choices)))
+
+	if option.minimum is not None and value < option.minimum:
+		raise ValueError(_("{value} is below the minimum of {minimum}").format(value=value, minimum=option.minimum))
+
+	if option.maximum is not None and value > option.maximum:
+		raise ValueError(_("{value} is above the maximum of {maximum}").format(value=value, maximum=option.maximum))
+
+	return value
+
+
+def _parse(section: str, name: str, text: str, type: type) -> Any:
+	"""Parse an option from its text the way ConfigParser does, raises ValueError if it doesn't fit the type"""
+	parser = configparser.ConfigParser()
+	parser.read_dict({section: {name: text}})
+	return _convert(parser, section, name, Option(type, None))
+
+
+def _format(value: Any) -> str:
+	"""Write a value the way it would be written in the config"""
+	if isinstance(value, bool):
+		return "true" if value else "false"
+
+	return str(value)
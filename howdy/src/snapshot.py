@@ -1,23 +1,223 @@
 # Create and save snapshots of auth attempts
+# OpenCV and numpy are only imported where images are handled, so listing snapshots stays fast
 from __future__ import annotations
 
+import configparser
+import fcntl
+import heapq
+import json
 import os
+import time
 from datetime import datetime, timezone
-
-# Import modules
-import cv2
-import numpy as np
+from typing import Any
 
 import paths_factory
+import settings
+
+# Name of the file listing all stored snapshots, one JSON object per line
+INDEX_FILENAME = "index.jsonl"
+
+
+class FrameSelector:
+	"""
+	Keeps downscaled copies of the most useful frames of an attempt to build a snapshot from.
+
+	Frames are offered with a score, lower is better. Only the best few are kept, and frames
+	that can't beat them are never copied, so memory use doesn't depend on the camera resolution.
+	"""
+
+	def __init__(self, count: int = 3, max_height: float = 320.0) -> None:
+		self.count = count
+		self.max_height = max_height
+
+		# Heap of (-score, order, frame), so the worst kept frame is always on top
+		self._kept: list[tuple[float, int, Any]] = []
+		self._order = 0
+
+	def offer(self, frame: Any, score: float) -> None:
+		"""Keep a copy of the frame if it's better than one of the frames kept so far"""
+		self._order += 1
+
+		if len(self._kept) >= self.count and -self._kept[0][0] <= score:
+			return
+
+		if frame.shape[0] > self.max_height:
+			import cv2
+
+			factor = self.max_height / frame.shape[0]
+			small = cv2.resize(frame, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+		else:
+			small = frame.copy()
+
+		if len(self._kept) < self.count:
+			heapq.heappush(self._kept, (-score, self._order, small))
+		else:
+			heapq.heapreplace(self._kept, (-score, self._order, small))
+
+	def frames(self) -> list[Any]:
+		"""The kept frames in the order they were captured"""
+		return [frame for _, _, frame in sorted(self._kept, key=lambda kept: kept[1])]
+
+
+class SnapshotStore:
+	"""
+	Stores snapshots in the snapshot folder and keeps it within the configured limits.
+
+	Every stored snapshot gets a line in an index file, so snapshots can be listed and
+	pruned without listing and stat'ing the whole folder.
+	"""
+
+	def __init__(self, config: configparser.ConfigParser | settings.Settings | None = None) -> None:
+		if config is None:
+			config = settings.load()
+
+		# Limits, 0 disables a limit
+		self.max_count = config.getint("snapshots", "max_count", fallback=0)
+		self.max_bytes = int(config.getfloat("snapshots", "max_size", fallback=0) * 1024 * 1024)
+		self.max_age = config.getfloat("snapshots", "max_age", fallback=0) * 24 * 60 * 60
+
+		# Image encoding
+		self.format = config.get("snapshots", "format", fallback="jpg").lower()
+		if self.format not in ("jpg", "webp"):
+			self.format = "jpg"
+		self.quality = config.getint("snapshots", "quality", fallback=95)
+
+		self.dir_path = str(paths_factory.snapshots_dir_path())
+		self.index_path = os.path.join(self.dir_path, INDEX_FILENAME)
+
+	def save(self, image: Any, label: str = "") -> str:
+		"""Encode and store an image, returns the path it was saved to"""
+		import cv2
+
+		quality_flag = cv2.IMWRITE_WEBP_QUALITY if self.format == "webp" else cv2.IMWRITE_JPEG_QUALITY
+		success, buffer = cv2.imencode("." + self.format, image, [quality_flag, self.quality])
+		if not success:
+			raise ValueError("Could not encode snapshot as " + self.format)
+
+		os.makedirs(self.dir_path, exist_ok=True)
+
+		# Name the file after the current time, adding a counter in the rare case that name is taken
+		now = datetime.now(timezone.utc)
+		base = now.strftime("%Y%m%dT%H%M%S.%f")
+		counter = 0
+		while True:
+			filename = base + ("-" + str(counter) if counter else "") + "." + self.format
+			filepath = os.path.join(self.dir_path, filename)
+
+			try:
+				fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+				break
+			except FileExistsError:
+				counter += 1
+
+		with os.fdopen(fd, "wb") as f:
+			f.write(buffer.tobytes())
+
+		entry = {"file": filename, "time": round(now.timestamp(), 3), "size": len(buffer), "label": label}
 
+		with self._locked_index() as index:
+			index.seek(0, os.SEEK_END)
+			index.write(json.dumps(entry) + "\n")
+
+		self.prune()
+		return filepath
 
-def generate(frames: list[np.ndarray], text_lines: list[str]) -> str | None:
-	"""Generate a snapshot from given frames"""
+	def entries(self) -> list[dict[str, Any]]:
+		"""All stored snapshots, oldest first"""
+		with self._locked_index() as index:
+			return self._read(index)
+
+	def page(self, number: int, size: int = 20) -> list[dict[str, Any]]:
+		"""A page of stored snapshots, newest first. Page numbers start at 1"""
+		entries = self.entries()
+		entries.reverse()
+		return entries[(number - 1) * size:number * size]
+
+	def prune(self) -> None:
+		"""Delete the oldest snapshots until the store is within its limits"""
+		if not (self.max_count or self.max_bytes or self.max_age):
+			return
+
+		with self._locked_index() as index:
+			entries = self._read(index)
+			total_bytes = sum(entry["size"] for entry in entries)
+			oldest_allowed = time.time() - self.max_age
+			removed = 0
+
+			for entry in entries:
+				remaining = len(entries) - removed
+				if not (
+					(self.max_count and remaining > self.max_count)
+					or (self.max_bytes and total_bytes > self.max_bytes)
+					or (self.max_age and entry["time"] < oldest_allowed)
+				):
+					break
+
+				try:
+					os.remove(os.path.join(self.dir_path, entry["file"]))
+				except FileNotFoundError:
+					pass
+
+				total_bytes -= entry["size"]
+				removed += 1
+
+			if removed:
+				index.seek(0)
+				index.truncate()
+				index.writelines(json.dumps(entry) + "\n" for entry in entries[removed:])
+
+	def _locked_index(self) -> Any:
+		"""Open the index file with an exclusive lock, creating it from the folder contents if missing"""
+		os.makedirs(self.dir_path, exist_ok=True)
+
+		fd = os.open(self.index_path, os.O_RDWR | os.O_CREAT, 0o644)
+		index = os.fdopen(fd, "r+")
+		fcntl.flock(fd, fcntl.LOCK_EX)
+
+		# Snapshots from before the index existed are added once
+		if os.fstat(fd).st_size == 0:
+			index.writelines(json.dumps(entry) + "\n" for entry in self._scan())
+			index.flush()
+
+		return index
+
+	def _read(self, index: Any) -> list[dict[str, Any]]:
+		"""Parse all entries in the index, skipping lines that were cut off"""
+		index.seek(0)
+		entries = []
+
+		for line in index:
+			try:
+				entries.append(json.loads(line))
+			except ValueError:
+				continue
+
+		return entries
+
+	def _scan(self) -> list[dict[str, Any]]:
+		"""Build index entries for the snapshots already in the folder"""
+		entries = []
+
+		for filename in os.listdir(self.dir_path):
+			if filename == INDEX_FILENAME or not filename.endswith((".jpg", ".webp")):
+				continue
+
+			stat = os.stat(os.path.join(self.dir_path, filename))
+			entries.append({"file": filename, "time": round(stat.st_mtime, 3), "size": stat.st_size, "label": ""})
+
+		return sorted(entries, key=lambda entry: entry["time"])
+
+
+def generate(frames: list[Any], text_lines: list[str], config: configparser.ConfigParser | None = None) -> str | None:
+	"""Generate a snapshot from given frames and store it, limits and encoding are read from the config"""
 
 	# Don't execute if no frames were given
 	if len(frames) == 0:
 		return
 
+	import cv2
+	import numpy as np
+
 	# Get frame dimensions
 	frame_height, frame_width, cc = frames[0].shape
 	# Spread the given frames out horizontally
@@ -30,8 +230,8 @@ def generate(frames: list[np.ndarray], text_lines: list[str]) -> str | None:
 	# Add a gray square at the bottom of the image
 	snap = cv2.copyMakeBorder(snap, 0, len(text_lines) * 20 + 40, 0, 0, cv2.BORDER_CONSTANT, value=pad_color)
 
-	# Add the Howdy logo if there's space to do so
-	if len(frames) > 1:
+	# Add the Howdy logo if there's space to do so, frames can be small now that they're downscaled
+	if len(frames) > 1 and frame_width * len(frames) >= 240:
 		# Load the logo from file
 		logo = cv2.imread(paths_factory.logo_path())
 		# Calculate the position of the logo
@@ -51,15 +251,5 @@ def generate(frames: list[np.ndarray], text_lines: list[str]) -> str | None:
 
 		line_number += 1
 
-	# Made sure a snapshot folder exist
-	if not os.path.exists(paths_factory.snapshots_dir_path()):
-		os.makedirs(paths_factory.snapshots_dir_path())
-
-	# Generate a filename based on the current time
-	filename = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.jpg")
-	filepath = paths_factory.snapshot_path(filename)
-	# Write the image to that file
-	cv2.imwrite(filepath, snap)
-
-	# Return the saved file location
-	return filepath
+	# Store the image and return the saved file location
+	return SnapshotStore(config).save(snap, text_lines[0] if text_lines else "")
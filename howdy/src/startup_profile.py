@@ -0,0 +1,94 @@
+# Break down where the howdy command spends its startup, for the --profile-startup flag
+from __future__ import annotations
+
+import subprocess
+import sys
+import time
+
+from i18n import _
+
+# Time the imports before a command starts should stay under, in seconds
+STARTUP_BUDGET = 0.05
+# Amount of modules listed in the breakdown
+TOP_MODULES = 12
+
+
+class ImportTiming:
+	"""A single line of -X importtime output"""
+
+	def __init__(self, name: str, depth: int, self_time: float, cumulative: float) -> None:
+		self.name = name
+		# 0 for modules imported by the script itself, higher for modules they imported
+		self.depth = depth
+		# Seconds spent importing the module, without and with the modules it imported
+		self.self_time = self_time
+		self.cumulative = cumulative
+
+
+def parse_line(line: str) -> ImportTiming | None:
+	"""Parse a line like "import time:   120 |   4410 |   argparse", None if it isn't one"""
+	if not line.startswith("import time:"):
+		return None
+
+	parts = line[len("import time:"):].split("|")
+	if len(parts) != 3:
+		return None
+
+	try:
+		self_time, cumulative = int(parts[0]), int(parts[1])
+	except ValueError:
+		# The header line has no numbers
+		return None
+
+	# Nested imports are indented by 2 spaces per level, after the single separating space
+	name = parts[2][1:]
+	depth = (len(name) - len(name.lstrip(" "))) // 2
+
+	return ImportTiming(name.strip(), depth, self_time / 1e6, cumulative / 1e6)
+
+
+def run(script: str, arguments: list[str]) -> int:
+	"""Run the CLI again with import timing enabled and print where its startup time went"""
+	start = time.perf_counter()
+	process = subprocess.run([sys.executable, "-X", "importtime", script] + arguments, stderr=subprocess.PIPE, text=True)
+	run_time = time.perf_counter() - start
+
+	timings = []
+
+	# Pass on everything the command itself wrote to stderr
+	for line in process.stderr.splitlines():
+		timing = parse_line(line)
+		if timing is not None:
+			timings.append(timing)
+		elif not line.startswith("import time:"):
+			print(line, file=sys.stderr)
+
+	report(timings, run_time)
+	return process.returncode
+
+
+def report(timings: list[ImportTiming], run_time: float) -> None:
+	"""Print the import times of the CLI and the command it ran"""
+	top_level = [timing for timing in timings if timing.depth == 0]
+
+	# Command modules run on import, their import time is the run time of the command
+	command = [timing for timing in top_level if timing.name.startswith("cli.")]
+	startup = sum(timing.cumulative for timing in top_level if timing not in command)
+
+	print()
+	print(_("Startup profile"))
+	print(_("  Imports before the command: {time}ms (budget {budget}ms)").format(
+		time=round(startup * 1000, 1), budget=round(STARTUP_BUDGET * 1000)))
+	if startup > STARTUP_BUDGET:
+		print(_("  Over budget by {}ms").format(round((startup - STARTUP_BUDGET) * 1000, 1)))
+	for timing in command:
+		print(_("  Importing and running {name}: {time}ms").format(name=timing.name, time=round(timing.cumulative * 1000, 1)))
+	print(_("  Total run time: {}ms").format(round(run_time * 1000, 1)))
+
+	print("\n\033[1;29m" + _("Slowest imports by the script itself") + "\033[0m")
+	for timing in sorted(top_level, key=lambda timing: -timing.cumulative)[:TOP_MODULES]:
+		print("  {:>8.1f}ms  {}".format(timing.cumulative * 1000, timing.name))
+
+	print("\n\033[1;29m" + _("Slowest modules, excluding what they import") + "\033[0m")
+	for timing in sorted(timings, key=lambda timing: -timing.self_time)[:TOP_MODULES]:
+		print("  {:>8.1f}ms  {}".format(timing.self_time * 1000, timing.name))
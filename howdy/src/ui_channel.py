@@ -0,0 +1,111 @@
+# Sends status messages to the auth ui
+from __future__ import annotations
+
+import subprocess
+import threading
+import time
+
+
+class UIChannel:
+	"""
+	Writes M (message) and S (subtext) lines to the stdin of howdy-gtk.
+
+	Messages are queued and written together on flush, followed by a single padding line
+	that forces them through any buffers. Only the latest text of every type is kept, so a
+	message that is replaced before the next flush is never written, and a text that is
+	already shown in the ui is not written again.
+
+	If a max rate is given, queued messages are flushed from a background thread at most
+	that many times a second, so callers in a hot loop never wait on the pipe.
+	"""
+
+	def __init__(self, process: subprocess.Popen | None, max_rate: float = 0) -> None:
+		self.process = process
+		# The latest queued text, by message type
+		self.pending: dict[str, str] = {}
+		# The text last written to the ui, by message type
+		self.sent: dict[str, str] = {}
+
+		# Guards the message dicts, held only briefly so send stays cheap
+		self._lock = threading.Lock()
+		# Held while writing to the pipe
+		self._write_lock = threading.Lock()
+		self._wake = threading.Event()
+		self._interval = 1 / max_rate if max_rate > 0 else 0
+		self._last_write = 0.0
+		self._writer: threading.Thread | None = None
+
+		# Only start writing in the background if there's a ui to write to
+		if process:
+			self._start_writer()
+
+	def attach(self, process: subprocess.Popen) -> None:
+		"""Start writing to a ui that was started later, it's sent the latest messages right away"""
+		with self._lock:
+			self.process = process
+
+			# Send everything the ui would have been showing by now
+			for type, message in self.sent.items():
+				self.pending.setdefault(type, message)
+			self.sent.clear()
+
+		self._start_writer()
+		self._wake.set()
+
+	def send(self, type: str, message: str) -> None:
+		"""Queue a message for the next flush"""
+		with self._lock:
+			if type not in self.pending and self.sent.get(type) == message:
+				return
+
+			self.pending[type] = message
+
+		self._wake.set()
+
+	def flush(self) -> None:
+		"""Write all queued messages at once"""
+		# Only one flush writes at a time, so lines from two flushes are never mixed or reordered
+		with self._write_lock:
+			with self._lock:
+				# Leave out messages that changed back to what the ui already shows
+				messages = {type: message for type, message in self.pending.items() if self.sent.get(type) != message}
+				self.pending.clear()
+
+				if not messages:
+					return
+
+				self.sent.update(messages)
+				self._last_write = time.time()
+				process = self.process
+
+			# Format the messages so the ui can parse them, it reads per line
+			lines = "".join(type + "=" + message + " \n" for type, message in messages.items())
+			lines += "P=_PADDING \n"
+
+			# The pipe is written without holding the lock, so send never waits on a slow ui
+			try:
+				# Make sure the ui is still running before writing into the pipe
+				if process and process.poll() is None:
+					process.stdin.write(lines.encode("utf-8"))
+					process.stdin.flush()
+			except (OSError, ValueError):
+				pass
+
+	def _start_writer(self) -> None:
+		"""Start the background writer if there's a max rate"""
+		if self._interval and self._writer is None:
+			self._writer = threading.Thread(target=self._run, daemon=True)
+			self._writer.start()
+
+	def _run(self) -> None:
+		"""Flush queued messages in the background, keeping to the max rate"""
+		while True:
+			self._wake.wait()
+			self._wake.clear()
+
+			# Messages queued while waiting are merged into this write
+			delay = self._last_write + self._interval - time.time()
+			if delay > 0:
+				time.sleep(delay)
+
+			self.flush()